@@ -0,0 +1,4 @@
+"""The PCSF pipeline scripts.  The scripts can be run from the command line
+or imported, and pcsf.api provides functions that pass the scores, prizes,
+networks, and forest summaries between stages in memory.
+"""
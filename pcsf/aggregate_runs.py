@@ -0,0 +1,208 @@
+import sys, glob
+from array import array
+import numpy as np
+from argparse import ArgumentParser
+import instrumentation as ins
+
+__author__ = "Anthony Gitter"
+
+def Main(argList):
+    """Parse the arguments, which either come from the command line or a list
+    provided by the Python code calling this function
+    """
+    parser = CreateParser()
+    options = parser.parse_args(argList)
+
+    ins.Start("aggregate_runs", options.profileout, argList)
+
+    realPrefix = options.real
+    runPrefixes = sorted(set(FindRuns(options.runs, options.cyto28)) - set([realPrefix]))
+    if len(runPrefixes) == 0:
+        raise RuntimeError("No summary files match %s" % options.runs)
+    print "%d runs found" % len(runPrefixes)
+
+    for elementType in ["edge", "node"]:
+        ins.BeginPhase("parse")
+        realFile = SummaryFile(realPrefix, elementType, options.cyto28)
+        realNames, realFreqs = LoadFrequencies(realFile)
+        runFiles = [SummaryFile(prefix, elementType, options.cyto28) for prefix in runPrefixes]
+        elementNames, freqMatrix = FrequencyMatrix(runFiles, realNames)
+        print "Loaded the %d x %d run by %s frequency matrix" % (freqMatrix.shape[0], freqMatrix.shape[1], elementType)
+        ins.Count("%s_frequencies" % elementType, freqMatrix.nnz)
+
+        if options.matrix:
+            np.savez_compressed("%s_%sRuns.npz" % (options.outfile, elementType), runs=np.array(runPrefixes), \
+                names=np.array(elementNames), data=freqMatrix.data, indices=freqMatrix.indices, \
+                indptr=freqMatrix.indptr, shape=np.array(freqMatrix.shape))
+
+        # The real elements are the first columns of the matrix
+        ins.BeginPhase("compute")
+        realMatrix = freqMatrix.tocsc()[:, :len(realNames)]
+        if options.mode == "pvalue":
+            scores = EmpiricalPValues(realFreqs, realMatrix)
+            scoreName = "PValue"
+        else:
+            scores = BootstrapSupport(realMatrix)
+            scoreName = "Support"
+        ins.BeginPhase("write")
+        WriteAggregate("%s_%sAggregate.txt" % (options.outfile, elementType), elementType, realNames, realFreqs, \
+            MeanFrequencies(realMatrix), scores, scoreName)
+
+    ins.Finish()
+
+
+def FindRuns(pattern, cyto28=False):
+    """Find the summary prefixes of the runs, which are the filenames of the
+    summary edge annotation files that match the pattern without the suffix
+
+    Return: a list of summary prefixes
+    """
+    suffix = SummaryFile("", "edge", cyto28)
+    return [edgeFile[:-len(suffix)] for edgeFile in glob.glob(pattern + suffix)]
+
+
+def SummaryFile(prefix, elementType, cyto28=False):
+    """The summarize_sif.py node or edge annotation file with this prefix"""
+    if cyto28:
+        return prefix + {"node": "_nodeFreq.noa", "edge": "_edgeFreq.eda"}[elementType]
+    return prefix + {"node": "_nodeAnnotation.txt", "edge": "_edgeAnnotation.txt"}[elementType]
+
+
+def ParseFrequencies(annotationFile):
+    """Iterate over the (name, frequency) pairs in a node or edge annotation
+    file written by summarize_sif.py in the Cytoscape 3 or 2.8 format
+    """
+    with open(annotationFile) as f:
+        # Skip the header
+        f.readline()
+        for line in f:
+            if " = " in line:
+                name, freq = line.rstrip("\n").rsplit(" = ", 1)
+            else:
+                name, freq = line.rstrip("\n").split("\t")[:2]
+            yield name, float(freq)
+
+
+def LoadFrequencies(annotationFile):
+    """Load the node or edge frequencies of a single run
+
+    Return: a list of names and a numpy array of frequencies
+    """
+    names = []
+    freqs = []
+    for name, freq in ParseFrequencies(annotationFile):
+        names.append(name)
+        freqs.append(freq)
+    return names, np.array(freqs)
+
+
+def FrequencyMatrix(annotationFiles, initialNames=[]):
+    """Stream the node or edge annotation files of many runs into a sparse
+    matrix with one row per run and one column per node or edge.  Only the
+    interned column ids and frequencies of each file are kept while the files
+    are read.  The initialNames are the first columns so that the real run's
+    nodes or edges can be selected, and nodes or edges that are missing from
+    a run are not stored and have a frequency of 0.  Requires scipy.
+
+    Return: a list of the column names and a float32 scipy CSR matrix
+    """
+    from scipy import sparse
+    columnIds = dict((name, columnId) for columnId, name in enumerate(initialNames))
+    names = list(initialNames)
+    rowPtr = [0]
+    columns = array("l")
+    freqs = array("f")
+    for annotationFile in annotationFiles:
+        for name, freq in ParseFrequencies(annotationFile):
+            columnId = columnIds.get(name)
+            if columnId is None:
+                columnId = len(names)
+                columnIds[name] = columnId
+                names.append(name)
+            columns.append(columnId)
+            freqs.append(freq)
+        rowPtr.append(len(columns))
+
+    freqMatrix = sparse.csr_matrix((np.frombuffer(freqs, dtype=np.float32), np.frombuffer(columns, dtype=np.int_), \
+        np.array(rowPtr)), shape=(len(annotationFiles), len(names)))
+    return names, freqMatrix
+
+
+def ColumnIndices(runMatrix):
+    """The column of each stored frequency in a sparse CSC matrix
+
+    Return: a numpy array with one column index per stored value
+    """
+    return np.repeat(np.arange(runMatrix.shape[1]), np.diff(runMatrix.indptr))
+
+
+def EmpiricalPValues(realFreqs, runMatrix):
+    """Compute the empirical p-value of each real frequency as
+    (1 + the number of runs with a frequency at least as large) / (1 + runs).
+    The frequencies are compared after rounding to float32 because the
+    annotation files only contain 6 decimal places.  The runs are counted
+    column-wise from the stored frequencies of a sparse run matrix.
+
+    Return: a numpy array of p-values
+    """
+    runMatrix = runMatrix.tocsc()
+    realFreqs = realFreqs.astype(np.float32)
+    columns = ColumnIndices(runMatrix)
+    atLeast = np.bincount(columns[runMatrix.data >= realFreqs[columns]], minlength=runMatrix.shape[1])
+    # The runs that do not store a frequency have a frequency of 0
+    missing = runMatrix.shape[0] - np.diff(runMatrix.indptr)
+    atLeast += np.where(realFreqs <= 0, missing, 0)
+    return (1.0 + atLeast) / (1.0 + runMatrix.shape[0])
+
+
+def BootstrapSupport(runMatrix):
+    """Compute the fraction of runs that contain each node or edge column-wise
+    from the stored frequencies of a sparse run matrix
+
+    Return: a numpy array of the support values
+    """
+    runMatrix = runMatrix.tocsc()
+    columns = ColumnIndices(runMatrix)
+    contain = np.bincount(columns[runMatrix.data > 0], minlength=runMatrix.shape[1])
+    return contain / float(runMatrix.shape[0])
+
+
+def MeanFrequencies(runMatrix):
+    """Compute the mean frequency of each node or edge across the runs
+    column-wise from the stored frequencies of a sparse run matrix
+
+    Return: a numpy array of the mean frequencies
+    """
+    runMatrix = runMatrix.tocsc()
+    totals = np.bincount(ColumnIndices(runMatrix), weights=runMatrix.data, minlength=runMatrix.shape[1])
+    return totals / runMatrix.shape[0]
+
+
+def WriteAggregate(outFile, elementType, names, realFreqs, meanFreqs, scores, scoreName):
+    """Write a Cytoscape attribute table with the real frequency, mean
+    frequency across runs, and p-value or support of each node or edge
+    """
+    with open(outFile, "w") as f:
+        f.write("%s\tRealFreq\tMeanRunFreq\t%s\n" % ({"node": "Protein", "edge": "Interaction"}[elementType], scoreName))
+        for name, realFreq, meanFreq, score in zip(names, realFreqs, meanFreqs, scores):
+            f.write("%s\t%f\t%f\t%f\n" % (name, realFreq, meanFreq, score))
+
+
+def CreateParser():
+    """Setup the option parser"""
+    parser = ArgumentParser(description="Compare the summarized forests of the real data to the summaries of permuted, bootstrapped, or randomized network runs.")
+    parser.add_argument("--real", type=str, dest="real", help="The path and filename prefix of the real run's summarize_sif.py output (the outfile used for summarize_sif.py).", default=None, required=True)
+    parser.add_argument("--runs", type=str, dest="runs", help="A filename pattern that matches the summarize_sif.py output prefixes of the other runs, such as 'results/permuted*/*_summary'.", default=None, required=True)
+    parser.add_argument("--outfile", type=str, dest="outfile", help="The path and filename prefix of the output.  Does not include an extension.", default=None, required=True)
+    parser.add_argument("--mode", type=str, dest="mode", choices=["pvalue", "support"], help="Compute empirical p-values of the real frequencies for permuted or randomized runs or the fraction of bootstrapped runs that contain each node and edge (default pvalue).", default="pvalue", required=False)
+    parser.add_argument("--matrix", action="store_true", dest="matrix", help="This flag writes the sparse run by node and run by edge frequency matrices as .npz files with the run prefixes, column names, and the data, indices, indptr, and shape of the scipy CSR matrix.", default=False)
+    parser.add_argument("--cyto28", action="store_true", dest="cyto28", help="This flag reads summaries in the Cytoscape 2.8 format.", default=False)
+    ins.AddProfileArgument(parser)
+    return parser
+
+
+if __name__ == "__main__":
+    """Use the command line arguments to setup the options
+    (the same as the default ArgumentParser behavior)
+    """
+    Main(sys.argv[1:])
@@ -0,0 +1,178 @@
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+import copy_streams as cs
+import generate_prizes as gp
+import generate_randomized_networks as grn
+import permute_proteins as pp
+import subsample_peptides as sp
+import summarize_sif as ss
+
+__author__ = "Anthony Gitter"
+
+# A background network stored as int32 node ids into the nodeNames array and
+# the undirected and directed grn.Subgraph edge arrays
+Network = namedtuple("Network", ["nodeNames", "undirected", "directed"])
+
+def LoadScores(firstFile, prevFile, cacheDir=None):
+    """Load the TPS first and previous scores files and compute the prize of
+    each peptide
+
+    Return: a data frame with the scores and prize of each peptide
+    """
+    return gp.LoadScores(firstFile, prevFile, cacheDir)
+
+
+def LoadPeptideMap(mapFile, cacheDir=None):
+    """Load the peptide-protein map file
+
+    Return: the gp.PeptideMapArrays
+    """
+    return gp.LoadPeptideMapArrays(mapFile, cacheDir)
+
+
+def ProteinPrizes(scores, peptideMap):
+    """Compute the protein prizes from the peptide scores, which gives the
+    same prizes as generate_prizes.py
+
+    Return: a pandas Series of prizes indexed by the sorted proteins
+    """
+    proteins, prizes = gp.VectorizedProteinPrizes(scores, peptideMap)
+    return PrizeSeries(proteins, prizes)
+
+
+def BootstrapPrizes(scores, peptideMap, fraction, copyIndices, seed):
+    """Compute the protein prizes of subsampled copies of the peptide scores.
+    Each copy has its own random stream derived from the seed and copy index,
+    so the prizes match subsample_peptides.py with the same seed and
+    independent streams.
+
+    Return: a list with a pandas Series of prizes for each copy
+    """
+    numRows = len(scores)
+    subsampledLen = sp.SubsampledLength(numRows, fraction)
+    subsamples = np.array([sp.SubsampleRows(seed, copyIndex, numRows, subsampledLen) for copyIndex in copyIndices])
+    prizeMatrix = gp.SubsampledPrizeMatrix(scores, peptideMap, subsamples)
+    return [PrizeSeries(*gp.PresentPrizes(peptideMap.proteins, copyPrizes)) for copyPrizes in prizeMatrix]
+
+
+def PermutedPrizes(scores, peptideMap, copyIndices, seed):
+    """Compute the protein prizes of copies of the peptide-protein map with
+    permuted protein groups.  Each copy has its own random stream derived from
+    the seed and copy index, so the prizes match permute_proteins.py with the
+    same seed and independent streams.
+
+    Return: a list with a pandas Series of prizes for each copy
+    """
+    numLines = len(peptideMap.line_peptides)
+    permutations = np.array([pp.PermuteLines(seed, copyIndex, numLines) for copyIndex in copyIndices])
+    linePrizes = gp.LinePrizes(scores, peptideMap)
+    incidence = gp.ProteinIncidence(peptideMap)
+    prizeMatrix = gp.PermutedPrizeMatrix(linePrizes, incidence, permutations)
+    return [PrizeSeries(*gp.PresentPrizes(peptideMap.proteins, copyPrizes)) for copyPrizes in prizeMatrix]
+
+
+def PrizeSeries(proteins, prizes):
+    """Return: a pandas Series of prizes indexed by protein"""
+    return pd.Series(prizes, index=proteins, name="prize")
+
+
+def WritePrizes(prizes, outFile):
+    """Write a prize Series in the format of generate_prizes.py"""
+    gp.WritePrizes(outFile, list(prizes.index), prizes.values)
+
+
+def LoadNetwork(networkFile, chunkSize=grn.DEFAULT_CHUNK_SIZE):
+    """Load a background network in the tsv format
+
+    Return: a Network
+    """
+    return Network(*grn.parse_network(networkFile, chunkSize))
+
+
+def RandomizeNetwork(network, seed, copyIndex, backend="birewire"):
+    """Randomize the edges of a network with degree-preserving edge switches
+    using the copy's own random stream, which gives the same copy as
+    generate_randomized_networks.py with the same seed
+
+    Return: the randomized Network
+    """
+    rng = cs.CopyRandomState(seed, copyIndex)
+    undirected, directed = grn.randomize(network.nodeNames, network.undirected, network.directed, backend, rng)
+    return Network(network.nodeNames, undirected, directed)
+
+
+def NetworkFrame(network):
+    """Return: a data frame with the id1, id2, weight, and orientation of each
+    edge, which has the same columns as the network files
+    """
+    frames = []
+    for subgraph, orientation in [(network.undirected, "U"), (network.directed, "D")]:
+        frames.append(pd.DataFrame({"id1": network.nodeNames[subgraph.edges[:, 0]], \
+            "id2": network.nodeNames[subgraph.edges[:, 1]], "weight": subgraph.weights, \
+            "orientation": orientation}, columns=["id1", "id2", "weight", "orientation"]))
+    return pd.concat(frames, ignore_index=True)
+
+
+def WriteNetwork(network, networkFile, partialModelFile=None):
+    """Write a network in the tsv format and, if requested, its directed
+    edges as a partial model sif file
+    """
+    grn.write_network(networkFile, network.nodeNames, network.undirected, network.directed)
+    if partialModelFile is not None:
+        grn.save_partial_model(partialModelFile, network.nodeNames, network.directed)
+
+
+def SummarizeForests(forests, prizes=None, hubNode=None):
+    """Summarize a family of forests held in memory, where forests is an
+    iterable of (name, edges) tuples and the edges of a forest are (node,
+    node) pairs.  prizes is a prize Series or collection of the proteins with
+    prizes.
+
+    Return: the ss.ForestSummary
+    """
+    summary = ss.ForestSummary(PrizeSet(prizes), hubNode)
+    for name, edges in forests:
+        summary.AddEdgeList(name, edges)
+    return summary
+
+
+def SummarizeSifFiles(sifFiles, prizes=None, hubNode=None, workers=1):
+    """Summarize a family of sif forests
+
+    Return: the ss.ForestSummary
+    """
+    return ss.SummarizeSifFiles(sifFiles, PrizeSet(prizes), hubNode, workers)
+
+
+def PrizeSet(prizes):
+    """Return: a frozenset of the proteins in a prize Series or collection"""
+    if prizes is None:
+        return frozenset()
+    if isinstance(prizes, pd.Series):
+        return frozenset(prizes.index)
+    return frozenset(prizes)
+
+
+def ForestSizes(summary):
+    """Return: a data frame with the size of each forest in a summary as in
+    the summarize_sif.py size file
+    """
+    return ss.SizeTable(summary)
+
+
+def NodeFrequencies(summary):
+    """Return: a pandas Series of the fraction of forests that contain each
+    node
+    """
+    nodes = summary.NodeFrequencies()
+    return pd.Series([freq for node, freq in nodes], index=[node for node, freq in nodes], name="NodeFreq")
+
+
+def EdgeFrequencies(summary):
+    """Return: a pandas Series of the fraction of forests that contain each
+    edge indexed by the sorted (node, node) pairs
+    """
+    edges = summary.EdgeFrequencies()
+    return pd.Series([freq for edge, freq in edges], index=pd.MultiIndex.from_tuples([edge for edge, freq in edges]), \
+        name="EdgeFreq")
@@ -0,0 +1,110 @@
+import filecmp, os, shutil, sys, tempfile, time
+import numpy as np
+from argparse import ArgumentParser
+
+# Create the path to the pcsf scripts relative to this benchmark's path
+# Workaround due to lack of a formal Python package for the pcsf scripts
+bench_dir = os.path.dirname(__file__)
+path = os.path.abspath(os.path.join(bench_dir, ".."))
+if not path in sys.path:
+    sys.path.insert(1, path)
+
+import generate_prizes as gp
+
+__author__ = "Anthony Gitter"
+
+def Main(arg_list):
+    """Time the iterative and vectorized prize engines on synthetic data of
+    increasing size and confirm that they write identical prize files
+    """
+    parser = CreateParser()
+    options = parser.parse_args(arg_list)
+
+    sizes = [int(size) for size in options.sizes.split(",")]
+    assert all(size > 0 for size in sizes), "The sizes must be positive"
+
+    rng = np.random.RandomState(options.seed)
+    work_dir = tempfile.mkdtemp()
+    try:
+        print "peptides\ttimepoints\titerative (s)\tvectorized (s)\tspeedup"
+        for size in sizes:
+            first_file, prev_file, map_file = WriteSyntheticInputs(work_dir, size, options.timepoints, rng)
+            base_args = ["--firstfile", first_file, "--prevfile", prev_file, "--mapfile", map_file]
+
+            vectorized_file = os.path.join(work_dir, "vectorized-prizes.txt")
+            vectorized_time = TimeEngine(base_args, "vectorized", vectorized_file)
+
+            # The iterative engine is too slow to run on the largest inputs
+            iterative_time = None
+            if size <= options.maxiterative:
+                iterative_file = os.path.join(work_dir, "iterative-prizes.txt")
+                iterative_time = TimeEngine(base_args, "iterative", iterative_file)
+                assert filecmp.cmp(iterative_file, vectorized_file, shallow=False), \
+                    "The engines wrote different prize files for {} peptides".format(size)
+
+            if iterative_time is None:
+                print "{}\t{}\tNA\t{:.3f}\tNA".format(size, options.timepoints, vectorized_time)
+            else:
+                print "{}\t{}\t{:.3f}\t{:.3f}\t{:.1f}".format(size, options.timepoints, iterative_time, vectorized_time, iterative_time / vectorized_time)
+    finally:
+        shutil.rmtree(work_dir)
+
+
+def TimeEngine(base_args, engine, outfile):
+    """Run generate_prizes.Main with the specified engine
+
+    Return: the wall time in seconds
+    """
+    start = time.time()
+    gp.Main(base_args + ["--engine", engine, "--outfile", outfile])
+    return time.time() - start
+
+
+def WriteSyntheticInputs(out_dir, peptides, timepoints, rng):
+    """Write first scores, previous scores, and peptide-protein map files
+    with the same layout as the files in data/timeseries.  There are about
+    half as many proteins as peptides, 10% of peptides map to a
+    pipe-delimited group of proteins, and the map contains twice as many
+    peptides as the score files.
+
+    Return: the three filenames
+    """
+    names = ["PEP{}".format(ind) for ind in range(2*peptides)]
+    proteins = max(1, peptides/2)
+
+    first_file = os.path.join(out_dir, "p-values-first.tsv")
+    prev_file = os.path.join(out_dir, "p-values-prev.tsv")
+    for score_file in [first_file, prev_file]:
+        # Include some p-values of exactly 1
+        scores = np.minimum(rng.uniform(1e-6, 1.2, size=(peptides, timepoints)), 1.0)
+        with open(score_file, "w") as out_f:
+            out_f.write("#peptide\t" + "\t".join("t{}".format(col) for col in range(timepoints)) + "\n")
+            for row in range(peptides):
+                out_f.write(names[row] + "\t" + "\t".join(repr(score) for score in scores[row]) + "\n")
+
+    map_file = os.path.join(out_dir, "peptide-mapping.tsv")
+    with open(map_file, "w") as out_f:
+        out_f.write("peptide\tprotein(s)\n")
+        for name in names:
+            group_size = 3 if rng.uniform() < 0.1 else 1
+            group = rng.randint(proteins, size=group_size)
+            out_f.write("{}\t{}\n".format(name, "|".join("PROT{}_HUMAN".format(prot) for prot in group)))
+
+    return first_file, prev_file, map_file
+
+
+def CreateParser():
+    """Setup the option parser"""
+    parser = ArgumentParser(description="Benchmark the generate_prizes.py engines on synthetic data.")
+    parser.add_argument("--sizes", type=str, dest="sizes", help="A comma-delimited list of the number of scored peptides (default 1000,10000,100000).", default="1000,10000,100000", required=False)
+    parser.add_argument("--timepoints", type=int, dest="timepoints", help="The number of scores per peptide in each score file (default 7).", default=7, required=False)
+    parser.add_argument("--maxiterative", type=int, dest="maxiterative", help="The largest size at which the iterative engine is run (default 10000).", default=10000, required=False)
+    parser.add_argument("--seed", type=int, dest="seed", help="A seed for the pseudo-random number generator (default 2016).", default=2016, required=False)
+    return parser
+
+
+if __name__ == "__main__":
+    """Use the command line arguments to setup the options
+    (the same as the default ArgumentParser behavior)
+    """
+    Main(sys.argv[1:])
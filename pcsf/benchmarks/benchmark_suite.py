@@ -0,0 +1,289 @@
+import json, os, platform, resource, shutil, subprocess, sys, tempfile, time
+import numpy as np
+from argparse import ArgumentParser
+
+# Create the path to the pcsf scripts relative to this benchmark's path
+# Workaround due to lack of a formal Python package for the pcsf scripts
+bench_dir = os.path.dirname(__file__)
+path = os.path.abspath(os.path.join(bench_dir, ".."))
+if not path in sys.path:
+    sys.path.insert(1, path)
+
+import benchmark_generate_prizes as bgp
+
+__author__ = "Anthony Gitter"
+
+# The entry points that are benchmarked, as (name, module, function) tuples
+ENTRY_POINTS = [
+    ("generate_prizes", "generate_prizes", "Main"),
+    ("subsample_peptides", "subsample_peptides", "Main"),
+    ("permute_proteins", "permute_proteins", "Main"),
+    ("summarize_sif", "summarize_sif", "Main"),
+    ("generate_randomized_networks", "generate_randomized_networks", "run")
+]
+
+def Main(arg_list):
+    """Time and memory-profile every pipeline entry point on synthetic data of
+    increasing size, save the results as json, and compare them to a baseline
+    """
+    parser = CreateParser()
+    options = parser.parse_args(arg_list)
+
+    sizes = [int(size) for size in options.sizes.split(",")]
+    assert all(size > 0 for size in sizes), "The sizes must be positive"
+    assert options.repeats > 0, "The number of repeats must be positive"
+    entries = [entry for entry in ENTRY_POINTS if options.entries is None or entry[0] in options.entries.split(",")]
+    assert len(entries) > 0, "No entry points match {}".format(options.entries)
+
+    rng = np.random.RandomState(options.seed)
+    results = []
+    print "entry point\tsize\titems\twall (s)\tcpu (s)\tpeak RSS (MB)"
+    for size in sizes:
+        work_dir = tempfile.mkdtemp()
+        try:
+            inputs = WriteSyntheticData(work_dir, size, options.timepoints, options.forests, rng)
+            for name, module, function in entries:
+                args, items = EntryArgs(name, inputs, work_dir, options.copies, options.seed)
+                # Keep the fastest repeat
+                runs = [RunIsolated(module, function, args) for repeat in range(options.repeats)]
+                result = min(runs, key=lambda run: run["wall"])
+                result.update(entry=name, size=size, items=items)
+                results.append(result)
+                print "{}\t{}\t{}\t{:.3f}\t{:.3f}\t{:.1f}".format(name, size, items, result["wall"], result["cpu"], result["peak_rss_mb"])
+        finally:
+            shutil.rmtree(work_dir)
+
+    metadata = dict(python=platform.python_version(), platform=platform.platform(), numpy=np.__version__, \
+        date=time.strftime("%Y-%m-%d %H:%M:%S"), timepoints=options.timepoints, forests=options.forests, \
+        copies=options.copies, seed=options.seed, repeats=options.repeats)
+    with open(options.outfile, "w") as out_f:
+        json.dump(dict(metadata=metadata, results=results), out_f, indent=2, sort_keys=True)
+    print "Wrote {} results to {}".format(len(results), options.outfile)
+
+    if options.baseline is not None:
+        with open(options.baseline) as baseline_f:
+            baseline = json.load(baseline_f)
+        regressions = CompareResults(baseline["results"], results, options.tolerance)
+        if len(regressions) > 0:
+            raise RuntimeError("{} benchmarks regressed by more than {:.0%}: {}".format(len(regressions), options.tolerance, ", ".join(regressions)))
+
+
+def WriteSyntheticData(out_dir, size, timepoints, forests, rng):
+    """Write synthetic versions of the pipeline inputs for one size.  The
+    score and peptide map files are written as in
+    benchmark_generate_prizes.py with size peptides, the interactome has
+    5*size edges among the mapped proteins, and the forest family has
+    forests sif files of size/10 edges from the interactome.
+
+    Return: a dict that maps input names to filenames
+    """
+    first_file, prev_file, map_file = bgp.WriteSyntheticInputs(out_dir, size, timepoints, rng)
+    inputs = dict(firstfile=first_file, prevfile=prev_file, mapfile=map_file)
+    inputs["tsfile"] = WriteTimeSeries(out_dir, size, timepoints, rng)
+    inputs["network"], edges = WriteInteractome(out_dir, 5*size, max(2, size/2), rng)
+    inputs["prizefile"], inputs["forestdir"] = WriteForestFamily(out_dir, edges, forests, max(1, size/10), rng)
+    return inputs
+
+
+def WriteTimeSeries(out_dir, peptides, timepoints, rng):
+    """Write a time series file with the same layout as
+    data/timeseries/median-time-series.tsv, which has one more column than
+    the score files
+
+    Return: the filename
+    """
+    ts_file = os.path.join(out_dir, "median-time-series.tsv")
+    intensities = rng.lognormal(1.0, 0.5, size=(peptides, timepoints + 1))
+    with open(ts_file, "w") as out_f:
+        out_f.write("peptide\t" + "\t".join("t{}".format(col) for col in range(timepoints + 1)) + "\n")
+        for row in range(peptides):
+            out_f.write("PEP{}\t".format(row) + "\t".join("{:.5f}".format(value) for value in intensities[row]) + "\n")
+    return ts_file
+
+
+def WriteInteractome(out_dir, edges, proteins, rng):
+    """Write an interactome with a header and weight and orientation columns,
+    the format read by generate_randomized_networks.py, using the protein
+    names in the synthetic peptide map.  About 30% of the edges are directed,
+    and there are no self edges or repeated edges.
+
+    Return: the filename and a list of the edges as pairs of protein names
+    """
+    edges = min(edges, proteins*(proteins - 1)/2)
+    seen = set()
+    while len(seen) < edges:
+        node1, node2 = rng.randint(proteins, size=2)
+        if node1 != node2:
+            seen.add((min(node1, node2), max(node1, node2)))
+    pairs = [("PROT{}_HUMAN".format(node1), "PROT{}_HUMAN".format(node2)) for node1, node2 in sorted(seen)]
+    orientations = np.where(rng.uniform(size=len(pairs)) < 0.3, "D", "U")
+    weights = rng.uniform(0.1, 1.0, size=len(pairs))
+
+    network_file = os.path.join(out_dir, "interactome.tsv")
+    with open(network_file, "w") as out_f:
+        out_f.write("id1\tid2\tweight\torientation\n")
+        for (node1, node2), weight, orientation in zip(pairs, weights, orientations):
+            out_f.write("{}\t{}\t{:.3f}\t{}\n".format(node1, node2, weight, orientation))
+    return network_file, pairs
+
+
+def WriteForestFamily(out_dir, edges, forests, forest_edges, rng):
+    """Write a prize file with the same layout as data/pcsf/egfr-prizes.txt
+    for the proteins in the interactome and a family of forests in sif files
+    named like the forest.py output, each with a random subset of the edges
+
+    Return: the prize filename and the directory of the sif files
+    """
+    proteins = sorted(set(node for edge in edges for node in edge))
+    prize_file = os.path.join(out_dir, "prizes.txt")
+    with open(prize_file, "w") as out_f:
+        for protein in proteins:
+            if rng.uniform() < 0.5:
+                out_f.write("{}\t{:.9f}\n".format(protein, rng.uniform(0.1, 5.0)))
+
+    forest_dir = os.path.join(out_dir, "forests")
+    os.mkdir(forest_dir)
+    for seed in range(1, forests + 1):
+        sample = rng.choice(len(edges), size=min(forest_edges, len(edges)), replace=False)
+        with open(os.path.join(forest_dir, "prizes_beta0.55_mu0.008_omega0.1_seed{}optimalForest.sif".format(seed)), "w") as out_f:
+            for edge_ind in sample:
+                out_f.write("{}\tpp\t{}\n".format(edges[edge_ind][0], edges[edge_ind][1]))
+    return prize_file, forest_dir
+
+
+def EntryArgs(name, inputs, work_dir, copies, seed):
+    """The arguments of an entry point on the synthetic inputs and the number
+    of input items it processes (peptides, edges, or forests)
+
+    Return: a list of arguments and the number of items
+    """
+    out_dir = os.path.join(work_dir, name)
+    if not os.path.isdir(out_dir):
+        os.mkdir(out_dir)
+    if name == "generate_prizes":
+        args = ["--firstfile", inputs["firstfile"], "--prevfile", inputs["prevfile"], "--mapfile", inputs["mapfile"], \
+            "--outfile", os.path.join(out_dir, "prizes.txt")]
+        return args, CountLines(inputs["firstfile"]) - 1
+    if name == "subsample_peptides":
+        args = ["--firstfile", inputs["firstfile"], "--prevfile", inputs["prevfile"], "--tsfile", inputs["tsfile"], \
+            "--outdir", out_dir, "--copies", str(copies), "--seed", str(seed)]
+        return args, CountLines(inputs["firstfile"]) - 1
+    if name == "permute_proteins":
+        args = ["--mapfile", inputs["mapfile"], "--outdir", out_dir, "--copies", str(copies), "--seed", str(seed)]
+        return args, CountLines(inputs["mapfile"]) - 1
+    if name == "summarize_sif":
+        args = ["--indir", inputs["forestdir"], "--pattern", "*optimalForest.sif", "--prizefile", inputs["prizefile"], \
+            "--outfile", os.path.join(out_dir, "summary")]
+        return args, len(os.listdir(inputs["forestdir"]))
+    if name == "generate_randomized_networks":
+        args = ["--network", inputs["network"], "--outdir", out_dir, "--copies", str(copies), "--seed", str(seed), \
+            "--backend", "python"]
+        return args, CountLines(inputs["network"]) - 1
+    raise RuntimeError("Unknown entry point {}".format(name))
+
+
+def CountLines(filename):
+    with open(filename) as in_f:
+        return sum(1 for line in in_f)
+
+
+def RunIsolated(module, function, args):
+    """Run an entry point in a new Python process so that its peak memory is
+    measured separately from the other entry points.  The output of the entry
+    point is discarded.
+
+    Return: a dict with the wall and cpu time in seconds and the peak RSS in MB
+    of the process and of the process after importing the module
+    """
+    result_fd, result_file = tempfile.mkstemp(suffix=".json")
+    os.close(result_fd)
+    try:
+        with open(os.devnull, "w") as null_f:
+            subprocess.check_call([sys.executable, os.path.splitext(os.path.abspath(__file__))[0] + ".py", "--child", \
+                json.dumps(dict(module=module, function=function, args=args, result=result_file))], stdout=null_f)
+        with open(result_file) as result_f:
+            return json.load(result_f)
+    finally:
+        os.remove(result_file)
+
+
+def ChildMain(spec):
+    """Run one entry point in this process and write its measurements to the
+    result file in the spec
+    """
+    entry_point = getattr(__import__(spec["module"]), spec["function"])
+    import_rss = PeakRSS()
+    start_wall = time.time()
+    start_cpu = CpuTime()
+    entry_point(spec["args"])
+    result = dict(wall=time.time() - start_wall, cpu=CpuTime() - start_cpu, peak_rss_mb=PeakRSS(), import_rss_mb=import_rss)
+    with open(spec["result"], "w") as result_f:
+        json.dump(result, result_f)
+
+
+def CpuTime():
+    """The user and system cpu time of this process and its finished child
+    processes, such as multiprocessing workers
+    """
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime + children.ru_utime + children.ru_stime
+
+
+def PeakRSS():
+    """The peak resident set size of this process in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    if sys.platform == "darwin":
+        return peak / (1024.0 * 1024.0)
+    return peak / 1024.0
+
+
+def CompareResults(baseline, results, tolerance):
+    """Print the ratio of each result's wall time and peak RSS to the
+    baseline result for the same entry point and size
+
+    Return: a list of the benchmarks whose wall time or peak RSS increased by
+    more than the tolerance
+    """
+    baseline_map = dict(((result["entry"], result["size"]), result) for result in baseline)
+    regressions = []
+    print "entry point\tsize\twall ratio\tpeak RSS ratio"
+    for result in results:
+        key = (result["entry"], result["size"])
+        if not key in baseline_map:
+            print "{}\t{}\tNA\tNA".format(*key)
+            continue
+        wall_ratio = result["wall"] / max(baseline_map[key]["wall"], 1e-6)
+        rss_ratio = result["peak_rss_mb"] / max(baseline_map[key]["peak_rss_mb"], 1e-6)
+        regressed = wall_ratio > 1 + tolerance or rss_ratio > 1 + tolerance
+        print "{}\t{}\t{:.2f}\t{:.2f}{}".format(key[0], key[1], wall_ratio, rss_ratio, "\tREGRESSION" if regressed else "")
+        if regressed:
+            regressions.append("{} ({})".format(*key))
+    return regressions
+
+
+def CreateParser():
+    """Setup the option parser"""
+    parser = ArgumentParser(description="Benchmark the wall time, cpu time, and peak memory of the pcsf entry points on synthetic data of increasing size.")
+    parser.add_argument("--sizes", type=str, dest="sizes", help="A comma-delimited list of the number of scored peptides, which also sets the interactome size (5 edges per peptide) and forest size (1 edge per 10 peptides) (default 1000,10000).", default="1000,10000", required=False)
+    parser.add_argument("--entries", type=str, dest="entries", help="A comma-delimited list of the entry points to benchmark (default all): {}.".format(", ".join(entry[0] for entry in ENTRY_POINTS)), default=None, required=False)
+    parser.add_argument("--timepoints", type=int, dest="timepoints", help="The number of scores per peptide in each score file (default 7).", default=7, required=False)
+    parser.add_argument("--forests", type=int, dest="forests", help="The number of forests summarized (default 100).", default=100, required=False)
+    parser.add_argument("--copies", type=int, dest="copies", help="The number of copies generated by the subsampling, permutation, and network randomization scripts (default 10).", default=10, required=False)
+    parser.add_argument("--repeats", type=int, dest="repeats", help="The number of times each benchmark is run, keeping the fastest run (default 1).", default=1, required=False)
+    parser.add_argument("--seed", type=int, dest="seed", help="A seed for the pseudo-random number generator (default 2016).", default=2016, required=False)
+    parser.add_argument("--outfile", type=str, dest="outfile", help="The path and filename of the json results (default benchmark_results.json).", default="benchmark_results.json", required=False)
+    parser.add_argument("--baseline", type=str, dest="baseline", help="The path and filename of json results from an earlier run (optional).  An error is raised if a wall time or peak RSS increased by more than the tolerance.", default=None, required=False)
+    parser.add_argument("--tolerance", type=float, dest="tolerance", help="The allowed fractional increase over the baseline (default 0.25).", default=0.25, required=False)
+    return parser
+
+
+if __name__ == "__main__":
+    """Use the command line arguments to setup the options
+    (the same as the default ArgumentParser behavior)
+    """
+    if len(sys.argv) == 3 and sys.argv[1] == "--child":
+        ChildMain(json.loads(sys.argv[2]))
+    else:
+        Main(sys.argv[1:])
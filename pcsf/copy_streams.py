@@ -0,0 +1,56 @@
+import hashlib, multiprocessing, os, struct
+import numpy as np
+
+__author__ = "Anthony Gitter"
+
+def CopyRandomState(seed, copy_index):
+    """Create the pseudo-random number generator for one copy.  The generator
+    state is derived by hashing the base seed and the copy index, similar to
+    spawning child seeds with a numpy SeedSequence.  Each copy has an
+    independent random stream, so any copy can be regenerated without
+    generating the copies before it.
+
+    Return: a numpy RandomState
+    """
+    digest = hashlib.sha256("pcsf-copy:{}:{}".format(seed, copy_index)).digest()
+    return np.random.RandomState(np.frombuffer(digest, dtype="<u4").astype(np.uint32))
+
+
+def NewSeed():
+    """Draw a base seed from the operating system when one was not provided.
+    The seed should be reported so that the copies can be regenerated.
+
+    Return: a non-negative int
+    """
+    return struct.unpack("<I", os.urandom(4))[0]
+
+
+def GenerateCopies(copy_function, copy_indices, workers=1, initializer=None, initargs=()):
+    """Call copy_function on each copy index.  If workers is greater than 1
+    the copies are generated in a pool of worker processes.  The initializer
+    is called with initargs in each worker, or in this process when there is
+    a single worker, and can be used to share read-only data with the
+    workers.  copy_function must use the copy's own random stream so that the
+    results do not depend on the number of workers.
+
+    Return: a list of the copy_function results in the order of copy_indices
+    """
+    assert workers > 0, "The number of workers must be positive"
+
+    if workers == 1:
+        if initializer is not None:
+            initializer(*initargs)
+        return [copy_function(copy_index) for copy_index in copy_indices]
+
+    pool = multiprocessing.Pool(workers, initializer, initargs)
+    try:
+        # Send several copies to a worker at a time to reduce the overhead
+        chunksize = max(1, len(copy_indices) // (4*workers))
+        results = pool.map(copy_function, copy_indices, chunksize)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return results
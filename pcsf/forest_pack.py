@@ -0,0 +1,232 @@
+import os, re, sys, glob, json, struct
+from array import array
+import numpy as np
+from argparse import ArgumentParser
+import instrumentation as ins
+
+__author__ = "Anthony Gitter"
+
+# The first bytes of a pack file, which include the format version
+PACK_MAGIC = b"PCSFPK01"
+
+# The byte alignment of the arrays in a pack file
+ALIGNMENT = 8
+
+def Main(argList):
+    """Parse the arguments, which either come from the command line or a list
+    provided by the Python code calling this function
+    """
+    parser = CreateParser()
+    options = parser.parse_args(argList)
+
+    if options.pattern is None and options.siflist is None:
+        raise RuntimeError("Must specify --pattern or --siflist")
+
+    if not options.pattern is None:
+        sifFiles = glob.glob(os.path.join(options.indir, options.pattern))
+    else:
+        sifFiles = [os.path.join(options.indir, f) for f in options.siflist.split("|")]
+
+    if len(sifFiles) == 0:
+        raise RuntimeError("Must provide 1 or more forests as input")
+
+    ins.Start("forest_pack", options.profileout, argList)
+    ins.BeginPhase("pack")
+    PackSifFiles(sifFiles, options.packfile, options.indir)
+    ins.Count("forests", len(sifFiles))
+
+    if options.remove:
+        for sifFile in sifFiles:
+            os.remove(sifFile)
+        print "Removed %d sif files" % len(sifFiles)
+
+    ins.Finish()
+
+
+class ForestPack(object):
+    """Random access to the forests in a pack file.  A pack file contains a
+    json header with the node names, forest names, and forest seeds followed
+    by two arrays.  The edge pointer array has one more entry than the number
+    of forests, and the edges of forest i are rows edgePtr[i] to edgePtr[i+1]
+    of the edge array.  Each edge is a pair of node ids sorted by node name.
+    Forest edges are stored in the order they first appear in the sif file,
+    self edges and repeated edges are removed, and the arrays are
+    memory-mapped so that only the forests that are accessed are read.
+    """
+    def __init__(self, packFile):
+        self.packFile = packFile
+        with open(packFile, "rb") as f:
+            magic = f.read(len(PACK_MAGIC))
+            if magic != PACK_MAGIC:
+                raise RuntimeError("%s is not a forest pack file" % packFile)
+            headerLength = struct.unpack("<Q", f.read(8))[0]
+            header = json.loads(f.read(headerLength).decode("utf-8"))
+
+        # json stores strings as unicode
+        self.nodeNames = [str(node) for node in header["nodes"]]
+        self.names = [str(name) for name in header["forests"]]
+        self.seeds = header["seeds"]
+        self.forestIndex = dict((name, forestInd) for forestInd, name in enumerate(self.names))
+        if len(self.forestIndex) < len(self.names):
+            raise RuntimeError("%s has forests with the same name" % packFile)
+        # Forests in different subdirectories can share a seed, and those
+        # seeds cannot be looked up
+        self.seedIndex = dict()
+        for forestInd, seed in enumerate(self.seeds):
+            if seed is not None:
+                self.seedIndex[seed] = None if seed in self.seedIndex else forestInd
+
+        self.edgePtr = np.memmap(packFile, dtype="<i8", mode="r", offset=header["edgePtrOffset"], \
+            shape=(len(self.names) + 1,))
+        edgeCount = int(self.edgePtr[-1])
+        if edgeCount > 0:
+            self.edges = np.memmap(packFile, dtype="<i4", mode="r", offset=header["edgesOffset"], shape=(edgeCount, 2))
+        else:
+            self.edges = np.zeros((0, 2), dtype="<i4")
+
+    def ForestCount(self):
+        """The number of forests in the pack"""
+        return len(self.names)
+
+    def ForestIndex(self, name):
+        """The index of the forest with this name, which is the sif file's
+        path relative to the packed directory
+        """
+        if not name in self.forestIndex:
+            raise RuntimeError("%s is not in %s" % (name, self.packFile))
+        return self.forestIndex[name]
+
+    def SeedForestIndex(self, seed):
+        """The index of the forest generated with this PCSF seed"""
+        if not seed in self.seedIndex:
+            raise RuntimeError("No forest with seed %d in %s" % (seed, self.packFile))
+        if self.seedIndex[seed] is None:
+            raise RuntimeError("More than one forest has seed %d in %s" % (seed, self.packFile))
+        return self.seedIndex[seed]
+
+    def ForestNodeIds(self, forestInd):
+        """Return an array with one row per edge in a forest and the node ids
+        of the edge in the columns
+        """
+        return np.asarray(self.edges[self.edgePtr[forestInd]:self.edgePtr[forestInd + 1]])
+
+    def ForestEdges(self, forestInd):
+        """Return a list of the edges in a forest as tuples of node names"""
+        return [(self.nodeNames[node1], self.nodeNames[node2]) for node1, node2 in self.ForestNodeIds(forestInd)]
+
+
+def PackSifFiles(sifFiles, packFile, baseDir=None):
+    """Read sif forests and write them to a pack file in order.  The sif files
+    are parsed the same way as in summarize_sif.py and are named by
+    ForestName.  The edge arrays are built in memory, which uses much less
+    memory than the sif files because the node names are only stored once.
+    """
+    nodeIds = dict()
+    nodeNames = []
+    names = []
+    packedNames = set()
+    seeds = []
+    edgePtr = array("l", [0])
+    edges = array("i")
+
+    for sifFile in sifFiles:
+        name = ForestName(sifFile, baseDir)
+        if name in packedNames:
+            raise RuntimeError("More than one forest is named %s" % name)
+        packedNames.add(name)
+        forestEdges = set()
+        with open(sifFile) as f:
+            for edgeLine in f:
+                edgeParts = edgeLine.split()
+                # Ignore blank lines and self edges
+                if len(edgeParts) == 0 or edgeParts[0] == edgeParts[2]:
+                    continue
+                nodePair = []
+                for node in sorted((edgeParts[0], edgeParts[2])):
+                    if not node in nodeIds:
+                        nodeIds[node] = len(nodeNames)
+                        nodeNames.append(node)
+                    nodePair.append(nodeIds[node])
+                nodePair = tuple(nodePair)
+                if not nodePair in forestEdges:
+                    forestEdges.add(nodePair)
+                    edges.extend(nodePair)
+        edgePtr.append(len(edges) // 2)
+        names.append(name)
+        seeds.append(ForestSeed(sifFile))
+
+    WritePack(packFile, nodeNames, names, seeds, np.frombuffer(edgePtr, dtype=np.int_), \
+        np.frombuffer(edges, dtype=np.intc).reshape(-1, 2) if len(edges) > 0 else np.zeros((0, 2)))
+    print "Packed %d forests with %d nodes and %d edges into %s" % (len(names), len(nodeNames), len(edges) // 2, packFile)
+
+
+def WritePack(packFile, nodeNames, names, seeds, edgePtr, edges):
+    """Write the node names, forest names and seeds, edge pointer array, and
+    edge array to a pack file.  The file is written to a temporary file and
+    renamed so that a partial pack file is never read.
+    """
+    # The array offsets depend on the header length, which includes the
+    # offsets, so reserve a fixed width for the offset values
+    header = dict(nodes=nodeNames, forests=names, seeds=seeds, edgePtrOffset=0, edgesOffset=0)
+    headerLength = len(json.dumps(header).encode("utf-8")) + 2*20
+    edgePtrOffset = Align(len(PACK_MAGIC) + 8 + headerLength)
+    edgesOffset = Align(edgePtrOffset + 8*len(edgePtr))
+    header.update(edgePtrOffset=edgePtrOffset, edgesOffset=edgesOffset)
+    headerBytes = json.dumps(header).encode("utf-8").ljust(headerLength)
+
+    tmpFile = packFile + ".tmp"
+    with open(tmpFile, "wb") as f:
+        f.write(PACK_MAGIC)
+        f.write(struct.pack("<Q", headerLength))
+        f.write(headerBytes)
+        f.write(b"\0"*(edgePtrOffset - f.tell()))
+        f.write(np.asarray(edgePtr, dtype="<i8").tobytes())
+        f.write(b"\0"*(edgesOffset - f.tell()))
+        f.write(np.asarray(edges, dtype="<i4").tobytes())
+    os.rename(tmpFile, packFile)
+
+
+def Align(offset):
+    """Round an offset up to the array alignment"""
+    return ((offset + ALIGNMENT - 1) // ALIGNMENT) * ALIGNMENT
+
+
+def ForestName(sifFile, baseDir=None):
+    """The name of a sif forest, which is its path relative to baseDir so
+    that forests with the same filename in different subdirectories are
+    distinct, or its filename if baseDir is None
+    """
+    if baseDir is None:
+        return os.path.basename(sifFile)
+    return os.path.relpath(sifFile, baseDir)
+
+
+def ForestSeed(sifFile):
+    """Parse the PCSF seed from a forest filename such as
+    <prizes>_beta<b>_mu<m>_omega<o>_seed<s>optimalForest.sif
+
+    Return: the seed as an int or None if the filename does not have a seed
+    """
+    match = re.search(r"seed(\d+)", os.path.basename(sifFile))
+    if match is None:
+        return None
+    return int(match.group(1))
+
+
+def CreateParser():
+    """Setup the option parser"""
+    parser = ArgumentParser(description="Pack a family of Steiner forests in sif files into a single file that summarize_sif.py can read.")
+    parser.add_argument("--indir", type=str, dest="indir", help="The path to the directory that contains sif files.", default=None, required=True)
+    parser.add_argument("--pattern", type=str, dest="pattern", help="The filename pattern of the sif files in indir.  Not needed if a siflist is provided instead", default=None)
+    parser.add_argument("--siflist", type=str, dest="siflist", help="A list of sif files in indir delimited by '|'.  Not used if a pattern is provided.", default=None)
+    parser.add_argument("--packfile", type=str, dest="packfile", help="The path and filename of the output pack file.", default=None, required=True)
+    parser.add_argument("--remove", action="store_true", dest="remove", help="This flag removes the sif files after they are packed.", default=False)
+    ins.AddProfileArgument(parser)
+    return parser
+
+
+if __name__ == "__main__":
+    """Use the command line arguments to setup the options
+    (the same as the default ArgumentParser behavior)
+    """
+    Main(sys.argv[1:])
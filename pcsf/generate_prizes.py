@@ -1,11 +1,23 @@
-import sys
+import itertools, sys
 import pandas as pd
 import numpy as np
-from collections import defaultdict
+from collections import defaultdict, namedtuple
 from argparse import ArgumentParser
+import input_cache as ic
+import instrumentation as ins
 
 __author__ = "Anthony Gitter"
 
+# The peptide-protein map stored as integer codes.  peptides and proteins are
+# the name tables, with the proteins sorted.  Each line of the map file has a
+# peptide code in line_peptides and a protein group stored in CSR style: the
+# protein codes of line i are group_proteins[group_ptr[i]:group_ptr[i+1]]
+PeptideMapArrays = namedtuple("PeptideMapArrays", ["peptides", "proteins", "line_peptides", "group_ptr", "group_proteins"])
+
+# The map file lines that each protein appears in, sorted by protein.  The
+# lines of protein j are pair_lines[starts[j]:starts[j+1]]
+ProteinIncidenceArrays = namedtuple("ProteinIncidenceArrays", ["pair_lines", "starts"])
+
 def Main(arg_list):
     """Parse the arguments, which either come from the command line or a list
     provided by the Python code calling this function
@@ -18,16 +30,45 @@ def Main(arg_list):
     assert options.mapfile is not None, "Must specify the mapfile"
     assert options.outfile is not None, "Must specify the outfile"
 
-    # Load the mapping from peptide ids to sets of protein ids
-    pep_prot_map = LoadPeptideMap(options.mapfile)
+    ins.Start("generate_prizes", options.profileout, arg_list)
+    ins.BeginPhase("parse")
+    if options.engine == "iterative":
+        # Load the mapping from peptide ids to sets of protein ids
+        pep_prot_map = LoadPeptideMap(options.mapfile, options.cachedir)
+
+        # Load the peptide scores and prizes
+        merged_df = LoadScores(options.firstfile, options.prevfile, options.cachedir)
+
+        ins.BeginPhase("compute")
+        prot_prizes = IterativeProteinPrizes(merged_df, pep_prot_map)
+        proteins = sorted(prot_prizes.keys())
+        prizes = [prot_prizes[prot] for prot in proteins]
+    else:
+        # Load the peptide-protein map as integer-coded arrays
+        map_arrays = LoadPeptideMapArrays(options.mapfile, options.cachedir)
+
+        # Load the peptide scores and prizes
+        merged_df = LoadScores(options.firstfile, options.prevfile, options.cachedir)
+
+        ins.BeginPhase("compute")
+        proteins, prizes = VectorizedProteinPrizes(merged_df, map_arrays)
+    ins.Count("peptides", len(merged_df))
+    ins.Count("proteins", len(proteins))
 
-    # Load the peptide scores and prizes
-    merged_df = LoadScores(options.firstfile, options.prevfile)
+    ins.BeginPhase("write")
+    WritePrizes(options.outfile, proteins, prizes)
+    ins.Finish()
 
-    # Compute the protein prizes.  Take the maximum prize across all peptides
-    # that map to the protein.  The same peptide can contribute to the prize of
-    # multiple proteins if it maps to multiple protiens.
 
+def IterativeProteinPrizes(merged_df, pep_prot_map):
+    """Compute the protein prizes one peptide at a time.  Take the maximum
+    prize across all peptides that map to the protein.  The same peptide can
+    contribute to the prize of multiple proteins if it maps to multiple
+    proteins.  This is the reference implementation for
+    VectorizedProteinPrizes.
+
+    Return: dictionary mapping proteins to prizes
+    """
     # Default prize is 0.0
     prot_prizes = defaultdict(float)
 
@@ -41,26 +82,54 @@ def Main(arg_list):
             # the current prize
             prot_prizes[prot] = max(prot_prizes[prot], row["prize"])
 
-    # Write the prizes to a file.
-    print "Writing prizes for {} unique proteins to {}".format(len(prot_prizes), options.outfile)
+    return prot_prizes
+
+
+def VectorizedProteinPrizes(merged_df, map_arrays):
+    """Compute the protein prizes with array operations instead of iterating
+    over peptides.  Gives the same prizes as IterativeProteinPrizes.
+
+    Return: a sorted list of the proteins that have a prize and an array of
+    their prizes
+    """
+    line_prizes = LinePrizes(merged_df, map_arrays)
+    incidence = ProteinIncidence(map_arrays)
+    return PresentPrizes(map_arrays.proteins, ProteinPrizeMatrix(line_prizes, incidence))
+
+
+def WritePrizes(outfile, proteins, prizes):
+    """Write the prizes to a file in the order given.  Prizes are formatted
+    with str so that numpy and Python floats are written identically.
+    """
+    print "Writing prizes for {} unique proteins to {}".format(len(proteins), outfile)
 
-    with open(options.outfile, "w") as out_f:
-        for prot in sorted(prot_prizes.keys()):
-            out_f.write("{}\t{}\n".format(prot, prot_prizes[prot]))
+    with open(outfile, "w") as out_f:
+        for prot, prize in itertools.izip(proteins, prizes):
+            out_f.write("{}\t{}\n".format(prot, prize))
 
 
-def LoadPeptideMap(mapfile):
+def LoadPeptideMap(mapfile, cache_dir=None):
     """Parse the peptide-to-protein map file.  The peptide is in the first column
     and the protein or proteins are in the second.  The file contains a header row.
     A peptide may map to a set of pipe-delimited proteins.  A peptide may also
     appear multiple times, and the map will include all proteins mapped to that
-    peptide in any line.
+    peptide in any line.  If a cache directory is provided, the map is built
+    from the cached map arrays.
 
     Return: dictionary mapping peptides to sets of proteins
     """
     pep_prot_map = defaultdict(set)
     unique_prots = set()
 
+    if cache_dir is not None:
+        map_arrays = ReadPeptideMapArrays(mapfile, cache_dir)
+        for line, pep_code in enumerate(map_arrays.line_peptides):
+            group = map_arrays.group_proteins[map_arrays.group_ptr[line]:map_arrays.group_ptr[line+1]]
+            pep_prot_map[map_arrays.peptides[pep_code]].update(map_arrays.proteins[prot] for prot in group)
+        unique_prots.update(map_arrays.proteins)
+        print "Loaded {} unique peptides that map to {} unique proteins".format(len(pep_prot_map), len(unique_prots))
+        return pep_prot_map
+
     with open(mapfile) as map_f:
         # Skip the header row
         map_f.readline()
@@ -80,16 +149,208 @@ def LoadPeptideMap(mapfile):
     print "Loaded {} unique peptides that map to {} unique proteins".format(len(pep_prot_map), len(unique_prots))
     return pep_prot_map
 
-def LoadScores(firstfile, prevfile):
+
+def LoadPeptideMapArrays(mapfile, cache_dir=None):
+    """Parse the peptide-to-protein map file into integer-coded arrays.  The
+    file format is the same as in LoadPeptideMap.  Each line is kept, so a
+    peptide that appears multiple times has multiple protein groups.  The
+    arrays are loaded from the cache directory if one is provided.
+
+    Return: a PeptideMapArrays tuple
+    """
+    map_arrays = ReadPeptideMapArrays(mapfile, cache_dir)
+    print "Loaded {} unique peptides that map to {} unique proteins".format(len(map_arrays.peptides), len(map_arrays.proteins))
+    return map_arrays
+
+
+def ReadPeptideMapArrays(mapfile, cache_dir=None):
+    """Load the integer-coded peptide-protein map arrays from the cache or by
+    parsing the map file without reporting the map size
+
+    Return: a PeptideMapArrays tuple
+    """
+    arrays = ic.LoadCached(cache_dir, mapfile, "peptidemap", ParsePeptideMapArrays)
+    return PeptideMapArrays(arrays["peptides"].tolist(), arrays["proteins"].tolist(), \
+        arrays["line_peptides"], arrays["group_ptr"], arrays["group_proteins"])
+
+
+def ParsePeptideMapArrays(mapfile):
+    """Parse the peptide-to-protein map file into integer-coded arrays
+
+    Return: a dict of the PeptideMapArrays fields, with the name tables
+    stored as bytes arrays
+    """
+    pep_codes = dict()
+    peptides = []
+    line_peptides = []
+    groups = []
+
+    with open(mapfile) as map_f:
+        # Skip the header row
+        map_f.readline()
+        for line in map_f:
+            parts = line.strip().split("\t")
+            assert len(parts) == 2, "Expected tab-delimited peptide and protein (or pipe-delimited proteins) on each line"
+
+            pep = parts[0]
+            if pep not in pep_codes:
+                pep_codes[pep] = len(peptides)
+                peptides.append(pep)
+            line_peptides.append(pep_codes[pep])
+            groups.append(parts[1].split("|"))
+
+    proteins = sorted(set(itertools.chain.from_iterable(groups)))
+    prot_codes = dict(itertools.izip(proteins, itertools.count()))
+
+    group_ptr = np.zeros(len(groups) + 1, dtype=np.int64)
+    np.cumsum([len(group) for group in groups], out=group_ptr[1:])
+    group_proteins = np.fromiter((prot_codes[prot] for group in groups for prot in group), dtype=np.int64, count=group_ptr[-1])
+
+    return dict(peptides=ic.StringTable(peptides), proteins=ic.StringTable(proteins), \
+        line_peptides=np.array(line_peptides, dtype=np.int64), group_ptr=group_ptr, group_proteins=group_proteins)
+
+
+def ProteinIncidence(map_arrays):
+    """Expand the protein groups into (line, protein) pairs and sort them by
+    protein so that each protein's lines are a contiguous segment.
+
+    Return: a ProteinIncidenceArrays tuple
+    """
+    pair_lines = np.repeat(np.arange(len(map_arrays.line_peptides)), np.diff(map_arrays.group_ptr))
+    # A stable sort keeps the lines of each protein in file order
+    order = np.argsort(map_arrays.group_proteins, kind="mergesort")
+    sorted_prots = map_arrays.group_proteins[order]
+    # Every protein in the sorted protein table appears in at least one group
+    starts = np.flatnonzero(np.r_[True, sorted_prots[1:] != sorted_prots[:-1]])
+    return ProteinIncidenceArrays(pair_lines[order], starts)
+
+
+def LinePrizes(merged_df, map_arrays):
+    """Assign the peptide prizes to the lines of the peptide-protein map.
+    Every scored peptide must be in the map.  Lines with peptides that were
+    not scored have a prize of -inf.  A peptide with multiple rows in the
+    scores takes the maximum prize.
+
+    Return: an array of prizes with one entry per map line
+    """
+    score_codes = ScorePeptideCodes(merged_df, map_arrays)
+    return SubsampledLinePrizes(merged_df["prize"].values, score_codes, map_arrays)
+
+
+def ScorePeptideCodes(merged_df, map_arrays):
+    """Find the peptide code of each row in the scores.  Every scored peptide
+    must be in the map.
+
+    Return: an array of peptide codes with one entry per score row
+    """
+    pep_codes = dict(itertools.izip(map_arrays.peptides, itertools.count()))
+    score_codes = np.empty(merged_df.shape[0], dtype=np.int64)
+    for row, pep in enumerate(merged_df.index):
+        assert pep in pep_codes, "No protein mapping for {}".format(pep)
+        score_codes[row] = pep_codes[pep]
+    return score_codes
+
+
+def SubsampledLinePrizes(row_prizes, score_codes, map_arrays, rows=None):
+    """Assign the prizes of a subset of the score rows to the lines of the
+    peptide-protein map, as if only those rows were in the score files.  All
+    rows are used if rows is None.
+
+    Return: an array of prizes with one entry per map line
+    """
+    if rows is not None:
+        row_prizes = row_prizes[rows]
+        score_codes = score_codes[rows]
+    pep_prizes = np.full(len(map_arrays.peptides), -np.inf)
+    np.maximum.at(pep_prizes, score_codes, row_prizes)
+    return pep_prizes[map_arrays.line_peptides]
+
+
+def SubsampledPrizeMatrix(merged_df, map_arrays, subsamples):
+    """Compute the protein prizes of subsampled score files without writing
+    or parsing the subsampled files.  Each row of subsamples contains the
+    indices of the score rows retained in one subsample.
+
+    Return: a matrix of prizes with one row per subsample and one column per
+    protein, where -inf indicates that a protein has no prize in that
+    subsample
+    """
+    score_codes = ScorePeptideCodes(merged_df, map_arrays)
+    row_prizes = merged_df["prize"].values
+    incidence = ProteinIncidence(map_arrays)
+
+    prize_matrix = np.empty((len(subsamples), len(incidence.starts)))
+    for sample_ind, rows in enumerate(subsamples):
+        line_prizes = SubsampledLinePrizes(row_prizes, score_codes, map_arrays, rows)
+        prize_matrix[sample_ind] = ProteinPrizeMatrix(line_prizes, incidence)
+    return prize_matrix
+
+
+def ProteinPrizeMatrix(line_prizes, incidence):
+    """Take the maximum line prize over each protein's segment of the
+    incidence arrays.  line_prizes may be a single vector or a matrix with one
+    row of line prizes per sample.
+
+    Return: an array of prizes with proteins in the last dimension.  Proteins
+    that only appear in lines with -inf prizes have a prize of -inf.
+    """
+    line_prizes = np.asarray(line_prizes)
+    if len(incidence.starts) == 0:
+        return np.empty(line_prizes.shape[:-1] + (0,))
+    return np.maximum.reduceat(line_prizes[..., incidence.pair_lines], incidence.starts, axis=-1)
+
+
+def PermutedPrizeMatrix(line_prizes, incidence, permutations, chunk_size=100):
+    """Compute the protein prizes for permuted peptide-protein maps without
+    writing or parsing the permuted map files.  Each row of permutations
+    describes one permuted map, where entry i is the original line whose
+    protein group was moved to line i.  The peptide column is not permuted,
+    so the line prizes are the same for all permutations.  Permutations are
+    processed in chunks of chunk_size rows to bound the memory used by the
+    expanded (permutation, line, protein) values.
+
+    Return: a matrix of prizes with one row per permutation and one column
+    per protein, where -inf indicates that a protein has no prize in that
+    permutation
+    """
+    permutations = np.atleast_2d(permutations)
+    num_perms, num_lines = permutations.shape
+    assert num_lines == len(line_prizes), "The permutations must have one entry per map line"
+
+    prize_matrix = np.empty((num_perms, len(incidence.starts)))
+    for first in range(0, num_perms, chunk_size):
+        chunk = permutations[first:first+chunk_size]
+        # The protein group originally at line j is now at line inverse[j]
+        # and receives that line's peptide prize
+        inverse = np.empty_like(chunk)
+        inverse[np.arange(chunk.shape[0])[:, None], chunk] = np.arange(num_lines)
+        prize_matrix[first:first+chunk_size] = ProteinPrizeMatrix(line_prizes[inverse], incidence)
+    return prize_matrix
+
+
+def PresentPrizes(proteins, prot_prizes):
+    """Select the proteins with a finite prize from a vector produced by
+    ProteinPrizeMatrix.  The default prize is 0.0, so negative prizes and
+    -0.0 become 0.0 like they do in IterativeProteinPrizes.
+
+    Return: a list of proteins and an array of their prizes
+    """
+    present = np.flatnonzero(prot_prizes > -np.inf)
+    # Adding 0.0 turns the -0.0 prize of a p-value of 1 into 0.0
+    prizes = np.maximum(prot_prizes[present], 0.0) + 0.0
+    return [proteins[ind] for ind in present], prizes
+
+def LoadScores(firstfile, prevfile, cache_dir=None):
     """Load the first and previous scores.  For each peptide, compute a prize
     that is -log10(min p-value across all time points).  Assumes the scores
     are p-values or equivalaent scores in (0, 1].  Do not allow null or missing
-    scores.
+    scores.  The parsed scores are loaded from the cache directory if one is
+    provided.
 
     Return: data frame with scores and prize for each peptide
     """
-    first_df = pd.read_csv(firstfile, sep="\t", comment="#", header=None, index_col=0)
-    prev_df = pd.read_csv(prevfile, sep="\t", comment="#", header=None, index_col=0)
+    first_df = LoadScoreFile(firstfile, cache_dir)
+    prev_df = LoadScoreFile(prevfile, cache_dir)
     first_shape = first_df.shape
     assert first_shape == prev_df.shape, "First and previous score files must have the same number of peptides and time points"
 
@@ -105,15 +366,49 @@ def LoadScores(firstfile, prevfile):
     assert merged_shape[1] == 2*first_shape[1], "Unexpected number of significance scores after merging first and previous scores"
 
     # Compute prizes
-    merged_df["prize"] = merged_df.apply(CalcPrize, axis=1)
+    merged_df["prize"] = CalcPrizes(merged_df.values)
     return merged_df
 
 
+def LoadScoreFile(scorefile, cache_dir=None):
+    """Load a first or previous scores file, which has a commented header row
+    and peptides in the first column.  The parsed scores are loaded from the
+    cache directory if one is provided.  The peptides are always read as
+    strings so that the index is the same with and without the cache.
+
+    Return: data frame with the scores of each peptide
+    """
+    if cache_dir is None:
+        return pd.read_csv(scorefile, sep="\t", comment="#", header=None, dtype={0: str}).set_index(0)
+
+    arrays = ic.LoadCached(cache_dir, scorefile, "scores", ParseScoreArrays)
+    values = arrays["values"]
+    # The score columns are numbered from 1 because the peptides are column 0
+    return pd.DataFrame(np.array(values), index=arrays["peptides"].tolist(), columns=np.arange(1, values.shape[1] + 1))
+
+
+def ParseScoreArrays(scorefile):
+    """Parse a first or previous scores file into arrays
+
+    Return: a dict with the peptide names as a bytes array and the score
+    matrix
+    """
+    score_df = pd.read_csv(scorefile, sep="\t", comment="#", header=None, dtype={0: str}).set_index(0)
+    return dict(peptides=ic.StringTable(list(score_df.index)), values=score_df.values)
+
+
 def CalcPrize(row):
     """Compute the peptide prize as -log10(min p-value)"""
     return -np.log10(min(row))
 
 
+def CalcPrizes(scores):
+    """Compute the peptide prizes for a matrix of p-values with one row per
+    peptide.  The vectorized version of CalcPrize.
+    """
+    return -np.log10(np.min(scores, axis=1))
+
+
 def CreateParser():
     """Setup the option parser"""
     parser = ArgumentParser(description="Compute peptide prizes from the TPS first and previous scores files and map them to protein prizes.  See the TPS readme for the expected file formats.")
@@ -121,6 +416,9 @@ def CreateParser():
     parser.add_argument("--prevfile", type=str, dest="prevfile", help="The path and filename of the TPS prevscores file", default=None, required=True)
     parser.add_argument("--mapfile", type=str, dest="mapfile", help="The path and filename of the TPS peptidemap file", default=None, required=True)
     parser.add_argument("--outfile", type=str, dest="outfile", help="The path and filename of the output prize file.", default=None, required=True)
+    parser.add_argument("--cachedir", type=str, dest="cachedir", help="A directory for the binary cache of parsed input files (default is the PCSF_CACHE_DIR environment variable).  No cache is used if neither is set.", default=ic.DefaultCacheDir(), required=False)
+    parser.add_argument("--engine", type=str, dest="engine", choices=["vectorized", "iterative"], help="The implementation used to map peptide prizes to proteins (default vectorized).  Both produce identical prize files.", default="vectorized", required=False)
+    ins.AddProfileArgument(parser)
     return parser
 
 
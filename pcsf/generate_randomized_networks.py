@@ -1,33 +1,125 @@
 from argparse import ArgumentParser
-import os, sys, subprocess, tempfile
+from collections import namedtuple
+import itertools, math, os, shutil, sys, subprocess, tempfile
+import numpy as np
 import pandas
+import copy_streams as cs
+import instrumentation as ins
+
+# the number of edges read or written at a time
+DEFAULT_CHUNK_SIZE = 100000
+
+# the edges of one orientation as int32 ids into the node names of the
+# network and their float32 weights
+Subgraph = namedtuple('Subgraph', ['edges', 'weights'])
 
 def run(args):
     parser = setup_parser()
     options = parser.parse_args(args)
 
-    input_data = parse_file(options.network)
-    undirected_subgraph, directed_subgraph = partition_edges(input_data)
-
-    for i in range(1, options.copies + 1):
-        randomized_ug, randomized_dg = randomize(undirected_subgraph, directed_subgraph)
-        merged_network = merge_result(randomized_ug, randomized_dg)
-        merged_file, partial_model_file = make_output_filenames(options.network, options.outdir, i)
-
-        merged_network.to_csv(merged_file, sep = '\t', header = True, index = False)
-        save_partial_model(randomized_dg, partial_model_file)
-
-def randomize(undirected_subgraph, directed_subgraph):
-    randomized_ug = randomize_undirected(undirected_subgraph)
-    randomized_dg = randomize_directed(directed_subgraph)
-
-    add_randomized_weights(undirected_subgraph, randomized_ug)
-    add_randomized_weights(directed_subgraph, randomized_dg)
-
-    add_orientation_info(randomized_ug, 'U')
-    add_orientation_info(randomized_dg, 'D')
-
-    return randomized_ug, randomized_dg
+    if options.workers < 1:
+        raise RuntimeError("The number of workers must be positive")
+    if options.chunksize < 1:
+        raise RuntimeError("The chunk size must be positive")
+    if options.seed is None:
+        options.seed = cs.NewSeed()
+        print "Using seed {}".format(options.seed)
+
+    ins.Start('generate_randomized_networks', options.profileout, args)
+    ins.BeginPhase('parse')
+    node_names, undirected_subgraph, directed_subgraph = parse_network(options.network, options.chunksize)
+    ins.Count('edges', len(undirected_subgraph.edges) + len(directed_subgraph.edges))
+
+    # the randomize phase includes writing the copies, which is also
+    # recorded as its own write phase
+    ins.BeginPhase('randomize')
+    ins.Count('copies', options.copies)
+
+    if options.chain:
+        if options.backend != 'python':
+            raise RuntimeError("Chain sampling requires the python backend")
+        if options.workers > 1:
+            raise RuntimeError("Chain sampling generates the copies in a single process")
+        # the chain is one random stream, which does not overlap with
+        # the streams of the copies
+        overlap_curve = []
+        randomized_copies = randomize_chain(undirected_subgraph, directed_subgraph,
+                options.copies, options.thinning, options.tolerance, overlap_curve,
+                cs.CopyRandomState(options.seed, 0))
+        for i, (randomized_ug, randomized_dg) in enumerate(randomized_copies, 1):
+            with ins.Phase('write'):
+                save_copy(options.network, options.outdir, i, node_names, randomized_ug,
+                        randomized_dg, options.chunksize)
+        if options.overlapreport:
+            write_overlap_curve(options.overlapreport, overlap_curve)
+    else:
+        # each copy has its own random stream so that the copies do not
+        # depend on the number of workers
+        state = dict(node_names = node_names, undirected_subgraph = undirected_subgraph,
+                directed_subgraph = directed_subgraph, backend = options.backend,
+                seed = options.seed, network = options.network, outdir = options.outdir,
+                chunk_size = options.chunksize)
+        # the workers return the times of their write and Rscript phases
+        ins.Merge(cs.GenerateCopies(randomize_copy, range(1, options.copies + 1),
+                options.workers, init_copy_state, (state,)))
+
+    ins.Finish()
+
+# the data shared with the processes that generate the copies
+copy_state = None
+
+def init_copy_state(state):
+    global copy_state
+    copy_state = state
+
+def randomize_copy(i):
+    with ins.Collect() as profiler:
+        rng = cs.CopyRandomState(copy_state['seed'], i)
+        randomized_ug, randomized_dg = randomize(copy_state['node_names'],
+                copy_state['undirected_subgraph'], copy_state['directed_subgraph'],
+                copy_state['backend'], rng)
+        with ins.Phase('write'):
+            save_copy(copy_state['network'], copy_state['outdir'], i, copy_state['node_names'],
+                    randomized_ug, randomized_dg, copy_state['chunk_size'])
+    return profiler.Snapshot()
+
+def save_copy(network, outdir, i, node_names, randomized_ug, randomized_dg,
+        chunk_size = DEFAULT_CHUNK_SIZE):
+    merged_file, partial_model_file = make_output_filenames(network, outdir, i)
+
+    write_network(merged_file, node_names, randomized_ug, randomized_dg, chunk_size)
+    save_partial_model(partial_model_file, node_names, randomized_dg, chunk_size)
+
+def randomize(node_names, undirected_subgraph, directed_subgraph, backend = 'birewire', rng = None):
+    if rng is None:
+        rng = np.random.RandomState()
+    if backend == 'python':
+        randomized_ug = rewire_edges(undirected_subgraph.edges, directed = False, rng = rng)
+        randomized_dg = rewire_edges(directed_subgraph.edges, directed = True, rng = rng)
+    else:
+        # seed R from this copy's random stream
+        randomized_ug = randomize_undirected(node_names, undirected_subgraph.edges,
+                rng.randint(2**31 - 1))
+        randomized_dg = randomize_directed(node_names, directed_subgraph.edges,
+                rng.randint(2**31 - 1))
+
+    return (add_randomized_weights(undirected_subgraph, randomized_ug, rng),
+            add_randomized_weights(directed_subgraph, randomized_dg, rng))
+
+def randomize_chain(undirected_subgraph, directed_subgraph, copies, thinning = None,
+        tolerance = 0.01, overlap_curve = None, rng = None):
+    if rng is None:
+        rng = np.random.RandomState()
+    undirected_copies = sample_chain(undirected_subgraph.edges, False, copies, thinning,
+            tolerance, rng, overlap_curve, 'undirected')
+    directed_copies = sample_chain(directed_subgraph.edges, True, copies, thinning,
+            tolerance, rng, overlap_curve, 'directed')
+
+    # izip so that each copy is written and released before the next one is
+    # sampled
+    for randomized_ug, randomized_dg in itertools.izip(undirected_copies, directed_copies):
+        yield (add_randomized_weights(undirected_subgraph, randomized_ug, rng),
+                add_randomized_weights(directed_subgraph, randomized_dg, rng))
 
 def make_output_filenames(input_file, outdir, i):
     input_prefix, extension = os.path.splitext(input_file)
@@ -41,101 +133,358 @@ def make_output_filenames(input_file, outdir, i):
 
     return network_file, partial_model_file
 
-def save_partial_model(network, filename):
-    network_in_sif = network[['id1', 'orientation', 'id2']]
-    network_in_sif['orientation'] = 'N'
-    network_in_sif.to_csv(filename, sep = '\t', header = False, index = False)
-
-def parse_file(input_file):
-    return pandas.read_csv(input_file, sep = "\t")
-
-def parse_undirected_output(f):
-    return pandas.read_csv(f, sep = ' ', header = None,
-            names = ['id1', 'id2'])
-
-def parse_directed_output(f):
-    data = pandas.read_csv(f, sep = ' ', header = None, 
-            names = ['id1', 'orientation', 'id2'])
-    # remove bogus negative edges introduced to make BiRewire work.
-    data = data[data.orientation == '+']
-    return data[['id1', 'id2']]
-
-def partition_edges(input_data):
-    undirected_subgraph = input_data[input_data.orientation == 'U']
-    directed_subgraph = input_data[input_data.orientation == 'D']
-    return undirected_subgraph, directed_subgraph
-
-def randomize_undirected(undirected_subgraph):
-    input_file = prepare_undirected_input(undirected_subgraph)
-    output_file = make_temp_file('undirected_birewire_output')
-
-    subprocess.check_call([
-        'Rscript',
-        'pcsf/randomizeUndirectedNetwork.R', 
-        input_file, 
-        output_file])
-
-    randomized_graph = parse_undirected_output(output_file)
-
-    os.remove(input_file)
-    os.remove(output_file)
-
-    return randomized_graph
-
-def prepare_undirected_input(undirected_subgraph):
+def parse_network(input_file, chunk_size = DEFAULT_CHUNK_SIZE):
+    # read the network in chunks, interning each protein name once and
+    # keeping only the int32 node ids and float32 weights of the edges
+    node_ids = {}
+    node_names = []
+    edges = {'U': [], 'D': []}
+    weights = {'U': [], 'D': []}
+    chunks = pandas.read_csv(input_file, sep = '\t', chunksize = chunk_size,
+            dtype = {'id1': str, 'id2': str, 'weight': np.float32})
+    for chunk in chunks:
+        codes, chunk_names = pandas.factorize(pandas.concat([chunk['id1'], chunk['id2']]))
+        chunk_ids = np.empty(len(chunk_names), dtype = np.int32)
+        for code, name in enumerate(chunk_names):
+            if not name in node_ids:
+                node_ids[name] = len(node_names)
+                node_names.append(name)
+            chunk_ids[code] = node_ids[name]
+        chunk_edges = chunk_ids[codes].reshape(2, -1).T
+        chunk_weights = chunk['weight'].values
+        orientation = chunk['orientation'].values
+        for label in edges:
+            selected = orientation == label
+            edges[label].append(chunk_edges[selected])
+            weights[label].append(chunk_weights[selected])
+
+    node_names = np.array(node_names, dtype = object)
+    return node_names, make_subgraph(edges['U'], weights['U']), make_subgraph(edges['D'], weights['D'])
+
+def make_subgraph(edge_chunks, weight_chunks):
+    if len(edge_chunks) == 0:
+        return Subgraph(np.zeros((0, 2), dtype = np.int32), np.zeros(0, dtype = np.float32))
+    return Subgraph(np.concatenate(edge_chunks), np.concatenate(weight_chunks))
+
+def write_network(filename, node_names, undirected_subgraph, directed_subgraph,
+        chunk_size = DEFAULT_CHUNK_SIZE):
+    with open(filename, 'w') as f:
+        f.write('id1\tid2\tweight\torientation\n')
+        for subgraph, orientation in [(undirected_subgraph, 'U'), (directed_subgraph, 'D')]:
+            for start in range(0, len(subgraph.edges), chunk_size):
+                chunk = subgraph.edges[start:start + chunk_size]
+                weights = subgraph.weights[start:start + chunk_size].astype(str)
+                f.write(''.join('{}\t{}\t{}\t{}\n'.format(source, target, weight, orientation)
+                    for source, target, weight in zip(node_names[chunk[:, 0]],
+                        node_names[chunk[:, 1]], weights)))
+
+def write_edges(f, node_names, edges, sep, label = None, chunk_size = DEFAULT_CHUNK_SIZE):
+    # write each edge as "source target" or "source label target"
+    for start in range(0, len(edges), chunk_size):
+        chunk = edges[start:start + chunk_size]
+        columns = [node_names[chunk[:, 0]], node_names[chunk[:, 1]]]
+        if label is not None:
+            columns.insert(1, [label] * len(chunk))
+        f.write(''.join(sep.join(row) + '\n' for row in zip(*columns)))
+
+def save_partial_model(filename, node_names, subgraph, chunk_size = DEFAULT_CHUNK_SIZE):
+    with open(filename, 'w') as f:
+        write_edges(f, node_names, subgraph.edges, '\t', 'N', chunk_size)
+
+def parse_birewire_output(f, node_names, names, chunk_size = DEFAULT_CHUNK_SIZE):
+    # map the node names in a BiRewire output file back to node ids
+    node_index = pandas.Index(node_names)
+    edge_chunks = []
+    chunks = pandas.read_csv(f, sep = ' ', header = None, names = names,
+            dtype = str, chunksize = chunk_size)
+    for chunk in chunks:
+        if 'orientation' in names:
+            # remove bogus negative edges introduced to make BiRewire work.
+            chunk = chunk[chunk.orientation == '+']
+        edge_chunks.append(np.column_stack([
+            node_index.get_indexer(chunk['id1']),
+            node_index.get_indexer(chunk['id2'])]).astype(np.int32))
+    if len(edge_chunks) == 0:
+        return np.zeros((0, 2), dtype = np.int32)
+    return np.concatenate(edge_chunks)
+
+def randomize_undirected(node_names, edges, r_seed = None):
+    # each call uses its own temporary directory so that concurrent
+    # copies do not share files
+    temp_dir = tempfile.mkdtemp(prefix = 'birewire')
+    try:
+        input_file = prepare_undirected_input(node_names, edges, temp_dir)
+        output_file = make_temp_file('undirected_birewire_output', temp_dir)
+
+        with ins.Phase('rscript'):
+            subprocess.check_call([
+                'Rscript',
+                'pcsf/randomizeUndirectedNetwork.R', 
+                input_file, 
+                output_file] + r_seed_args(r_seed))
+
+        randomized_edges = parse_birewire_output(output_file, node_names, ['id1', 'id2'])
+    finally:
+        shutil.rmtree(temp_dir)
+
+    return randomized_edges
+
+def r_seed_args(r_seed):
+    if r_seed is None:
+        return []
+    return [str(r_seed)]
+
+def prepare_undirected_input(node_names, edges, temp_dir = '.'):
     # save an (undirected) edgelist for igraph
-    undirected_edgelist = undirected_subgraph[['id1', 'id2']]
-    input_filename = make_temp_file('undirected_birewire_input')
-    undirected_edgelist.to_csv(input_filename, sep = ' ', header = False, index = False)
+    input_filename = make_temp_file('undirected_birewire_input', temp_dir)
+    with open(input_filename, 'w') as f:
+        write_edges(f, node_names, edges, ' ')
     return input_filename
 
-def randomize_directed(directed_subgraph):
-    input_file = prepare_directed_input(directed_subgraph)
-    output_file = make_temp_file('directed_birewire_output')
-    subprocess.check_call([
-        'Rscript',
-        'pcsf/randomizeDirectedNetwork.R', 
-        input_file, 
-        output_file])
-
-    randomized_graph = parse_directed_output(output_file)
-
-    os.remove(input_file)
-    os.remove(output_file)
-
-    return randomized_graph
-
-def prepare_directed_input(directed_subgraph):
+def randomize_directed(node_names, edges, r_seed = None):
+    temp_dir = tempfile.mkdtemp(prefix = 'birewire')
+    try:
+        input_file = prepare_directed_input(node_names, edges, temp_dir)
+        output_file = make_temp_file('directed_birewire_output', temp_dir)
+        with ins.Phase('rscript'):
+            subprocess.check_call([
+                'Rscript',
+                'pcsf/randomizeDirectedNetwork.R', 
+                input_file, 
+                output_file] + r_seed_args(r_seed))
+
+        randomized_edges = parse_birewire_output(output_file, node_names,
+                ['id1', 'orientation', 'id2'])
+    finally:
+        shutil.rmtree(temp_dir)
+
+    return randomized_edges
+
+def prepare_directed_input(node_names, edges, temp_dir = '.'):
     # save SIF for BiRewire and add pseudo negative edges to make it work
-    cols = ['id1', 'orientation', 'id2']
-    positive_edgelist = directed_subgraph[cols]
-    positive_edgelist['orientation'] = '+'
-    pseudo_negative_edgelist = pandas.DataFrame(
-            [
-                ["PSEUDO_NEG1", "-", "PSEUDO_NEG2"], 
-                ["PSEUDO_NEG3", "-", "PSEUDO_NEG4"]
-            ], 
-            columns = cols)
-    edgelist = positive_edgelist.append(pseudo_negative_edgelist)
-
-    input_filename = make_temp_file('directed_birewire_input')
-    edgelist.to_csv(input_filename, sep = ' ', header = False, index = False)
+    input_filename = make_temp_file('directed_birewire_input', temp_dir)
+    with open(input_filename, 'w') as f:
+        write_edges(f, node_names, edges, ' ', '+')
+        f.write('PSEUDO_NEG1 - PSEUDO_NEG2\n')
+        f.write('PSEUDO_NEG3 - PSEUDO_NEG4\n')
     return input_filename
 
-def add_randomized_weights(original_graph, randomized_graph):
-    nb_rand_edges = randomized_graph.shape[0]
-    sampled_weights = original_graph['weight'].sample(n = nb_rand_edges, replace
-            = False).reset_index(drop=True)
-    randomized_graph['weight'] = sampled_weights
-
-def add_orientation_info(df, orientation):
-    df['orientation'] = orientation
-
-def merge_result(undirected_graph, directed_graph):
-    return pandas.concat([undirected_graph, directed_graph])
-
-def make_temp_file(label):
-    _, fn = tempfile.mkstemp(suffix = label, dir = '.')
+def rewire_edges(edges, directed, rng = None):
+    # degree-preserving randomization in this process without BiRewire
+    edges = simple_edges(edges, directed)
+    n_switches = analytic_switch_count(len(edges), count_nodes(edges), directed)
+    return switch_edges(edges, n_switches, directed, rng)
+
+def count_nodes(edges):
+    return len(np.unique(edges))
+
+def simple_edges(edges, directed):
+    # drop the self edges and repeated edges, which the python backend
+    # cannot switch, keeping the first copy of each repeated edge
+    not_self = edges[:, 0] != edges[:, 1]
+    self_count = len(edges) - np.count_nonzero(not_self)
+    edges = edges[not_self]
+    keys = edge_keys(edges, edges.max() + 1 if len(edges) > 0 else 0, directed)
+    unique_keys, first = np.unique(keys, return_index = True)
+    repeated_count = len(edges) - len(first)
+    if self_count > 0 or repeated_count > 0:
+        print "Dropped {} self edges and {} repeated edges from the {} edges".format(
+                self_count, repeated_count, 'directed' if directed else 'undirected')
+        edges = edges[np.sort(first)]
+    return edges
+
+def edge_keys(edges, n_nodes, directed):
+    # a unique integer for each edge, which ignores the order of the nodes
+    # in undirected edges
+    source = edges[:, 0].astype(np.int64)
+    target = edges[:, 1].astype(np.int64)
+    if not directed:
+        source, target = np.minimum(source, target), np.maximum(source, target)
+    return source * n_nodes + target
+
+def analytic_switch_count(n_edges, n_nodes, directed):
+    # the number of successful switches needed to make the rewired graph
+    # independent of the original graph, using the same form of bound as
+    # BiRewire: e / (2 (1 - d)) * ln((1 - d) e) for e edges and density d
+    if n_edges < 2:
+        return 0
+    possible_edges = n_nodes * (n_nodes - 1)
+    if not directed:
+        possible_edges /= 2
+    density = float(n_edges) / possible_edges
+    if density >= 1:
+        return 0
+    return int(math.ceil(n_edges / (2 * (1 - density)) *
+        max(math.log((1 - density) * n_edges), 1)))
+
+def switch_edges(edges, n_switches, directed, rng = None):
+    chain = EdgeSwitchChain(edges, directed, rng)
+    chain.switch(n_switches)
+    chain.report_failures('{} rewiring'.format('directed' if directed else 'undirected'))
+    return chain.edges()
+
+class EdgeSwitchChain(object):
+    # A Markov chain over graphs with the same degrees as the original graph.
+    # Each step picks two edges a-b and c-d and replaces them with a-d and c-b,
+    # rejecting switches that would create self edges or repeated edges.
+    # Switching preserves the degree of every node, or the in-degree and
+    # out-degree for directed edges.  Undirected edges are switched in a
+    # random orientation so that a-c and b-d can also be created.
+
+    def __init__(self, edges, directed, rng = None, max_attempts_factor = 100):
+        if rng is None:
+            rng = np.random.RandomState()
+        self.rng = rng
+        self.directed = directed
+        self.max_attempts_factor = max_attempts_factor
+        self.n_edges = len(edges)
+        self.n_nodes = int(edges.max()) + 1 if self.n_edges > 0 else 0
+        self.source = edges[:, 0].tolist()
+        self.target = edges[:, 1].tolist()
+        self.edge_set = set(edge_keys(edges, self.n_nodes, directed).tolist())
+        # the requested and successful switches since the last report
+        self.requested = 0
+        self.succeeded = 0
+
+    def key(self, u, v):
+        if not self.directed and u > v:
+            u, v = v, u
+        return u * self.n_nodes + v
+
+    def switch(self, n_switches):
+        # make n_switches successful switches unless too many are rejected
+        if self.n_edges < 2 or n_switches == 0:
+            return 0
+        source, target, edge_set, key = self.source, self.target, self.edge_set, self.key
+
+        successes = 0
+        attempts = 0
+        max_attempts = self.max_attempts_factor * n_switches
+        while successes < n_switches and attempts < max_attempts:
+            # draw the random edge pairs in batches
+            batch = min(max(n_switches - successes, 1024), max_attempts - attempts)
+            firsts = self.rng.randint(self.n_edges, size = batch).tolist()
+            seconds = self.rng.randint(self.n_edges, size = batch).tolist()
+            flips = self.rng.randint(2, size = batch).tolist()
+            attempts += batch
+
+            for i, j, flip in zip(firsts, seconds, flips):
+                if i == j:
+                    continue
+                a, b = source[i], target[i]
+                c, d = source[j], target[j]
+                if not self.directed and flip:
+                    c, d = d, c
+                if a == d or c == b:
+                    continue
+                new_key1 = key(a, d)
+                new_key2 = key(c, b)
+                if new_key1 in edge_set or new_key2 in edge_set:
+                    continue
+                edge_set.remove(key(a, b))
+                edge_set.remove(key(c, d))
+                edge_set.add(new_key1)
+                edge_set.add(new_key2)
+                source[i], target[i] = a, d
+                source[j], target[j] = c, b
+                successes += 1
+                if successes == n_switches:
+                    break
+
+        self.requested += n_switches
+        self.succeeded += successes
+        return successes
+
+    def report_failures(self, phase):
+        # report the failed switches once per phase instead of once per call
+        if self.succeeded < self.requested:
+            print "Only {} of {} edge switches succeeded during {}".format(
+                    self.succeeded, self.requested, phase)
+        self.requested = 0
+        self.succeeded = 0
+
+    def edges(self):
+        return np.array([self.source, self.target], dtype = np.int32).T
+
+    def edge_key_set(self):
+        return set(self.edge_set)
+
+    def overlap(self, reference_keys):
+        # the fraction of the current edges that are in a reference graph
+        if self.n_edges == 0:
+            return 1.0
+        return len(self.edge_set & reference_keys) / float(self.n_edges)
+
+def sample_chain(edges, directed, copies, thinning = None, tolerance = 0.01,
+        rng = None, overlap_curve = None, label = ''):
+    # Generate randomized copies of the edges of a subgraph from a single edge switching
+    # chain.  The chain is burned in once with the analytic number of
+    # switches, and then a copy is emitted every thinning switches.  If the
+    # thinning interval is not provided, it is chosen from the decay of the
+    # overlap with the burned in graph, stopping when the overlap is within
+    # the tolerance of the overlap between the original and burned in
+    # graphs, which is the expected overlap of independent samples.  The
+    # overlap curve is appended to overlap_curve as
+    # (label, phase, switches, overlap) tuples.
+    if overlap_curve is None:
+        overlap_curve = []
+    edges = simple_edges(edges, directed)
+    chain = EdgeSwitchChain(edges, directed, rng)
+    burn_in = analytic_switch_count(len(edges), count_nodes(edges), directed)
+    step = max(1, burn_in // 50)
+
+    # burn in while tracking the overlap with the original graph
+    original_keys = chain.edge_key_set()
+    switches = 0
+    overlap_curve.append((label, 'burnin', 0, 1.0))
+    while switches < burn_in:
+        # stop early if no switches are possible
+        switches += chain.switch(min(step, burn_in - switches)) or burn_in
+        overlap_curve.append((label, 'burnin', switches, chain.overlap(original_keys)))
+    stationary_overlap = chain.overlap(original_keys)
+    chain.report_failures('{} burn in'.format(label))
+
+    # the first thinning interval calibrates the thinning if needed
+    if thinning is None:
+        reference_keys = chain.edge_key_set()
+        thinning = 0
+        overlap_curve.append((label, 'thinning', 0, 1.0))
+        while thinning < burn_in:
+            thinning += chain.switch(step) or burn_in
+            overlap = chain.overlap(reference_keys)
+            overlap_curve.append((label, 'thinning', thinning, overlap))
+            if overlap <= stationary_overlap + tolerance:
+                break
+        thinning = max(thinning, 1)
+        print "Using {} switches between {} copies after {} burn in switches".format(thinning, label, burn_in)
+    else:
+        chain.switch(thinning)
+
+    for copy in range(copies):
+        if copy > 0:
+            chain.switch(thinning)
+        if copy == copies - 1:
+            # the consumer may not resume the generator after the last copy
+            chain.report_failures('{} thinning'.format(label))
+        yield chain.edges()
+
+def write_overlap_curve(filename, overlap_curve):
+    with open(filename, 'w') as f:
+        f.write('subgraph\tphase\tswitches\toverlap\n')
+        for label, phase, switches, overlap in overlap_curve:
+            f.write('{}\t{}\t{}\t{:f}\n'.format(label, phase, switches, overlap))
+
+def add_randomized_weights(original_subgraph, randomized_edges, rng = None):
+    # sample the weights without replacement, drawing from the random state
+    # in the same way as pandas.Series.sample
+    if rng is None:
+        rng = np.random.RandomState()
+    sampled = rng.choice(len(original_subgraph.weights), size = len(randomized_edges), replace = False)
+    return Subgraph(randomized_edges, original_subgraph.weights[sampled])
+
+def make_temp_file(label, temp_dir = '.'):
+    fd, fn = tempfile.mkstemp(suffix = label, dir = temp_dir)
+    os.close(fd)
     return fn
 
 def setup_parser():
@@ -143,6 +492,15 @@ def setup_parser():
     parser.add_argument("--network", type=str, dest="network", help="Background network file in tsv format.", default=None, required=True)
     parser.add_argument("--outdir", type=str, dest="outdir", help="Output directory for randomized files", default=None, required=False)
     parser.add_argument("--copies", type=int, dest="copies", help="The number of subsampled copies to generate (default 10).", default=10, required=False)
+    parser.add_argument("--seed", type=int, dest="seed", help="A seed for the pseudo-random number generator. Each copy has its own random stream derived from the seed and copy index.", default=None, required=False)
+    parser.add_argument("--workers", type=int, dest="workers", help="The number of processes used to generate copies (default 1). The copies do not depend on the number of workers.", default=1, required=False)
+    parser.add_argument("--chain", action="store_true", dest="chain", help="Generate all copies from a single edge switching chain with the python backend. The chain is burned in once and a copy is emitted every thinning switches.", default=False)
+    parser.add_argument("--thinning", type=int, dest="thinning", help="The number of switches between chain copies (default is chosen from the decay of the edge overlap).", default=None, required=False)
+    parser.add_argument("--tolerance", type=float, dest="tolerance", help="The thinning interval ends when the overlap with the previous copy is within this tolerance of the overlap between the original and burned in networks (default 0.01).", default=0.01, required=False)
+    parser.add_argument("--overlapreport", type=str, dest="overlapreport", help="A file for the edge overlap curves of the chain burn in and thinning calibration (optional).", default=None, required=False)
+    parser.add_argument("--chunksize", type=int, dest="chunksize", help="The number of edges read or written at a time (default 100000).", default=DEFAULT_CHUNK_SIZE, required=False)
+    parser.add_argument("--backend", type=str, dest="backend", choices=['python', 'birewire'], help="The degree-preserving edge switching implementation (default birewire). The birewire backend calls BiRewire with Rscript, and the python backend switches the edges in this process without R.", default='birewire', required=False)
+    ins.AddProfileArgument(parser)
     return parser
 
 if __name__ == '__main__':
@@ -0,0 +1,133 @@
+import hashlib, json, os, shutil, tempfile
+import numpy as np
+
+__author__ = "Anthony Gitter"
+
+# Increment when the format of the cached arrays changes so that old cache
+# entries are no longer used
+CACHE_VERSION = 1
+
+# The environment variable that sets the default cache directory
+CACHE_DIR_VARIABLE = "PCSF_CACHE_DIR"
+
+# The name of the file that lists the arrays in a cache entry
+MANIFEST_FILE = "manifest.json"
+
+def DefaultCacheDir():
+    """The cache directory from the PCSF_CACHE_DIR environment variable, which
+    is used when a script is not given a cache directory.  Returns None, which
+    disables caching, if the variable is not set.
+    """
+    cache_dir = os.environ.get(CACHE_DIR_VARIABLE)
+    if cache_dir == "":
+        return None
+    return cache_dir
+
+
+def FileDigest(filename):
+    """Hash the contents of a file
+
+    Return: the hex digest string
+    """
+    sha = hashlib.sha1()
+    with open(filename, "rb") as in_f:
+        for block in iter(lambda: in_f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def LoadCached(cache_dir, source_file, kind, build):
+    """Load the arrays parsed from a source file from the cache, or parse them
+    with build and add them to the cache.  Entries are keyed by the kind of
+    parsed data and the hash of the source file contents, so an entry is never
+    used after the source file changes.  Older entries for the same source
+    file are removed when a new entry is written.  The arrays are
+    memory-mapped when loaded from the cache.  No cache is used if cache_dir
+    is None.
+
+    build is a function that takes the source file name and returns a dict
+    that maps names to numpy arrays, which must not have the object dtype.
+
+    Return: a dict that maps names to numpy arrays
+    """
+    if cache_dir is None:
+        return build(source_file)
+
+    digest = FileDigest(source_file)
+    entry = os.path.join(cache_dir, "{}-v{}-{}".format(kind, CACHE_VERSION, digest))
+    if os.path.isfile(os.path.join(entry, MANIFEST_FILE)):
+        return LoadEntry(entry)
+
+    arrays = build(source_file)
+    WriteEntry(cache_dir, entry, kind, source_file, arrays)
+    return arrays
+
+
+def LoadEntry(entry):
+    """Memory-map the arrays in a cache entry
+
+    Return: a dict that maps names to numpy arrays
+    """
+    with open(os.path.join(entry, MANIFEST_FILE)) as manifest_f:
+        manifest = json.load(manifest_f)
+    return dict((str(name), np.load(os.path.join(entry, name + ".npy"), mmap_mode="r")) for name in manifest["arrays"])
+
+
+def WriteEntry(cache_dir, entry, kind, source_file, arrays):
+    """Write the arrays to a new cache entry.  The entry is written to a
+    temporary directory and renamed so that concurrent jobs never load a
+    partially written entry.
+    """
+    if not os.path.isdir(cache_dir):
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            # Another job may have created the directory
+            if not os.path.isdir(cache_dir):
+                raise
+
+    source_path = os.path.abspath(source_file)
+    tmp_entry = tempfile.mkdtemp(dir=cache_dir, prefix=".tmp-")
+    try:
+        for name, array in arrays.iteritems():
+            assert array.dtype != object, "Cannot cache object arrays"
+            np.save(os.path.join(tmp_entry, name + ".npy"), array)
+        manifest = {"kind": kind, "source": source_path, "arrays": sorted(arrays.keys())}
+        with open(os.path.join(tmp_entry, MANIFEST_FILE), "w") as manifest_f:
+            json.dump(manifest, manifest_f)
+        os.rename(tmp_entry, entry)
+    except OSError:
+        # Another job may have written the same entry first
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+        if not os.path.isdir(entry):
+            raise
+        return
+
+    RemoveStaleEntries(cache_dir, entry, kind, source_path)
+
+
+def RemoveStaleEntries(cache_dir, current_entry, kind, source_path):
+    """Remove the other entries of this kind that were parsed from an older
+    version of the same source file
+    """
+    for name in os.listdir(cache_dir):
+        entry = os.path.join(cache_dir, name)
+        if entry == current_entry or not name.startswith(kind + "-"):
+            continue
+        try:
+            with open(os.path.join(entry, MANIFEST_FILE)) as manifest_f:
+                manifest = json.load(manifest_f)
+        except (IOError, ValueError):
+            continue
+        if manifest.get("kind") == kind and manifest.get("source") == source_path:
+            print "Removing stale cache entry {}".format(entry)
+            shutil.rmtree(entry, ignore_errors=True)
+
+
+def StringTable(strings):
+    """Store a list of strings as a fixed-width bytes array
+
+    Return: a numpy array
+    """
+    # An empty table still needs a non-zero width
+    return np.array(list(strings), dtype="S{}".format(max([1] + [len(s) for s in strings])))
@@ -0,0 +1,295 @@
+import glob, json, os, platform, resource, sys, time
+from argparse import ArgumentParser
+from collections import defaultdict
+from contextlib import contextmanager
+import numpy as np
+
+__author__ = "Anthony Gitter"
+
+# Profile records written to standard output start with this prefix so that
+# they can be found in the HTCondor job logs
+PROFILE_PREFIX = "PCSF_PROFILE "
+
+# The profiler of the script that is running in this process
+active = None
+
+class Profiler(object):
+    """Record the wall and cpu time of the phases of a script, such as parsing
+    the input, computing, and writing the output, the number of rows or edges
+    processed, and the peak resident set size.  A disabled profiler only
+    tracks the name of the current phase so that profiling has no cost unless
+    it was requested.
+    """
+    def __init__(self, script, outFile=None, argList=None, enabled=None):
+        self.script = script
+        self.outFile = outFile
+        self.enabled = outFile is not None if enabled is None else enabled
+        self.argList = list(argList) if argList is not None else []
+        # The wall time, cpu time, and number of calls of each phase
+        self.phases = defaultdict(lambda: [0.0, 0.0, 0])
+        self.counts = defaultdict(int)
+        self.current = None
+        self.startWall = time.time()
+        self.startCpu = CpuTime()
+        self.phaseStart = None
+
+    def BeginPhase(self, name):
+        """End the current top level phase and start a new one"""
+        self.EndPhase()
+        self.current = name
+        if self.enabled:
+            self.phaseStart = (time.time(), CpuTime())
+
+    def EndPhase(self):
+        """End the current top level phase if there is one"""
+        if self.current is not None and self.enabled:
+            self.AddTime(self.current, time.time() - self.phaseStart[0], CpuTime() - self.phaseStart[1])
+        self.current = None
+
+    def AddTime(self, name, wall, cpu, calls=1):
+        phase = self.phases[name]
+        phase[0] += wall
+        phase[1] += cpu
+        phase[2] += calls
+
+    def Count(self, name, number):
+        """Add to the number of rows, edges, or other items processed"""
+        if self.enabled:
+            self.counts[name] += number
+
+    def Snapshot(self):
+        """The phase times and counts, which can be returned from a worker
+        process and merged into the profiler of the main process
+
+        Return: a dictionary
+        """
+        return dict(phases=dict((name, list(phase)) for name, phase in self.phases.items()), counts=dict(self.counts))
+
+    def Merge(self, snapshot):
+        """Add the phase times and counts of a snapshot"""
+        for name, (wall, cpu, calls) in snapshot["phases"].items():
+            self.AddTime(name, wall, cpu, calls)
+        for name, number in snapshot["counts"].items():
+            self.counts[name] += number
+
+    def Record(self):
+        """Summarize the run.  Phases that run in worker processes are summed
+        over the workers, and nested phases such as Rscript calls are also
+        part of the phase that contains them.
+
+        Return: a dictionary that can be written as json
+        """
+        wall = time.time() - self.startWall
+        phases = dict((name, dict(wall=phaseWall, cpu=phaseCpu, calls=calls)) \
+            for name, (phaseWall, phaseCpu, calls) in self.phases.items())
+        throughput = dict((name, number / wall if wall > 0 else 0.0) for name, number in self.counts.items())
+        return dict(script=self.script, args=self.argList, host=platform.node(), pid=os.getpid(), \
+            start=self.startWall, wall=wall, cpu=CpuTime() - self.startCpu, peak_rss_mb=PeakRSS(), \
+            children_peak_rss_mb=PeakRSS(resource.RUSAGE_CHILDREN), phases=phases, counts=dict(self.counts), \
+            throughput=throughput)
+
+    def Write(self):
+        """Append the json record of the run to the output file as a single
+        line, or write it to standard output with the profile prefix if the
+        output file is -
+        """
+        line = json.dumps(self.Record(), sort_keys=True)
+        if self.outFile == "-":
+            print PROFILE_PREFIX + line
+        else:
+            with open(self.outFile, "a") as f:
+                f.write(line + "\n")
+
+
+def Start(script, outFile=None, argList=None):
+    """Create the profiler for a script and make it the active profiler
+
+    Return: the Profiler
+    """
+    global active
+    active = Profiler(script, outFile, argList)
+    return active
+
+
+def Finish():
+    """End the last phase of the active profiler and write its record if
+    profiling was requested
+    """
+    global active
+    if active is None:
+        return
+    active.EndPhase()
+    if active.enabled:
+        active.Write()
+    active = None
+
+
+def BeginPhase(name):
+    """Start a top level phase of the active profiler"""
+    if active is not None:
+        active.BeginPhase(name)
+
+
+def Count(name, number):
+    """Add to a count of the active profiler"""
+    if active is not None:
+        active.Count(name, number)
+
+
+@contextmanager
+def Phase(name):
+    """Time a block as a phase of the active profiler.  The block may be part
+    of a top level phase, such as a subprocess call.
+    """
+    if active is None or not active.enabled:
+        yield
+        return
+    startWall = time.time()
+    startCpu = CpuTime()
+    try:
+        yield
+    finally:
+        active.AddTime(name, time.time() - startWall, CpuTime() - startCpu)
+
+
+@contextmanager
+def Collect():
+    """Profile a block with a new profiler, such as the work done for one copy
+    in a worker process, and then restore the active profiler.  The snapshot
+    of the block's profiler can be merged into the main profiler.
+
+    Yield: the block's Profiler
+    """
+    global active
+    previous = active
+    enabled = previous is not None and previous.enabled
+    active = Profiler(previous.script if previous is not None else None, enabled=enabled)
+    try:
+        yield active
+    finally:
+        active = previous
+
+
+def Merge(snapshots):
+    """Merge snapshots from worker processes into the active profiler"""
+    if active is None or not active.enabled:
+        return
+    for snapshot in snapshots:
+        if snapshot is not None:
+            active.Merge(snapshot)
+
+
+def CpuTime():
+    """The user and system cpu time of this process and its finished child
+    processes, such as multiprocessing workers and Rscript
+    """
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime + children.ru_utime + children.ru_stime
+
+
+def PeakRSS(who=resource.RUSAGE_SELF):
+    """The peak resident set size of this process, or of its largest finished
+    child process, in MB
+    """
+    peak = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    if sys.platform == "darwin":
+        return peak / (1024.0 * 1024.0)
+    return peak / 1024.0
+
+
+def Main(argList):
+    """Parse the arguments, which either come from the command line or a list
+    provided by the Python code calling this function
+    """
+    parser = CreateParser()
+    options = parser.parse_args(argList)
+
+    logFiles = sorted(set(f for pattern in options.logs for f in glob.glob(pattern)))
+    records = list(LoadRecords(logFiles))
+    if len(records) == 0:
+        raise RuntimeError("No profile records found in %s" % " ".join(options.logs))
+    print "%d profile records found in %d files" % (len(records), len(logFiles))
+
+    WritePhaseSummary(options.outfile + "_phases.txt", records)
+    WriteCountSummary(options.outfile + "_counts.txt", records)
+
+
+def LoadRecords(logFiles):
+    """Iterate over the profile records in files written with --profileout or
+    job logs that contain the standard output of the scripts
+    """
+    for logFile in logFiles:
+        with open(logFile) as f:
+            for line in f:
+                if line.startswith(PROFILE_PREFIX):
+                    line = line[len(PROFILE_PREFIX):]
+                elif not line.startswith("{"):
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(record, dict) and "script" in record:
+                    yield record
+
+
+def WritePhaseSummary(outFile, records):
+    """Write the run time of each script and phase summarized over the runs.
+    The total phase is the entire run and also has the peak RSS.
+    """
+    phaseTimes = defaultdict(list)
+    peakRss = defaultdict(list)
+    for record in records:
+        phaseTimes[(record["script"], "total")].append((record["wall"], record["cpu"]))
+        peakRss[record["script"]].append(max(record["peak_rss_mb"], record["children_peak_rss_mb"]))
+        for name, phase in record["phases"].items():
+            phaseTimes[(record["script"], name)].append((phase["wall"], phase["cpu"]))
+
+    with open(outFile, "w") as f:
+        f.write("Script\tPhase\tRuns\tTotalWall\tMeanWall\tMaxWall\tTotalCpu\tMeanCpu\tMedianPeakRSSMB\tMaxPeakRSSMB\n")
+        for (script, name), times in sorted(phaseTimes.items()):
+            times = np.array(times)
+            rss = "\tNA\tNA"
+            if name == "total":
+                rss = "\t%f\t%f" % (np.median(peakRss[script]), np.max(peakRss[script]))
+            f.write("%s\t%s\t%d\t%f\t%f\t%f\t%f\t%f%s\n" % (script, name, len(times), times[:, 0].sum(), \
+                times[:, 0].mean(), times[:, 0].max(), times[:, 1].sum(), times[:, 1].mean(), rss))
+
+
+def WriteCountSummary(outFile, records):
+    """Write the number of rows, edges, or other items that each script
+    processed and its throughput in items per second summarized over the runs
+    """
+    counts = defaultdict(list)
+    for record in records:
+        for name, number in record["counts"].items():
+            counts[(record["script"], name)].append((number, record["throughput"][name]))
+
+    with open(outFile, "w") as f:
+        f.write("Script\tCount\tRuns\tTotal\tMean\tMeanThroughput\tMinThroughput\n")
+        for (script, name), values in sorted(counts.items()):
+            values = np.array(values, dtype=float)
+            f.write("%s\t%s\t%d\t%d\t%f\t%f\t%f\n" % (script, name, len(values), values[:, 0].sum(), \
+                values[:, 0].mean(), values[:, 1].mean(), values[:, 1].min()))
+
+
+def AddProfileArgument(parser):
+    """Add the option for the profile output file shared by the pcsf scripts"""
+    parser.add_argument("--profileout", "--profile-out", type=str, dest="profileout", help="Append a json record of the wall and cpu time of each phase, peak memory, and rows or edges processed to this file, or write it to standard output if the file is - (optional).  instrumentation.py summarizes the records of many runs.", default=None, required=False)
+
+
+def CreateParser():
+    """Setup the option parser"""
+    parser = ArgumentParser(description="Summarize the profile records of many pcsf script runs.")
+    parser.add_argument("--logs", type=str, dest="logs", nargs="+", help="Filename patterns that match the --profileout files or job logs that contain the profile records written to standard output.", default=None, required=True)
+    parser.add_argument("--outfile", type=str, dest="outfile", help="The path and filename prefix of the output.  Does not include an extension.", default=None, required=True)
+    return parser
+
+
+if __name__ == "__main__":
+    """Use the command line arguments to setup the options
+    (the same as the default ArgumentParser behavior)
+    """
+    Main(sys.argv[1:])
@@ -1,6 +1,11 @@
 import os, sys
 import random as rn
+import numpy as np
 from argparse import ArgumentParser
+import copy_streams as cs
+import generate_prizes as gp
+import input_cache as ic
+import instrumentation as ins
 
 __author__ = "Anthony Gitter"
 
@@ -14,42 +19,178 @@ def Main(arg_list):
     assert options.mapfile is not None, "Must specify the mapfile"
     assert options.copies > 0, "The number of copies must be positive"
 
+    assert options.workers > 0, "The number of workers must be positive"
+    if options.streams == "sequential":
+        assert options.workers == 1, "Must use independent streams with multiple workers"
+        assert options.copyindex is None, "Must use independent streams to generate a single copy"
+    elif options.seed is None:
+        options.seed = cs.NewSeed()
+        print "Using seed {}".format(options.seed)
+    if options.copyindex is not None:
+        assert 0 < options.copyindex <= options.copies, "The copy index must be between 1 and the number of copies"
+
     # Set the pseudo-random number generator seed if one was provided
     if options.seed is not None:
         rn.seed(options.seed)
 
+    prize_mode = options.firstfile is not None or options.prevfile is not None
+    if prize_mode:
+        assert options.firstfile is not None and options.prevfile is not None, "Must specify both the firstfile and prevfile to generate permuted prizes"
+    else:
+        assert options.prizematrix is None and options.prizeprefix is None, "Must specify the firstfile and prevfile to generate permuted prizes"
+        assert not options.nomapfiles, "Must write the shuffled map files unless generating permuted prizes"
+
+    ins.Start("permute_proteins", options.profileout, arg_list)
+
     # Load the original peptide and protein lists
-    peptides, proteins = LoadPeptideMap(options.mapfile)
+    ins.BeginPhase("parse")
+    peptides, proteins = LoadPeptideMap(options.mapfile, options.cachedir)
     assert len(peptides) == len(proteins), "Error parsing the preptide-protein map"
+    ins.Count("rows", len(peptides))
+
+    map_prefix = None
+    if not options.nomapfiles:
+        # Prepare the output file names
+        filename, extension = os.path.splitext(options.mapfile)
+        if options.outdir is not None:
+            path, file_prefix = os.path.split(filename)
+            filename = os.path.join(os.path.normpath(options.outdir), file_prefix)
+        map_prefix = (filename, extension)
+        print "Writing shuffled map files of the form {}-shuffled<i>{}".format(filename, extension)
+
+    if options.copyindex is None:
+        copy_indices = range(1, options.copies + 1)
+    else:
+        copy_indices = [options.copyindex]
+
+    # The permuted line order of each copy
+    ins.BeginPhase("copies")
+    ins.Count("copies", len(copy_indices))
+    if options.streams == "sequential":
+        permutations = ShufflePermutations(len(proteins), options.copies)
+        if map_prefix is not None:
+            for index, permutation in zip(copy_indices, permutations):
+                WriteShuffledMap(map_prefix, peptides, proteins, permutation, index)
+    else:
+        # The permutations are only returned by the workers when they are
+        # needed for the prizes
+        copy_state = dict(seed=options.seed, map_prefix=map_prefix, peptides=peptides, proteins=proteins, \
+            keep_permutations=prize_mode)
+        permutations = cs.GenerateCopies(IndependentPermutationCopy, copy_indices, options.workers, \
+            InitCopyState, (copy_state,))
+        if prize_mode:
+            permutations = np.array(permutations)
+
+    if map_prefix is not None:
+        print "Wrote {} shuffled map files".format(len(copy_indices))
+
+    if prize_mode:
+        ins.BeginPhase("compute")
+        prot_names, prize_matrix = PermutedPrizes(options.firstfile, options.prevfile, options.mapfile, permutations, options.cachedir)
+
+        ins.BeginPhase("write")
+
+        if options.prizematrix is not None:
+            print "Writing the {} x {} permuted prize matrix to {}".format(prize_matrix.shape[0], prize_matrix.shape[1], options.prizematrix)
+            np.savez(options.prizematrix, copies=np.array(copy_indices), proteins=np.array(prot_names), prizes=prize_matrix)
+
+        if options.prizeprefix is not None:
+            for copy_row, index in enumerate(copy_indices):
+                copy_proteins, copy_prizes = gp.PresentPrizes(prot_names, prize_matrix[copy_row])
+                gp.WritePrizes("{}-shuffled{}.txt".format(options.prizeprefix, index), copy_proteins, copy_prizes)
+
+    ins.Finish()
+
+
+def WriteShuffledMap(map_prefix, peptides, proteins, permutation, index):
+    """Write the shuffled peptide-protein map file for one copy, where
+    map_prefix is a tuple of the filename prefix and extension
+    """
+    filename, extension = map_prefix
+    out_file = "{}-shuffled{}{}".format(filename, index, extension)
+    with open(out_file, "w") as out_f:
+        # Write the header
+        out_f.write("peptide\tprotein(s)\n")
+        for row in range(len(peptides)):
+            out_f.write("{}\t{}\n".format(peptides[row], proteins[permutation[row]]))
 
-    # Prepare the output file names
-    filename, extension = os.path.splitext(options.mapfile)
-    if options.outdir is not None:
-        path, file_prefix = os.path.split(filename)
-        filename = os.path.join(os.path.normpath(options.outdir), file_prefix)
-    print "Writing shuffled map files of the form {}-shuffled<i>{}".format(filename, extension)
 
-    # Shuffle and write the random protein order
-    for index in range(1, options.copies + 1):
-        shuffled = proteins
-        rn.shuffle(shuffled)
+# The data shared with the processes that generate independent copies
+copy_state = None
 
-        out_file = "{}-shuffled{}{}".format(filename, index, extension)
-        with open(out_file, "w") as out_f:
-            # Write the header
-            out_f.write("peptide\tprotein(s)\n")
-            for row in range(len(peptides)):
-                out_f.write("{}\t{}\n".format(peptides[row], shuffled[row]))
+def InitCopyState(state):
+    """Store the data shared by all copies in this process"""
+    global copy_state
+    copy_state = state
 
-    print "Wrote {} shuffled map files".format(options.copies)
 
+def IndependentPermutationCopy(index):
+    """Permute the protein groups for one copy with its own random stream and
+    write its shuffled map file if requested.  Uses the data stored by
+    InitCopyState.
 
-def LoadPeptideMap(mapfile):
+    Return: the permutation, where entry i is the original line whose protein
+    group is placed at line i, or None if the permutations are not kept
+    """
+    permutation = PermuteLines(copy_state["seed"], index, len(copy_state["proteins"]))
+    if copy_state["map_prefix"] is not None:
+        WriteShuffledMap(copy_state["map_prefix"], copy_state["peptides"], copy_state["proteins"], permutation, index)
+    if not copy_state["keep_permutations"]:
+        return None
+    return permutation
+
+
+def PermuteLines(seed, index, num_lines):
+    """Permute the map lines of one copy with the copy's own random stream
+
+    Return: the permutation, where entry i is the original line whose protein
+    group is placed at line i
+    """
+    rng = cs.CopyRandomState(seed, index)
+    return rng.permutation(num_lines)
+
+
+def ShufflePermutations(num_lines, copies):
+    """Shuffle the line order of the peptide-protein map once per copy.  Each
+    copy shuffles the order of the previous copy, and the random state is used
+    in the same way as shuffling the protein list directly.
+
+    Return: a matrix with one row per copy where entry i is the original line
+    whose protein group is placed at line i
+    """
+    order = range(num_lines)
+    permutations = np.empty((copies, num_lines), dtype=np.int64)
+    for copy_ind in range(copies):
+        rn.shuffle(order)
+        permutations[copy_ind] = order
+    return permutations
+
+
+def PermutedPrizes(firstfile, prevfile, mapfile, permutations, cache_dir=None):
+    """Compute the protein prizes of every permuted peptide-protein map.  The
+    peptide prizes are computed once and the permutations are applied to the
+    map lines as index arrays, which gives the same prizes as running
+    generate_prizes.py on each shuffled map file.
+
+    Return: the sorted protein names and a prize matrix with one row per
+    permutation, where -inf indicates a protein without a prize
+    """
+    map_arrays = gp.LoadPeptideMapArrays(mapfile, cache_dir)
+    merged_df = gp.LoadScores(firstfile, prevfile, cache_dir)
+    line_prizes = gp.LinePrizes(merged_df, map_arrays)
+    incidence = gp.ProteinIncidence(map_arrays)
+    prize_matrix = gp.PermutedPrizeMatrix(line_prizes, incidence, permutations)
+    print "Computed prizes for {} proteins in {} permutations".format(prize_matrix.shape[1], prize_matrix.shape[0])
+    return map_arrays.proteins, prize_matrix
+
+
+def LoadPeptideMap(mapfile, cache_dir=None):
     """Parse the peptide-to-protein map file.  The peptide is in the first column
     and the protein or proteins are in the second.  The file contains a header row.
     A peptide may map to a set of pipe-delimited proteins.  A peptide may also
     appear multiple times, and the set of proteins in each appearance
-    will be treated independently.
+    will be treated independently.  If a cache directory is provided, the
+    lists are built from the cached map arrays.
 
     Return: a list of preptides and a list of protein groups in the order
     they appeared in the file
@@ -57,6 +198,16 @@ def LoadPeptideMap(mapfile):
     peptides = []
     proteins = []
 
+    if cache_dir is not None:
+        map_arrays = gp.ReadPeptideMapArrays(mapfile, cache_dir)
+        group_ptr = map_arrays.group_ptr
+        for line, pep_code in enumerate(map_arrays.line_peptides):
+            peptides.append(map_arrays.peptides[pep_code])
+            group = map_arrays.group_proteins[group_ptr[line]:group_ptr[line+1]]
+            proteins.append("|".join(map_arrays.proteins[prot] for prot in group))
+        print "Loaded {} peptide-protein pairs".format(len(peptides))
+        return peptides, proteins
+
     # Load two lists
     with open(mapfile) as map_f:
         # Skip the header
@@ -79,6 +230,16 @@ def CreateParser():
     parser.add_argument("--outdir", type=str, dest="outdir", help="The path of the output directory for the permuted map files (default is the directory of the mapfile).", default=None, required=False)
     parser.add_argument("--copies", type=int, dest="copies", help="The number of shuffled copies to generate (default 10).", default=10, required=False)
     parser.add_argument("--seed", type=int, dest="seed", help="A seed for the pseudo-random number generator for reproducibility.", default=None, required=False)
+    parser.add_argument("--cachedir", type=str, dest="cachedir", help="A directory for the binary cache of parsed input files (default is the PCSF_CACHE_DIR environment variable).  No cache is used if neither is set.", default=ic.DefaultCacheDir(), required=False)
+    parser.add_argument("--streams", type=str, dest="streams", choices=["sequential", "independent"], help="How the random copies are generated (default sequential).  Sequential copies each shuffle the previous copy.  Independent copies have their own random streams derived from the seed, so any copy can be regenerated alone and copies can be generated by multiple workers.", default="sequential", required=False)
+    parser.add_argument("--workers", type=int, dest="workers", help="The number of processes used to generate independent copies (default 1).", default=1, required=False)
+    parser.add_argument("--copyindex", type=int, dest="copyindex", help="Only generate the copy with this 1-based index (independent streams only).", default=None, required=False)
+    parser.add_argument("--firstfile", type=str, dest="firstfile", help="The path and filename of the TPS firstscores file (optional).  Used with the prevfile to compute the protein prizes of every shuffled map in memory.", default=None, required=False)
+    parser.add_argument("--prevfile", type=str, dest="prevfile", help="The path and filename of the TPS prevscores file (optional).  Used with the firstfile to compute the protein prizes of every shuffled map in memory.", default=None, required=False)
+    parser.add_argument("--prizematrix", type=str, dest="prizematrix", help="The path and filename of a .npz file for the matrix of permuted protein prizes (optional).  Proteins without a prize in a permutation have a prize of -inf.", default=None, required=False)
+    parser.add_argument("--prizeprefix", type=str, dest="prizeprefix", help="The path and filename prefix of the permuted prize files (optional).  Writes prize files of the form <prizeprefix>-shuffled<i>.txt.", default=None, required=False)
+    parser.add_argument("--nomapfiles", action="store_true", dest="nomapfiles", help="This flag skips writing the shuffled map files when generating permuted prizes.", default=False)
+    ins.AddProfileArgument(parser)
     return parser
 
 
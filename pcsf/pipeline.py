@@ -0,0 +1,454 @@
+import os, sys, shlex, time, traceback, importlib, subprocess, multiprocessing
+import Queue
+from argparse import ArgumentParser
+import stage_cache as sc
+
+__author__ = "Anthony Gitter"
+
+# The default PCSF and TPS commands, which are the commands in the HTCondor
+# pipeline scripts.  The fields in braces are filled in for each run, and
+# {sourceargs} is replaced by a --source argument for each source node.
+DEFAULT_FOREST_CMD = "python {oipath}/scripts/forest.py -p {prizefile} -e {edgefile} -c {conf} -d {sources} " \
+    "--msgpath={msgpath} --outpath={outpath} --outlabel={outlabel} --cyto30 --noisyEdges=0 -s {seed}"
+DEFAULT_TPS_CMD = "scripts/run --network {network} --timeseries {timeseries} --firstscores {firstscores} " \
+    "--prevscores {prevscores} --partialmodel {partialmodel} --peptidemap {peptidemap} {sourceargs} " \
+    "--threshold {threshold} --outfolder {outfolder} --outlabel tps"
+
+# The options each pipeline requires in addition to the common options
+PIPELINE_OPTIONS = {
+    "bootstrap": ["firstfile", "prevfile", "tsfile", "mapfile", "partialmodel"],
+    "permuted": ["firstfile", "prevfile", "tsfile", "mapfile", "partialmodel"],
+    "randomized": ["firstfile", "prevfile", "tsfile", "mapfile", "prizefile"]
+}
+
+def Main(argList):
+    """Parse the arguments, which either come from the command line or a list
+    provided by the Python code calling this function
+    """
+    parser = CreateParser()
+    options = parser.parse_args(argList)
+
+    if options.copies < 1 or options.forests < 1:
+        raise RuntimeError("The number of copies and forests must be positive")
+    if options.workers < 1:
+        raise RuntimeError("The number of workers must be positive")
+    for option in ["edgefile", "sources"] + PIPELINE_OPTIONS[options.pipeline]:
+        if getattr(options, option) is None:
+            raise RuntimeError("Must specify --%s for the %s pipeline" % (option, options.pipeline))
+
+    tasks, outDirs = {"bootstrap": BootstrapTasks, "permuted": PermutedTasks, \
+        "randomized": RandomizedTasks}[options.pipeline](options)
+
+    if options.dryrun:
+        for task in TopologicalOrder(tasks):
+            print "%s: %s" % (task.name, task)
+        return
+
+    stageCache = None
+    if options.stagecache is not None:
+        maxBytes = None
+        if options.cachesize is not None:
+            maxBytes = int(options.cachesize * 1024 * 1024)
+        stageCache = sc.StageCache(options.stagecache, maxBytes)
+
+    for outDir in outDirs:
+        if not os.path.isdir(outDir):
+            os.makedirs(outDir)
+    statuses = RunTasks(tasks, options.workers, stageCache)
+    if stageCache is not None:
+        ReportCache(statuses)
+
+
+class Task(object):
+    """A stage of a pipeline.  Python tasks call the Main function (or another
+    function that takes an argument list) of a pcsf module in a worker
+    process instead of starting a new interpreter.  Command tasks run an
+    external program such as forest.py or TPS.  A task only runs after all of
+    the tasks it depends on have finished.
+
+    Python tasks with outputs can be restored from a stage cache.  The inputs
+    and outputs are lists of filename patterns.  Tasks with random outputs
+    should only list their outputs when they are given a seed.
+    """
+    def __init__(self, name, args, module=None, function="Main", deps=(), inputs=(), outputs=()):
+        self.name = name
+        self.args = list(args)
+        self.module = module
+        self.function = function
+        self.deps = list(deps)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+
+    def __str__(self):
+        if self.module is None:
+            return " ".join(self.args)
+        return "%s.%s(%s)" % (self.module, self.function, self.args)
+
+
+def RunTask(task, stageCache=None):
+    """Run a task, or restore its outputs from the stage cache, and catch any
+    error so that the pipeline can report it
+
+    Return: the task name, the elapsed seconds, the formatted exception or
+    None if the task succeeded, and the cache status ("hit", "miss", or None
+    if the task is not cached)
+    """
+    start = time.time()
+    cacheStatus = None
+    try:
+        if stageCache is not None and task.module is not None and len(task.outputs) > 0:
+            key = stageCache.Key(task.module, task.function, task.args, task.inputs)
+            if stageCache.Restore(key):
+                return task.name, time.time() - start, None, "hit"
+            cacheStatus = "miss"
+            # Replace the old outputs instead of modifying them in place
+            for outFile in sc.ExpandPatterns(task.outputs):
+                sc.RemoveFile(outFile)
+
+        if task.module is None:
+            subprocess.check_call(task.args)
+        else:
+            getattr(importlib.import_module(task.module), task.function)(task.args)
+
+        if cacheStatus == "miss":
+            stageCache.Store(key, sc.ExpandPatterns(task.outputs))
+    except (Exception, SystemExit):
+        # argparse exits when a python task has invalid arguments
+        return task.name, time.time() - start, traceback.format_exc(), cacheStatus
+    return task.name, time.time() - start, None, cacheStatus
+
+
+def TopologicalOrder(tasks):
+    """Check that the task names are unique and the dependencies form a
+    directed acyclic graph
+
+    Return: a list of the tasks in an order where every task follows its
+    dependencies, which keeps the original order when possible
+    """
+    taskMap = dict()
+    for task in tasks:
+        if task.name in taskMap:
+            raise RuntimeError("Multiple tasks named %s" % task.name)
+        taskMap[task.name] = task
+    for task in tasks:
+        for dep in task.deps:
+            if not dep in taskMap:
+                raise RuntimeError("Task %s depends on the unknown task %s" % (task.name, dep))
+
+    order = []
+    placed = set()
+    remaining = list(tasks)
+    while len(remaining) > 0:
+        ready = [task for task in remaining if placed.issuperset(task.deps)]
+        if len(ready) == 0:
+            raise RuntimeError("The tasks %s have cyclic dependencies" % ", ".join(task.name for task in remaining))
+        order.extend(ready)
+        placed.update(task.name for task in ready)
+        remaining = [task for task in remaining if not task.name in placed]
+    return order
+
+
+def RunTasks(tasks, workers=1, stageCache=None):
+    """Run the tasks in dependency order.  With multiple workers, every task
+    whose dependencies have finished is run concurrently on a pool of that
+    many processes.  No new tasks are started after a task fails, and a
+    RuntimeError reports the failure once the running tasks finish.
+
+    Return: a list of the task names and cache statuses in the order the
+    tasks finished
+    """
+    order = TopologicalOrder(tasks)
+    statuses = []
+    if workers == 1:
+        for task in order:
+            print "Running %s" % task.name
+            name, elapsed, error, cacheStatus = RunTask(task, stageCache)
+            if error is not None:
+                raise RuntimeError("Task %s failed\n%s" % (name, error))
+            ReportTask(name, elapsed, cacheStatus)
+            statuses.append((name, cacheStatus))
+        return statuses
+
+    taskMap = dict((task.name, task) for task in order)
+    waiting = dict((task.name, set(task.deps)) for task in order)
+    dependents = dict((task.name, []) for task in order)
+    for task in order:
+        for dep in task.deps:
+            dependents[dep].append(task.name)
+
+    ready = [task for task in order if len(task.deps) == 0]
+    finished = Queue.Queue()
+    running = 0
+    failure = None
+    pool = multiprocessing.Pool(workers)
+    try:
+        while running > 0 or (len(ready) > 0 and failure is None):
+            while len(ready) > 0 and failure is None:
+                task = ready.pop(0)
+                print "Running %s" % task.name
+                pool.apply_async(RunTask, (task, stageCache), callback=finished.put)
+                running += 1
+
+            # Wait with a timeout so that the pipeline can be interrupted
+            try:
+                name, elapsed, error, cacheStatus = finished.get(True, 1)
+            except Queue.Empty:
+                continue
+            running -= 1
+            if error is not None:
+                if failure is None:
+                    failure = (name, error)
+                continue
+            ReportTask(name, elapsed, cacheStatus)
+            statuses.append((name, cacheStatus))
+            for dependent in dependents[name]:
+                waiting[dependent].discard(name)
+                if len(waiting[dependent]) == 0:
+                    ready.append(taskMap[dependent])
+    finally:
+        pool.close()
+        pool.join()
+
+    if failure is not None:
+        raise RuntimeError("Task %s failed\n%s" % failure)
+    return statuses
+
+
+def ReportTask(name, elapsed, cacheStatus):
+    """Print the outcome of a finished task"""
+    if cacheStatus == "hit":
+        print "Restored %s from the stage cache" % name
+    else:
+        print "Finished %s in %.1f s" % (name, elapsed)
+
+
+def ReportCache(statuses):
+    """Print the stage cache hits and misses"""
+    hits = [name for name, cacheStatus in statuses if cacheStatus == "hit"]
+    misses = [name for name, cacheStatus in statuses if cacheStatus == "miss"]
+    print "Stage cache: %d hits, %d misses" % (len(hits), len(misses))
+    for name in hits:
+        print "  hit\t%s" % name
+    for name in misses:
+        print "  miss\t%s" % name
+
+
+def FormatCommand(template, fields):
+    """Split a command template into arguments and fill in the fields of each
+    argument.  The {sourceargs} argument is replaced by a list of arguments,
+    and fields that are None are an error.
+
+    Return: the list of command arguments
+    """
+    # Options that were not provided cannot be used in the command
+    fields = dict((field, value) for field, value in fields.items() if value is not None)
+    command = []
+    for arg in shlex.split(template):
+        if arg == "{sourceargs}":
+            command.extend(fields["sourceargs"])
+            continue
+        try:
+            command.append(arg.format(**fields))
+        except KeyError as e:
+            raise RuntimeError("The command %s needs a value for %s" % (template, e.args[0]))
+    return command
+
+
+def SourceArgs(sourceFile):
+    """Read the source nodes, one per line, and format them as TPS arguments"""
+    sourceArgs = []
+    with open(sourceFile) as f:
+        for line in f:
+            if line.strip() != "":
+                sourceArgs.extend(["--source", line.strip()])
+    return sourceArgs
+
+
+def SeedArgs(options):
+    """The seed argument for the scripts that generate the copies"""
+    if options.seed is None:
+        return []
+    return ["--seed", str(options.seed)]
+
+
+def SeededOutputs(options, outFiles):
+    """The outputs of a task that generates random copies, which can only be
+    cached when the copies are generated with a seed
+    """
+    if options.seed is None:
+        return []
+    return outFiles
+
+
+def CopyTasks(options, label, subdirpath, prizefile, edgefile, tpsFiles, deps):
+    """Create the tasks that run PCSF with each seed on one copy of the data,
+    summarize the forests, and run TPS on the summary network.  tpsFiles maps
+    the TPS input file fields to filenames.
+
+    Return: a list of tasks
+    """
+    pattern = "%s_beta%s_mu%s_omega%s" % (options.prizename, options.beta, options.mu, options.omega)
+    summaryPrefix = os.path.join(subdirpath, pattern + "_summary")
+
+    tasks = []
+    forestNames = []
+    for seed in range(1, options.forests + 1):
+        fields = dict(oipath=options.oipath, msgpath=options.msgpath, prizefile=prizefile, edgefile=edgefile, \
+            conf=options.conf, sources=options.sources, outpath=subdirpath, outlabel="%s_seed%d" % (pattern, seed), \
+            seed=seed)
+        forestNames.append("%s-forest%d" % (label, seed))
+        tasks.append(Task(forestNames[-1], FormatCommand(options.forestcmd, fields), deps=deps))
+
+    forestPattern = os.path.join(subdirpath, pattern + "*optimalForest.sif")
+    tasks.append(Task("%s-summarize" % label, ["--indir", subdirpath, "--pattern", pattern + "*optimalForest.sif", \
+        "--prizefile", prizefile, "--outfile", summaryPrefix], module="summarize_sif", deps=forestNames, \
+        inputs=[forestPattern, prizefile], outputs=[summaryPrefix + "_*"]))
+
+    fields = dict(tpsFiles, network=summaryPrefix + "_union.tsv", sourceargs=SourceArgs(options.sources), \
+        threshold=options.threshold, outfolder=subdirpath)
+    tasks.append(Task("%s-tps" % label, FormatCommand(options.tpscmd, fields), deps=["%s-summarize" % label]))
+    return tasks
+
+
+def BootstrapTasks(options):
+    """Create the tasks of the pipeline that subsamples the peptides, generates
+    prizes from each subsampled copy, and runs PCSF and TPS on each copy, which
+    is the same as bootstrap_wrapper.sh and run_bootstrap_pipeline.sh
+
+    Return: a list of tasks and a list of the output directories
+    """
+    subsampleTask = Task("subsample", ["--firstfile", options.firstfile, "--prevfile", options.prevfile, \
+        "--tsfile", options.tsfile, "--outdir", options.outpath, "--fraction", str(options.fraction), \
+        "--copies", str(options.copies)] + SeedArgs(options), module="subsample_peptides", \
+        inputs=[options.firstfile, options.prevfile, options.tsfile])
+    tasks = [subsampleTask]
+    outDirs = [options.outpath]
+
+    for index in range(1, options.copies + 1):
+        label = "%s-bootstrapped%d" % (options.fraction, index)
+        subdirpath = os.path.join(options.outpath, label)
+        outDirs.append(subdirpath)
+
+        # The subsampled files written by subsample_peptides.py
+        subsampled = dict()
+        for field, inFile in [("firstscores", options.firstfile), ("prevscores", options.prevfile), ("timeseries", options.tsfile)]:
+            prefix, ext = os.path.splitext(os.path.basename(inFile))
+            subsampled[field] = os.path.join(options.outpath, "%s-%s-subsampled%d%s" % (prefix, options.fraction, index, ext))
+        subsampleTask.outputs.extend(SeededOutputs(options, sorted(subsampled.values())))
+
+        prizefile = os.path.join(subdirpath, label + ".txt")
+        tasks.append(Task("%s-prizes" % label, ["--firstfile", subsampled["firstscores"], \
+            "--prevfile", subsampled["prevscores"], "--mapfile", options.mapfile, "--outfile", prizefile], \
+            module="generate_prizes", deps=["subsample"], \
+            inputs=[subsampled["firstscores"], subsampled["prevscores"], options.mapfile], outputs=[prizefile]))
+
+        tpsFiles = dict(subsampled, partialmodel=options.partialmodel, peptidemap=options.mapfile)
+        tasks.extend(CopyTasks(options, label, subdirpath, prizefile, options.edgefile, tpsFiles, ["%s-prizes" % label]))
+    return tasks, outDirs
+
+
+def PermutedTasks(options):
+    """Create the tasks of the pipeline that permutes the peptide-protein map,
+    generates prizes from each permuted map, and runs PCSF and TPS on each
+    copy, which is the same as permuted_wrapper.sh and
+    run_permuted_pipeline.sh
+
+    Return: a list of tasks and a list of the output directories
+    """
+    permuteTask = Task("permute", ["--mapfile", options.mapfile, "--outdir", options.outpath, \
+        "--copies", str(options.copies)] + SeedArgs(options), module="permute_proteins", inputs=[options.mapfile])
+    tasks = [permuteTask]
+    outDirs = [options.outpath]
+
+    mapPrefix, mapExt = os.path.splitext(os.path.basename(options.mapfile))
+    for index in range(1, options.copies + 1):
+        label = "shuffled%d" % index
+        subdirpath = os.path.join(options.outpath, label)
+        outDirs.append(subdirpath)
+
+        # The shuffled map written by permute_proteins.py
+        shuffledmap = os.path.join(options.outpath, "%s-shuffled%d%s" % (mapPrefix, index, mapExt))
+        permuteTask.outputs.extend(SeededOutputs(options, [shuffledmap]))
+        prizefile = os.path.join(subdirpath, "%s-shuffled%d.txt" % (options.prizename, index))
+        tasks.append(Task("%s-prizes" % label, ["--firstfile", options.firstfile, "--prevfile", options.prevfile, \
+            "--mapfile", shuffledmap, "--outfile", prizefile], module="generate_prizes", deps=["permute"], \
+            inputs=[options.firstfile, options.prevfile, shuffledmap], outputs=[prizefile]))
+
+        tpsFiles = dict(firstscores=options.firstfile, prevscores=options.prevfile, timeseries=options.tsfile, \
+            partialmodel=options.partialmodel, peptidemap=shuffledmap)
+        tasks.extend(CopyTasks(options, label, subdirpath, prizefile, options.edgefile, tpsFiles, ["%s-prizes" % label]))
+    return tasks, outDirs
+
+
+def RandomizedTasks(options):
+    """Create the tasks of the pipeline that randomizes the background
+    network and runs PCSF and TPS with each randomized network and its
+    partial model, which is the same as run_net_rand.sh,
+    net_rand_wrapper.sh, and run_net_rand_pipeline.sh
+
+    Return: a list of tasks and a list of the output directories
+    """
+    randomizeTask = Task("randomize", ["--network", options.edgefile, "--outdir", options.outpath, \
+        "--copies", str(options.copies), "--backend", options.backend] + SeedArgs(options), \
+        module="generate_randomized_networks", function="run", \
+        inputs=[options.edgefile])
+    tasks = [randomizeTask]
+    outDirs = [options.outpath]
+
+    networkPrefix, networkExt = os.path.splitext(os.path.basename(options.edgefile))
+    for index in range(1, options.copies + 1):
+        label = "randomized%d" % index
+        subdirpath = os.path.join(options.outpath, label)
+        outDirs.append(subdirpath)
+
+        # The files written by generate_randomized_networks.py
+        edgefile = os.path.join(options.outpath, "%s-randomized%d%s" % (networkPrefix, index, networkExt))
+        partialmodel = os.path.join(options.outpath, "%s-partial-model-randomized%d.sif" % (networkPrefix, index))
+        randomizeTask.outputs.extend(SeededOutputs(options, [edgefile, partialmodel]))
+
+        tpsFiles = dict(firstscores=options.firstfile, prevscores=options.prevfile, timeseries=options.tsfile, \
+            partialmodel=partialmodel, peptidemap=options.mapfile)
+        tasks.extend(CopyTasks(options, label, subdirpath, options.prizefile, edgefile, tpsFiles, ["randomize"]))
+    return tasks, outDirs
+
+
+def CreateParser():
+    """Setup the option parser"""
+    parser = ArgumentParser(description="Run the bootstrap, permuted, or randomized network PCSF-TPS pipeline locally.  Independent copies and PCSF seeds run concurrently on a pool of processes, and the pcsf scripts are called in the worker processes instead of starting new interpreters.")
+    parser.add_argument("--pipeline", type=str, dest="pipeline", choices=["bootstrap", "permuted", "randomized"], help="The pipeline to run.", default=None, required=True)
+    parser.add_argument("--outpath", type=str, dest="outpath", help="The path of the output directory (default results).", default="results", required=False)
+    parser.add_argument("--workers", type=int, dest="workers", help="The number of processes used to run independent tasks (default 1).", default=1, required=False)
+    parser.add_argument("--copies", type=int, dest="copies", help="The number of bootstrapped, permuted, or randomized copies (default 10).", default=10, required=False)
+    parser.add_argument("--forests", type=int, dest="forests", help="The number of PCSF seeds for each copy (default 10).", default=10, required=False)
+    parser.add_argument("--seed", type=int, dest="seed", help="A seed for the pseudo-random number generator used to generate the copies (optional).", default=None, required=False)
+    parser.add_argument("--fraction", type=float, dest="fraction", help="The fraction of peptides to keep in the bootstrap pipeline (default 0.9).", default=0.9, required=False)
+    parser.add_argument("--firstfile", type=str, dest="firstfile", help="The path and filename of the TPS firstscores file.", default=None, required=False)
+    parser.add_argument("--prevfile", type=str, dest="prevfile", help="The path and filename of the TPS prevscores file.", default=None, required=False)
+    parser.add_argument("--tsfile", type=str, dest="tsfile", help="The path and filename of the TPS timeseries file.", default=None, required=False)
+    parser.add_argument("--mapfile", type=str, dest="mapfile", help="The path and filename of the TPS peptidemap file, which must contain a file extension.", default=None, required=False)
+    parser.add_argument("--partialmodel", type=str, dest="partialmodel", help="The path and filename of the TPS partial model (not used in the randomized pipeline, which uses the partial model of each randomized network).", default=None, required=False)
+    parser.add_argument("--threshold", type=float, dest="threshold", help="The TPS significance threshold (default 0.01).", default=0.01, required=False)
+    parser.add_argument("--backend", type=str, dest="backend", choices=["birewire", "python"], help="The edge switching implementation used to randomize the network in the randomized pipeline (default birewire).  The python backend does not require R.", default="birewire", required=False)
+    parser.add_argument("--edgefile", type=str, dest="edgefile", help="The path and filename of the PPI network.  The network must contain a header in the randomized pipeline.", default=None, required=False)
+    parser.add_argument("--sources", type=str, dest="sources", help="The path and filename of a file that lists the source nodes for PCSF and TPS.", default=None, required=False)
+    parser.add_argument("--prizefile", type=str, dest="prizefile", help="The path and filename of the prize file used in the randomized pipeline.", default=None, required=False)
+    parser.add_argument("--prizename", type=str, dest="prizename", help="The prize name used in the PCSF output labels (default prizes).", default="prizes", required=False)
+    parser.add_argument("--conf", type=str, dest="conf", help="The path and filename of the PCSF configuration file.", default=None, required=False)
+    parser.add_argument("--beta", type=str, dest="beta", help="The PCSF beta parameter used in the output labels (default 0.55).", default="0.55", required=False)
+    parser.add_argument("--mu", type=str, dest="mu", help="The PCSF mu parameter used in the output labels (default 0.008).", default="0.008", required=False)
+    parser.add_argument("--omega", type=str, dest="omega", help="The PCSF omega parameter used in the output labels (default 0.1).", default="0.1", required=False)
+    parser.add_argument("--oipath", type=str, dest="oipath", help="The directory that contains scripts/forest.py (default .).", default=".", required=False)
+    parser.add_argument("--msgpath", type=str, dest="msgpath", help="The path to the msgsteiner executable, including the executable name (default .).", default=".", required=False)
+    parser.add_argument("--forestcmd", type=str, dest="forestcmd", help="The PCSF command template (default is forest.py).  Can be replaced by a local stand-in that writes <outpath>/<outlabel>optimalForest.sif.  Fields: {oipath} {msgpath} {prizefile} {edgefile} {conf} {sources} {outpath} {outlabel} {seed}.", default=DEFAULT_FOREST_CMD, required=False)
+    parser.add_argument("--tpscmd", type=str, dest="tpscmd", help="The TPS command template (default is scripts/run).  Can be replaced by a local stand-in.  Fields: {network} {timeseries} {firstscores} {prevscores} {partialmodel} {peptidemap} {sourceargs} {threshold} {outfolder}.", default=DEFAULT_TPS_CMD, required=False)
+    parser.add_argument("--stagecache", type=str, dest="stagecache", help="A directory for the cache of stage outputs (optional).  The prize generation, copy generation, and summary stages are skipped when their inputs, arguments, and scripts have not changed.  Copies are only cached when a seed is provided.", default=None, required=False)
+    parser.add_argument("--cachesize", type=float, dest="cachesize", help="The maximum size of the stage cache in MB (default unlimited).  The least recently used entries are removed first.", default=None, required=False)
+    parser.add_argument("--dryrun", action="store_true", dest="dryrun", help="This flag prints the tasks in dependency order without running them.", default=False)
+    return parser
+
+
+if __name__ == "__main__":
+    """Use the command line arguments to setup the options
+    (the same as the default ArgumentParser behavior)
+    """
+    Main(sys.argv[1:])
@@ -3,6 +3,8 @@
 NETWORK_FILE='data/networks/phosphosite-irefindex13.0-uniprot-with-header.txt'
 OUTDIR='randomized_networks'
 
+# The edges are switched by BiRewire by default.  Add --backend python to
+# switch the edges in Python without R.
 python pcsf/generate_randomized_networks.py \
   --network $NETWORK_FILE \
   --outdir $OUTDIR \
@@ -0,0 +1,173 @@
+import glob, hashlib, json, os, shutil, stat, sys, tempfile
+import input_cache as ic
+
+__author__ = "Anthony Gitter"
+
+# Increment when the format of the cache entries changes so that old entries
+# are no longer used
+STAGE_CACHE_VERSION = 1
+
+# The name of the file that lists the outputs in a cache entry.  Its
+# modification time is the last time the entry was used.
+MANIFEST_FILE = "manifest.json"
+
+class StageCache(object):
+    """A content-addressed cache of pipeline stage outputs.  An entry is keyed
+    by the hash of the stage's module and function, its arguments, the source
+    code of the module and the pcsf modules it imports, and the contents of
+    its input files, so an entry is only used when the stage would produce the
+    same outputs.  The output files are copied into the cache, where they are
+    made read-only, and copied back out when they are restored so that the
+    restored outputs remain ordinary writable files.  The least recently used
+    entries are evicted when the cache exceeds max_bytes.
+    """
+    def __init__(self, cache_dir, max_bytes=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def Key(self, module, function, args, inputs):
+        """Hash a stage, where inputs is a list of filename patterns
+
+        Return: the hex digest string
+        """
+        input_files = ExpandPatterns(inputs)
+        key = {"version": STAGE_CACHE_VERSION, "module": module, "function": function, "args": list(args), \
+            "source": SourceDigest(module), "inputs": [(f, ic.FileDigest(f)) for f in input_files]}
+        return hashlib.sha1(json.dumps(key, sort_keys=True)).hexdigest()
+
+    def EntryDir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def Restore(self, key):
+        """Copy the outputs in a cache entry to their original paths and
+        mark the entry as recently used
+
+        Return: True if the entry exists and False otherwise
+        """
+        entry = self.EntryDir(key)
+        manifest_file = os.path.join(entry, MANIFEST_FILE)
+        try:
+            with open(manifest_file) as manifest_f:
+                manifest = json.load(manifest_f)
+        except (IOError, ValueError):
+            return False
+
+        for index, out_file in enumerate(manifest["outputs"]):
+            RemoveFile(out_file)
+            out_dir = os.path.dirname(out_file)
+            if out_dir != "" and not os.path.isdir(out_dir):
+                os.makedirs(out_dir)
+            shutil.copyfile(os.path.join(entry, str(index)), out_file)
+        os.utime(manifest_file, None)
+        return True
+
+    def Store(self, key, out_files):
+        """Add the output files of a stage to a new cache entry.  The entry is
+        written to a temporary directory and renamed so that concurrent stages
+        never restore a partially written entry.
+        """
+        if not os.path.isdir(self.cache_dir):
+            try:
+                os.makedirs(self.cache_dir)
+            except OSError:
+                # Another stage may have created the directory
+                if not os.path.isdir(self.cache_dir):
+                    raise
+
+        tmp_entry = tempfile.mkdtemp(dir=self.cache_dir, prefix=".tmp-")
+        try:
+            for index, out_file in enumerate(out_files):
+                cached_file = os.path.join(tmp_entry, str(index))
+                shutil.copyfile(out_file, cached_file)
+                os.chmod(cached_file, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            with open(os.path.join(tmp_entry, MANIFEST_FILE), "w") as manifest_f:
+                json.dump({"outputs": list(out_files)}, manifest_f)
+            os.rename(tmp_entry, self.EntryDir(key))
+        except OSError:
+            # Another stage may have written the same entry first
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+            if not os.path.isdir(self.EntryDir(key)):
+                raise
+            return
+
+        self.Evict(keep=key)
+
+    def Entries(self):
+        """List the cache entries from the least to the most recently used
+
+        Return: a list of (last used time, size in bytes, entry key) tuples
+        """
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for key in os.listdir(self.cache_dir):
+            entry = self.EntryDir(key)
+            try:
+                last_used = os.path.getmtime(os.path.join(entry, MANIFEST_FILE))
+                size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+            except OSError:
+                # Temporary entries and entries removed by another stage
+                continue
+            entries.append((last_used, size, key))
+        return sorted(entries)
+
+    def Evict(self, keep=None):
+        """Remove the least recently used entries until the cache is no larger
+        than max_bytes.  The entry that was just stored is kept.
+        """
+        if self.max_bytes is None:
+            return
+        entries = self.Entries()
+        total = sum(size for last_used, size, key in entries)
+        for last_used, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            print "Evicting stage cache entry {}".format(key)
+            shutil.rmtree(self.EntryDir(key), ignore_errors=True)
+            total -= size
+
+
+def ExpandPatterns(patterns):
+    """Find the files that match a list of filename patterns
+
+    Return: a sorted list of filenames
+    """
+    files = set()
+    for pattern in patterns:
+        files.update(f for f in glob.glob(pattern) if os.path.isfile(f))
+    return sorted(files)
+
+
+def SourceDigest(module):
+    """Hash the source code of a pcsf module and the pcsf modules it imports,
+    which is the version of the stage's script
+
+    Return: the hex digest string
+    """
+    __import__(module)
+    module_dir = os.path.dirname(os.path.abspath(__file__))
+    sha = hashlib.sha1()
+    for name in sorted(set([module]) | set(LocalImports(sys.modules[module], module_dir))):
+        source_file = os.path.splitext(sys.modules[name].__file__)[0] + ".py"
+        sha.update(name)
+        sha.update(ic.FileDigest(source_file))
+    return sha.hexdigest()
+
+
+def LocalImports(module, module_dir):
+    """The names of the pcsf modules that a module imports"""
+    for value in vars(module).values():
+        value_file = getattr(value, "__file__", None)
+        if type(value) is type(sys) and value_file is not None and \
+            os.path.dirname(os.path.abspath(value_file)) == module_dir:
+            yield value.__name__
+
+
+def RemoveFile(filename):
+    """Remove a file if it exists so that it is replaced even if it is
+    read-only
+    """
+    if os.path.isfile(filename) or os.path.islink(filename):
+        os.remove(filename)
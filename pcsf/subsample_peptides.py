@@ -1,9 +1,25 @@
-import os, sys
+import itertools, mmap, os, sys
 import random as rn
+import numpy as np
+from collections import namedtuple
 from argparse import ArgumentParser
+import copy_streams as cs
+import generate_prizes as gp
+import input_cache as ic
+import instrumentation as ins
 
 __author__ = "Anthony Gitter"
 
+# A memory-mapped peptide file and the byte offsets of its lines.  Line i,
+# where line 0 is the header, is data[offsets[i]:offsets[i+1]].  The peptide
+# id of data row i, which is line i+1, ends at id_ends[i].
+PeptideFileIndex = namedtuple("PeptideFileIndex", ["data", "offsets", "id_ends"])
+
+# The number of bytes scanned at a time when indexing the lines of a file
+INDEX_CHUNK_BYTES = 1 << 24
+# The number of lines copied at a time when writing subsampled files
+COPY_CHUNK_LINES = 1 << 13
+
 def Main(arg_list):
     """Parse the arguments, which either come from the command line or a list
     provided by the Python code calling this function
@@ -17,84 +33,333 @@ def Main(arg_list):
 
     assert options.fraction >= 0 and options.fraction <= 1.0, "The fraction must be in (0,1)"
     assert options.copies > 0, "The number of copies must be positive"
+    if options.mapfile is None:
+        assert options.bootstrapfile is None and options.prizeprefix is None, "Must specify the mapfile to generate bootstrap prizes"
+
+    assert options.workers > 0, "The number of workers must be positive"
+    if options.streams == "sequential":
+        assert options.workers == 1, "Must use independent streams with multiple workers"
+        assert options.copyindex is None, "Must use independent streams to generate a single copy"
+    elif options.seed is None:
+        options.seed = cs.NewSeed()
+        print "Using seed {}".format(options.seed)
+    if options.copyindex is not None:
+        assert 0 < options.copyindex <= options.copies, "The copy index must be between 1 and the number of copies"
 
     # Set the pseudo-random number generator seed if one was provided
     if options.seed is not None:
         rn.seed(options.seed)
 
-    # Load the original peptide time series and score files
-    headers, data = LoadPeptideData(options.firstfile, options.prevfile, options.tsfile)
+    ins.Start("subsample_peptides", options.profileout, arg_list)
+
+    # Index the lines of the original peptide time series and score files
+    ins.BeginPhase("parse")
+    file_indices = IndexPeptideData(options.firstfile, options.prevfile, options.tsfile)
+    num_rows = len(file_indices[0].offsets) - 2
+    ins.Count("rows", num_rows)
 
     # Compute the length of the subsampled files
-    subsampled_len = int(round(len(data)*options.fraction))
+    subsampled_len = SubsampledLength(num_rows, options.fraction)
+    print "Subsampling {} of {} rows".format(subsampled_len, num_rows)
+
+    # Only write the subsampled files in the bootstrap mode when requested
+    bootstrap_mode = options.mapfile is not None
+    write_tsv = not bootstrap_mode or options.writetsv
+    out_files = None
+    if write_tsv:
+        peptide_files = [options.firstfile, options.prevfile, options.tsfile]
+        out_files = SubsampledFilenames(peptide_files, options.outdir, options.fraction)
+
+    if options.copyindex is None:
+        copy_indices = range(1, options.copies + 1)
+    else:
+        copy_indices = [options.copyindex]
+
+    # The rows retained in each subsampled copy
+    ins.BeginPhase("copies")
+    ins.Count("copies", len(copy_indices))
+    if options.streams == "sequential":
+        subsamples = SubsampleIndices(num_rows, subsampled_len, options.copies)
+        if write_tsv:
+            for copy_ind, rows in zip(copy_indices, subsamples):
+                WriteSubsampledCopy(out_files, file_indices, rows, copy_ind)
+    else:
+        # The subsampled rows are only returned by the workers when they are
+        # needed for the prizes
+        copy_state = dict(seed=options.seed, num_rows=num_rows, subsampled_len=subsampled_len, \
+            out_files=out_files, file_indices=file_indices, keep_rows=bootstrap_mode)
+        subsamples = cs.GenerateCopies(IndependentSubsampleCopy, copy_indices, options.workers, \
+            InitCopyState, (copy_state,))
+        if bootstrap_mode:
+            subsamples = np.array(subsamples)
+
+    # The memory-mapped peptide files are only needed to write the copies
+    for file_index in file_indices:
+        file_index.data.close()
+
+    if write_tsv:
+        print "Wrote {} subsampled copies".format(len(copy_indices))
+
+    if bootstrap_mode:
+        ins.BeginPhase("compute")
+        prot_names, prize_matrix = BootstrapPrizes(options.firstfile, options.prevfile, options.mapfile, subsamples, num_rows, options.cachedir)
+
+        ins.BeginPhase("write")
+
+        if options.bootstrapfile is not None:
+            print "Writing the subsampled rows and {} x {} bootstrap prize matrix to {}".format(prize_matrix.shape[0], prize_matrix.shape[1], options.bootstrapfile)
+            np.savez(options.bootstrapfile, copies=np.array(copy_indices), rows=subsamples, proteins=np.array(prot_names), prizes=prize_matrix)
+
+        if options.prizeprefix is not None:
+            for copy_row, copy_ind in enumerate(copy_indices):
+                copy_proteins, copy_prizes = gp.PresentPrizes(prot_names, prize_matrix[copy_row])
+                gp.WritePrizes("{}-{}-bootstrapped{}.txt".format(options.prizeprefix, options.fraction, copy_ind), copy_proteins, copy_prizes)
+
+    ins.Finish()
+
+
+def SubsampleIndices(num_rows, subsampled_len, copies):
+    """Shuffle the row order once per copy and keep the first subsampled_len
+    rows.  Each copy shuffles the order of the previous copy, and the random
+    state is used in the same way as shuffling the rows directly.
+
+    Return: a matrix with one row per copy containing the retained row indices
+    in the order they are written
+    """
+    order = range(num_rows)
+    subsamples = np.empty((copies, subsampled_len), dtype=np.int64)
+    for copy_ind in range(copies):
+        rn.shuffle(order)
+        subsamples[copy_ind] = order[:subsampled_len]
+    return subsamples
+
+
+# The data shared with the processes that generate independent copies
+copy_state = None
+
+def InitCopyState(state):
+    """Store the data shared by all copies in this process"""
+    global copy_state
+    copy_state = state
+
+
+def IndependentSubsampleCopy(copy_ind):
+    """Subsample one copy with its own random stream and write its subsampled
+    files if they were requested.  Uses the data stored by InitCopyState.
+
+    Return: the retained row indices in the order they are written, or None
+    if the rows are not kept
+    """
+    rows = SubsampleRows(copy_state["seed"], copy_ind, copy_state["num_rows"], copy_state["subsampled_len"])
+    if copy_state["out_files"] is not None:
+        WriteSubsampledCopy(copy_state["out_files"], copy_state["file_indices"], rows, copy_ind)
+    if not copy_state["keep_rows"]:
+        return None
+    return rows
+
+
+def SubsampledLength(num_rows, fraction):
+    """The number of rows retained when subsampling a fraction of the rows
+
+    Return: an int
+    """
+    subsampled_len = int(round(num_rows*fraction))
     assert subsampled_len > 0, "Must increase the fraction to subsample at least one row"
-    assert subsampled_len < len(data), "Must decrease the fraction to subsample less than the total number of rows"
-    print "Subsampling {} of {} rows".format(subsampled_len, len(data))
+    assert subsampled_len < num_rows, "Must decrease the fraction to subsample less than the total number of rows"
+    return subsampled_len
 
-    # Prepare the output file names
-    filename_list = []
-    ext_list = []
-    peptide_files = [options.firstfile, options.prevfile, options.tsfile]
+
+def SubsampleRows(seed, copy_ind, num_rows, subsampled_len):
+    """Subsample the rows of one copy with the copy's own random stream
+
+    Return: the retained row indices in the order they are written
+    """
+    rng = cs.CopyRandomState(seed, copy_ind)
+    return rng.permutation(num_rows)[:subsampled_len]
+
+
+def SubsampledFilenames(peptide_files, outdir, fraction):
+    """Prepare the output file names for the subsampled files
+
+    Return: a list of (filename prefix, extension) tuples, one per peptide
+    file, where the fraction has been added to the prefix
+    """
+    out_files = []
     for peptide_file in peptide_files:
         filename, extension = os.path.splitext(peptide_file)
-        if options.outdir is not None:
+        if outdir is not None:
             path, file_prefix = os.path.split(filename)
-            filename = os.path.join(os.path.normpath(options.outdir), file_prefix)
-        filename_list.append(filename)
-        ext_list.append(extension)
-        print "Writing subsampled files of the form {}-{}-subsampled<i>{}".format(filename, options.fraction, extension)
-
-    # Shuffle, subsample, and write the subsampled peptide data
-    for copy_ind in range(1, options.copies + 1):
-        shuffled = data
-        rn.shuffle(shuffled)
-        shuffled = shuffled[:subsampled_len]
-
-        for file_ind in range(len(headers)):
-            filename = filename_list[file_ind]
-            extension = ext_list[file_ind]
-            out_file = "{}-{}-subsampled{}{}".format(filename, options.fraction, copy_ind, extension)
-            with open(out_file, "w") as out_f:
-                # Write the header
-                out_f.write(headers[file_ind])
-                for data_lines in shuffled:
-                    out_f.write(data_lines[file_ind])
-
-    print "Wrote {} subsampled copies".format(options.copies)
-
-
-def LoadPeptideData(firstfile, prevfile, tsfile):
-    """Parse three tab-delimited files with peptide scores. Each begins with a
-    header. Requires that the peptide ids are in the first column, are in
-    the same order, and are identical in all three files.
-    
-    Return: a tuple of the header lines and a list of tuples for the remaining
-    rows.
-    """
-    first_header, first_data, first_peptides = ParsePeptideFile(firstfile)
-    prev_header, prev_data, prev_peptides = ParsePeptideFile(prevfile)
-    ts_header, ts_data, ts_peptides = ParsePeptideFile(tsfile)
-    
-    # Confirm the same peptides are present in the same order
-    assert first_peptides == prev_peptides, "Expected the same peptide ids in the same order"
-    assert first_peptides == ts_peptides, "Expected the same peptide ids in the same order"
-
-    return (first_header, prev_header, ts_header), zip(first_data, prev_data, ts_data)
-
-
-def ParsePeptideFile(peptidefile):
-    """Parse a tab-delimited file with peptide scores. Requires that peptide
-    ids are in the first column.
-    
-    Returns: a tuple of the header row, the remaining rows, and the peptide
-    ids.
-    """
-    with open(peptidefile) as pep_f:
-        pep_lines = pep_f.readlines()
-    pep_header = pep_lines[0]
-    pep_data = pep_lines[1:]
-    pep_peptides = [line.split("\t")[0] for line in pep_data]
-    return (pep_header, pep_data, pep_peptides)
+            filename = os.path.join(os.path.normpath(outdir), file_prefix)
+        out_files.append(("{}-{}".format(filename, fraction), extension))
+        print "Writing subsampled files of the form {}-{}-subsampled<i>{}".format(filename, fraction, extension)
+    return out_files
+
+
+def WriteSubsampledCopy(out_files, file_indices, rows, copy_ind):
+    """Write the subsampled first scores, previous scores, and time series
+    files for one copy so they can be used as TPS inputs.  The lines are
+    copied as byte ranges from the memory-mapped input files.
+    """
+    for (filename, extension), file_index in zip(out_files, file_indices):
+        out_file = "{}-subsampled{}{}".format(filename, copy_ind, extension)
+        data, offsets = file_index.data, file_index.offsets
+        with open(out_file, "wb") as out_f:
+            # Write the header
+            out_f.write(data[offsets[0]:offsets[1]])
+            # Data row i is line i+1
+            lines = np.asarray(rows) + 1
+            for first in range(0, len(lines), COPY_CHUNK_LINES):
+                chunk = lines[first:first+COPY_CHUNK_LINES]
+                starts = offsets[chunk]
+                GatherRanges(data, starts, offsets[chunk+1] - starts).tofile(out_f)
+
+
+def BootstrapPrizes(firstfile, prevfile, mapfile, subsamples, num_rows, cache_dir=None):
+    """Compute the protein prizes of every subsampled copy directly from the
+    parsed score files, which gives the same prizes as running
+    generate_prizes.py on each copy's subsampled score files.  num_rows is
+    the number of data rows in the files that were subsampled.
+
+    Return: the sorted protein names and a prize matrix with one row per
+    copy, where -inf indicates a protein without a prize
+    """
+    map_arrays = gp.LoadPeptideMapArrays(mapfile, cache_dir)
+    merged_df = gp.LoadScores(firstfile, prevfile, cache_dir)
+    assert merged_df.shape[0] == num_rows, "The score files must have one row per subsampled peptide"
+    prize_matrix = gp.SubsampledPrizeMatrix(merged_df, map_arrays, subsamples)
+    print "Computed prizes for {} proteins in {} bootstrap copies".format(prize_matrix.shape[1], prize_matrix.shape[0])
+    return map_arrays.proteins, prize_matrix
+
+
+def IndexPeptideData(firstfile, prevfile, tsfile):
+    """Memory-map and index the lines of three tab-delimited files with
+    peptide scores.  Each begins with a header.  Requires that the peptide
+    ids are in the first column, are in the same order, and are identical in
+    all three files.
+
+    Return: a list of PeptideFileIndex tuples in the order of the arguments
+    """
+    file_indices = [IndexPeptideFile(peptidefile) for peptidefile in [firstfile, prevfile, tsfile]]
+
+    # Confirm the same peptides are present in the same order by comparing
+    # the lengths of the peptide ids and then their bytes
+    num_lines = len(file_indices[0].offsets)
+    for file_index in file_indices[1:]:
+        assert len(file_index.offsets) == num_lines, "Expected the same peptide ids in the same order"
+    id_starts = [file_index.offsets[1:-1] for file_index in file_indices]
+    id_lengths = [file_index.id_ends - file_index.offsets[1:-1] for file_index in file_indices]
+    for lengths in id_lengths[1:]:
+        assert np.array_equal(lengths, id_lengths[0]), "Expected the same peptide ids in the same order"
+    for first in range(0, num_lines - 2, COPY_CHUNK_LINES):
+        last = first + COPY_CHUNK_LINES
+        peptides = GatherRanges(file_indices[0].data, id_starts[0][first:last], id_lengths[0][first:last])
+        for file_ind in range(1, len(file_indices)):
+            assert np.array_equal(GatherRanges(file_indices[file_ind].data, id_starts[file_ind][first:last], id_lengths[0][first:last]), peptides), \
+                "Expected the same peptide ids in the same order"
+
+    return file_indices
+
+
+def IndexPeptideFile(peptidefile):
+    """Memory-map a tab-delimited file with peptide scores and record the byte
+    offsets where each line starts and each peptide id ends.  The offsets are
+    not cached because hashing the file to find its cache entry reads as many
+    bytes as scanning it.  The caller closes the memory-mapped data when it
+    is done with the file.
+
+    Return: a PeptideFileIndex tuple
+    """
+    data = MapFile(peptidefile)
+    arrays = ParseLineIndex(data)
+    return PeptideFileIndex(data, arrays["offsets"], arrays["id_ends"])
+
+
+def MapFile(peptidefile):
+    """Memory-map a file for reading
+
+    Return: an mmap object
+    """
+    assert os.path.getsize(peptidefile) > 0, "{} is empty".format(peptidefile)
+    with open(peptidefile, "rb") as pep_f:
+        return mmap.mmap(pep_f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def ParseLineIndex(data):
+    """Scan a memory-mapped tab-delimited file with peptide scores in chunks
+    to find the line and peptide id offsets without creating per-line Python
+    objects
+
+    Return: a dict with the line offsets and peptide id ends
+    """
+    offsets = LineOffsets(data)
+    id_ends = PeptideIdEnds(data, offsets)
+    return dict(offsets=offsets, id_ends=id_ends)
+
+
+def LineOffsets(data):
+    """Find the byte offset where each line of a memory-mapped file starts.
+    The last entry is the length of the file.
+
+    Return: an array of offsets
+    """
+    line_ends = []
+    for start in range(0, len(data), INDEX_CHUNK_BYTES):
+        count = min(INDEX_CHUNK_BYTES, len(data) - start)
+        chunk = np.frombuffer(data, dtype=np.uint8, count=count, offset=start)
+        line_ends.append(np.flatnonzero(chunk == ord("\n")) + (start + 1))
+    offsets = np.concatenate([np.zeros(1, dtype=np.int64)] + line_ends)
+    # The last line may not end with a newline
+    if offsets[-1] != len(data):
+        offsets = np.append(offsets, len(data))
+    return offsets
+
+
+def PeptideIdEnds(data, offsets):
+    """Find where the peptide id in the first column of each data line ends,
+    which is the first tab or the end of the line.  The file is scanned in
+    chunks, and the rare lines whose first tab is not in the same chunk as the
+    start of the line are searched individually.
+
+    Return: an array of byte offsets with one entry per data line
+    """
+    starts = offsets[1:-1]
+    id_ends = offsets[2:].copy()
+    found = np.zeros(len(starts), dtype=bool)
+    for chunk_start in range(0, len(data), INDEX_CHUNK_BYTES):
+        count = min(INDEX_CHUNK_BYTES, len(data) - chunk_start)
+        chunk = np.frombuffer(data, dtype=np.uint8, count=count, offset=chunk_start)
+        tabs = np.flatnonzero(chunk == ord("\t")) + chunk_start
+        # The data lines that start in this chunk
+        lo, hi = np.searchsorted(starts, [chunk_start, chunk_start + count])
+        next_tabs = np.searchsorted(tabs, starts[lo:hi])
+        has_tab = next_tabs < len(tabs)
+        if len(tabs) > 0:
+            tab_pos = tabs[np.minimum(next_tabs, len(tabs) - 1)]
+            in_chunk = has_tab & (tab_pos < id_ends[lo:hi])
+            id_ends[lo:hi][in_chunk] = tab_pos[in_chunk]
+        # A later tab in this chunk is either in the line or after its end.
+        # Otherwise, the line has no tab if it also ends in this chunk.
+        found[lo:hi] = has_tab | (offsets[lo+2:hi+2] <= chunk_start + count)
+
+    for line in np.flatnonzero(~found):
+        tab = data.find("\t", starts[line], id_ends[line])
+        if tab >= 0:
+            id_ends[line] = tab
+    return id_ends
+
+
+def GatherRanges(data, starts, lengths):
+    """Copy several byte ranges of a memory-mapped file into one array by
+    concatenating views of the ranges, which does not copy the ranges into
+    Python strings
+
+    Return: a uint8 array with the concatenated bytes
+    """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    if len(starts) == 0:
+        return buf[:0]
+    return np.concatenate([buf[start:start+length] for start, length in itertools.izip(starts, lengths)])
+
 
 def CreateParser():
     """Setup the option parser"""
@@ -106,6 +371,15 @@ def CreateParser():
     parser.add_argument("--fraction", type=float, dest="fraction", help="The fraction of peptides to keep in the subsampled datasets (default 0.9).", default=0.9, required=False)    
     parser.add_argument("--copies", type=int, dest="copies", help="The number of subsampled copies to generate (default 10).", default=10, required=False)
     parser.add_argument("--seed", type=int, dest="seed", help="A seed for the pseudo-random number generator for reproducibility.", default=None, required=False)
+    parser.add_argument("--cachedir", type=str, dest="cachedir", help="A directory for the binary cache of parsed input files (default is the PCSF_CACHE_DIR environment variable).  No cache is used if neither is set.", default=ic.DefaultCacheDir(), required=False)
+    parser.add_argument("--streams", type=str, dest="streams", choices=["sequential", "independent"], help="How the random copies are generated (default sequential).  Sequential copies each shuffle the previous copy.  Independent copies have their own random streams derived from the seed, so any copy can be regenerated alone and copies can be generated by multiple workers.", default="sequential", required=False)
+    parser.add_argument("--workers", type=int, dest="workers", help="The number of processes used to generate independent copies (default 1).", default=1, required=False)
+    parser.add_argument("--copyindex", type=int, dest="copyindex", help="Only generate the copy with this 1-based index (independent streams only).", default=None, required=False)
+    parser.add_argument("--mapfile", type=str, dest="mapfile", help="The path and filename of the TPS peptidemap file (optional).  Enables the bootstrap mode, which computes the protein prizes of every subsampled copy in memory.", default=None, required=False)
+    parser.add_argument("--bootstrapfile", type=str, dest="bootstrapfile", help="The path and filename of a .npz file for the subsampled row indices and the matrix of bootstrap protein prizes (bootstrap mode only).  Proteins without a prize in a copy have a prize of -inf.", default=None, required=False)
+    parser.add_argument("--prizeprefix", type=str, dest="prizeprefix", help="The path and filename prefix of the bootstrap prize files (bootstrap mode only).  Writes prize files of the form <prizeprefix>-<fraction>-bootstrapped<i>.txt.", default=None, required=False)
+    parser.add_argument("--writetsv", action="store_true", dest="writetsv", help="This flag writes the subsampled files for TPS in the bootstrap mode.  They are always written when the mapfile is not provided.", default=False)
+    ins.AddProfileArgument(parser)
     return parser
 
 
@@ -1,9 +1,20 @@
-import os, sys, glob, csv, itertools
+import os, re, sys, glob, fnmatch, itertools, json, multiprocessing, time
+from array import array
+from collections import Counter
 import networkx as nx
+import numpy as np
+import pandas as pd
 from argparse import ArgumentParser
+import forest_pack as fp
+import instrumentation as ins
 
 __author__ = "Anthony Gitter"
 
+# Increment when the format of the saved summary state changes.  Version 2
+# added the frequency changes used to track convergence, and version 3 added
+# the forest incidence matrices.
+STATE_VERSION = 3
+
 def Main(argList):
     """Parse the arguments, which either come from the command line or a list
     provided by the Python code calling this function
@@ -11,11 +22,22 @@ def Main(argList):
     parser = CreateParser()
     options = parser.parse_args(argList)
 
-    if options.indir is None or options.outfile is None:
-        raise RuntimeError("Must specify --indir and --outfile")
+    if options.outfile is None:
+        raise RuntimeError("Must specify --outfile")
+
+    if options.packfile is None:
+        if options.indir is None:
+            raise RuntimeError("Must specify --indir or --packfile")
+        if options.pattern is None and options.siflist is None:
+            raise RuntimeError("Must specify --pattern or --siflist")
 
-    if options.pattern is None and options.siflist is None:
-        raise RuntimeError("Must specify --pattern or --siflist")
+    if options.minfreq < 0 or options.minfreq > 1:
+        raise RuntimeError("The minimum edge frequency must be between 0 and 1")
+    if options.topk is not None and options.topk < 1:
+        raise RuntimeError("The number of top edges must be positive")
+
+    ins.Start("summarize_sif", options.profileout, argList)
+    ins.BeginPhase("parse")
 
     # Load the common set of prizes if provided
     prizeMap = dict()
@@ -25,105 +47,106 @@ def Main(argList):
     # The proteins with prizes
     prizes = set(prizeMap.keys())
 
-    # Read and load the information about each forest
-    names = []
-    forests = []
-    forestNodes = []
-    forestEdges = []
-    
-    if not options.pattern is None:
+    # The forests are either sif files or the names of forests in a pack file
+    if options.packfile is not None:
+        sifFiles = fp.ForestPack(options.packfile).names
+        if not options.pattern is None:
+            sifFiles = fnmatch.filter(sifFiles, options.pattern)
+        elif not options.siflist is None:
+            sifFiles = options.siflist.split("|")
+    elif not options.pattern is None:
         pattern = os.path.join(options.indir,options.pattern)
         sifFiles = glob.glob(pattern)
     else:
         sifFiles = [os.path.join(options.indir, f) for f in options.siflist.split("|")]
 
-    for sifFile in sifFiles:
-        names.append(os.path.basename(sifFile))
-        curForest = LoadSifNetwork(sifFile)
-        forests.append(curForest)
-        forestNodes.append(set(curForest.nodes()))
-        # Sort the nodes in each edge tuple because we treat them as
-        # undirected edges
-        forestEdges.append(set(map(SortEdge, curForest.edges())))
+    if options.workers < 1:
+        raise RuntimeError("The number of workers must be positive")
+    trackChanges = options.convergence is not None
+    # The incidence matrices are needed for the other forest family outputs
+    keepIncidence = options.incidence or options.similarity or options.metrics
+    if trackChanges:
+        if options.tolerance <= 0 or options.window < 1:
+            raise RuntimeError("The tolerance and window must be positive")
+        # Add the forests in seed order, which is the order in which
+        # the PCSF runs are launched
+        sifFiles = sorted(sifFiles, key=NaturalSortKey)
 
-    print "%d forests loaded" % len(names)
-    
-    if len(names) == 0:
+    if options.settle < 0:
+        raise RuntimeError("The settle time cannot be negative")
+    # Forests are identified by their path relative to indir
+    baseDir = options.indir if options.packfile is None else None
+    if options.statefile is not None and options.packfile is None:
+        # forest.py may still be writing recently modified sif files, which
+        # would be summarized partially and then never read again, so they
+        # are left for a later refresh of the saved summary
+        cutoff = time.time() - options.settle
+        settledFiles = [sifFile for sifFile in sifFiles if os.path.getmtime(sifFile) <= cutoff]
+        if len(settledFiles) < len(sifFiles):
+            print "Skipping %d forests modified in the last %g seconds" % (len(sifFiles) - len(settledFiles), options.settle)
+        sifFiles = settledFiles
+
+    # Read each forest and add it to the running counts, which only store
+    # the union of the forests
+    if options.statefile is not None and os.path.isfile(options.statefile):
+        # Only read the forests that are not already in the saved summary
+        summary = LoadSummaryState(options.statefile, prizes, options.hubnode)
+        print "%d forests loaded from %s" % (summary.ForestCount(), options.statefile)
+        if trackChanges and not summary.trackChanges:
+            raise RuntimeError("%s was created without tracking convergence" % options.statefile)
+        if keepIncidence and not summary.keepIncidence:
+            raise RuntimeError("%s was created without keeping the incidence matrices" % options.statefile)
+        summarized = set(summary.names)
+        sifFiles = [sifFile for sifFile in sifFiles if not fp.ForestName(sifFile, baseDir) in summarized]
+        summary.AddForests(sifFiles, options.workers, options.packfile, baseDir)
+        print "%d new forests loaded" % len(sifFiles)
+    else:
+        summary = ForestSummary(prizes, options.hubnode, trackChanges, keepIncidence)
+        summary.AddForests(sifFiles, options.workers, options.packfile, baseDir)
+        print "%d forests loaded" % summary.ForestCount()
+    ins.Count("forests", summary.ForestCount())
+    ins.Count("edges", sum(summary.edgeCounts))
+
+    if summary.ForestCount() == 0:
         raise RuntimeError("Must provide 1 or more forests as input")
 
-    # Store the Steiner nodes, which are the forest nodes that are not prizes
-    steinerNodes = []
-    for i in range(len(forestNodes)):
-        steinerNodes.append(forestNodes[i].difference(prizes))
-        
-    # Store the degree of the hub node of interest
-    if not options.hubnode is None:
-        # The degree is 0 if the hub node is not in the forest
-        hubDegrees = [forest.degree(options.hubnode) if options.hubnode in forest else 0 for forest in forests]
-
-    # Write the sizes of each forest
-    # Could use pandas for this to build the table in memory instead of
-    # writing to a file and transposing
-    emptyCount = 0
-    tmpFile = options.outfile + "_size_tmp.txt"
-    with open(tmpFile, "w") as f:
-        f.write("Forest name")
-        for name in names:
-            f.write("\t" + name)
-        f.write("\n")
-        f.write("Forest size")
-        for forest in forestNodes:
-            f.write("\t%d" % len(forest))
-            if(len(forest) == 0):
-                emptyCount += 1
-        f.write("\n")
-        # Only write Steiner nodes and prizes if prizes were loaded
-        if len(prizes) > 0:
-            f.write("Steiner nodes")
-            for steiner in steinerNodes:
-                f.write("\t%d" % len(steiner))
-            f.write("\n")
-            f.write("Prizes in forest")
-            for i in range(len(forestNodes)):
-                f.write("\t%d" % (len(forestNodes[i])-len(steinerNodes[i])))
-            f.write("\n")
-            f.write("Total prizes")
-            for i in range(len(forestNodes)):
-                f.write("\t%d" % len(prizes))
-            f.write("\n")
-        # Only write hub node degrees and the ratio
-        # of hub node degree to forest size if a hub was specified
-        if not options.hubnode is None:
-            f.write("%s degree" % options.hubnode)
-            for degree in hubDegrees:
-                f.write("\t%d" % degree)
-            f.write("\n")
-            f.write("%s degree / forest size" % options.hubnode)
-            for i in range(len(forestNodes)):
-                if (len(forestNodes[i]) == 0):
-                    f.write("\t0")
-                else:
-                    f.write("\t%f" % (float(hubDegrees[i]) / len(forestNodes[i])))
-            f.write("\n")
-            
-    print "%d empty forests" % emptyCount
-    
-    # See http://stackoverflow.com/questions/4869189/how-to-pivot-data-in-a-csv-file
-    # Transpose the file so that rows become columns
-    # The reader iterator iterates over rows and izip is used to create new tuples
-    # from the ith element in each row
-    with open(tmpFile, "rb") as beforeTransFile, open(options.outfile + "_size.txt", "wb") as afterTransFile:
-        transposed = itertools.izip(*csv.reader(beforeTransFile, delimiter = "\t"))
-        csv.writer(afterTransFile, delimiter = "\t").writerows(transposed)
-    # Remove the temporary file
-    os.remove(tmpFile)
+    ins.BeginPhase("write")
+    if options.statefile is not None:
+        summary.WriteState(options.statefile)
+
+    if trackChanges:
+        WriteConvergence(options.convergence, summary)
+        converged = ConvergedForestCount(summary, options.tolerance, options.window)
+        if converged is None:
+            print "Frequencies did not converge with tolerance %g over %d forests" % (options.tolerance, options.window)
+        else:
+            print "Frequencies converged after %d forests with tolerance %g over %d forests" % (converged, options.tolerance, options.window)
+
+    if options.incidence:
+        WriteIncidence(options.outfile, summary)
+    if options.similarity:
+        WriteSimilarity(options.outfile, summary)
+    if options.metrics:
+        hubNodes = []
+        if options.hubnodes is not None:
+            hubNodes = options.hubnodes.split("|")
+        WriteMetrics(options.outfile, summary, hubNodes)
+
+    # Write the sizes of each forest with one row per forest
+    sizeTable = SizeTable(summary)
+    print "%d empty forests" % (sizeTable["Forest size"] == 0).sum()
+    WriteSizeTable(options.outfile + "_size.txt", sizeTable, summary.hubnode)
 
     # Write the union network in the TPS tab-delimited format
     # Edge directions are not recorded and must be specified in
     # the TPS partial model (prior knowledge) file
-    edgeFreqDict = SetFrequency(forestEdges)
+    # The union network may be pruned before it is written
+    sources = None
+    if options.sourcefile is not None:
+        sources = LoadSources(options.sourcefile)
+    edgeFreqs = PruneUnion(summary.EdgeFrequencies(), options.minfreq, options.topk, sources)
     with open(options.outfile + "_union.tsv", "w") as unionFile:
-        for (edge, freq) in edgeFreqDict.iteritems():
+        for (edge, freq) in edgeFreqs:
             unionFile.write("%s\t%s\n" % (edge[0], edge[1]))
 
     # Write the node and edge annotation files and union network in the
@@ -132,7 +155,7 @@ def Main(argList):
         # Write a Cytoscape attribute table file for the forest node frequency
         with open(options.outfile + "_nodeAnnotation.txt", "w") as f:
             f.write("Protein\tNodeFreq\tPrize\n")
-            for (node, freq) in SetFrequency(forestNodes).iteritems():
+            for (node, freq) in summary.NodeFrequencies():
                 f.write("%s\t%f\t%s\n" % (node, freq, prizeMap.setdefault(node, "")))
     
         # Write a Cytoscape attribute table file for the forest edge frequency and a sif file for the union of
@@ -140,14 +163,14 @@ def Main(argList):
         with open(options.outfile + "_edgeAnnotation.txt", "w") as edaFile:
             edaFile.write("Interaction\tEdgeFreq\n")
             with open(options.outfile + "_union.sif", "w") as sifFile:
-                for (edge, freq) in edgeFreqDict.iteritems():
+                for (edge, freq) in edgeFreqs:
                     edaFile.write("%s (pp) %s\t%f\n" % (edge[0], edge[1], freq))
                     sifFile.write("%s pp %s\n" % (edge[0], edge[1]))
     else:
         # Write a Cytoscape .noa file for the forest node frequency
         with open(options.outfile + "_nodeFreq.noa", "w") as f:
             f.write("NodeFrequency\n")
-            for (node, freq) in SetFrequency(forestNodes).iteritems():
+            for (node, freq) in summary.NodeFrequencies():
                 f.write("%s = %f\n" % (node, freq))
     
         # Write a Cytoscape .eda file for the forest edge frequency and a sif file for the union of
@@ -155,10 +178,682 @@ def Main(argList):
         with open(options.outfile + "_edgeFreq.eda", "w") as edaFile:
             with open(options.outfile + "_union.sif", "w") as sifFile:
                 edaFile.write("EdgeFrequency\n")
-                for (edge, freq) in edgeFreqDict.iteritems():
+                for (edge, freq) in edgeFreqs:
                     edaFile.write("%s (pp) %s = %f\n" % (edge[0], edge[1], freq))
                     sifFile.write("%s pp %s\n" % (edge[0], edge[1]))
 
+    ins.Finish()
+
+
+class ForestSummary(object):
+    """The running node and edge counts of a family of forests.  Each forest is
+    added as it is read and then discarded.  Node names and undirected edges
+    are interned as integer ids, and the counts are stored in lists indexed by
+    those ids, so the memory used grows with the union of the forests instead
+    of the number of forests.  Nodes and edges are reported in the order they
+    were first seen.
+
+    If trackChanges is set, the summary also records the largest absolute
+    change in any node or edge frequency when each forest is added.  The
+    forests must then be added one at a time in a single process.
+
+    If keepIncidence is set, the summary also stores the node and edge ids in
+    each forest as the rows of forest by node and forest by edge incidence
+    matrices in compressed sparse row (CSR) form.
+    """
+    def __init__(self, prizes=frozenset(), hubnode=None, trackChanges=False, keepIncidence=False):
+        # The proteins with prizes and the hub node of interest (optional)
+        self.prizes = prizes
+        self.hubnode = hubnode
+        # Maps node names to ids and node ids to names and counts
+        self.nodeIds = dict()
+        self.nodeNames = []
+        self.nodeCounts = []
+        # Maps sorted pairs of node ids to edge ids and edge ids to the
+        # node id pairs and counts
+        self.edgeIds = dict()
+        self.edgeNodes = []
+        self.edgeCounts = []
+        # The name, number of nodes, number of Steiner nodes, and hub node
+        # degree of each forest
+        self.names = []
+        self.sizes = []
+        self.steinerCounts = []
+        self.hubDegrees = []
+        # The largest node and edge frequency changes when each forest was
+        # added and the number of nodes and edges with each count
+        self.trackChanges = trackChanges
+        self.nodeChanges = []
+        self.edgeChanges = []
+        self.nodeHistogram = [0]
+        self.edgeHistogram = [0]
+        # The CSR row pointers and column indices of the incidence matrices
+        self.keepIncidence = keepIncidence
+        self.nodeIndptr = array("l", [0])
+        self.nodeIndices = array("l")
+        self.edgeIndptr = array("l", [0])
+        self.edgeIndices = array("l")
+
+    def ForestCount(self):
+        """The number of forests that have been added"""
+        return len(self.names)
+
+    def NodeId(self, node):
+        """Return the id of a node name, assigning a new id if needed"""
+        nodeId = self.nodeIds.get(node)
+        if nodeId is None:
+            nodeId = len(self.nodeNames)
+            self.nodeIds[node] = nodeId
+            self.nodeNames.append(node)
+            self.nodeCounts.append(0)
+        return nodeId
+
+    def EdgeId(self, nodePair):
+        """Return the id of a sorted pair of node ids, assigning a new id if
+        needed
+        """
+        edgeId = self.edgeIds.get(nodePair)
+        if edgeId is None:
+            edgeId = len(self.edgeNodes)
+            self.edgeIds[nodePair] = edgeId
+            self.edgeNodes.append(nodePair)
+            self.edgeCounts.append(0)
+        return edgeId
+
+    def AddSifFile(self, sifFile, baseDir=None):
+        """Read a sif forest and add it to the counts.  The file is parsed the
+        same way as LoadSifNetwork.  Blank lines are skipped.  The forest is
+        named by fp.ForestName.
+        """
+        with open(sifFile) as f:
+            edgeParts = (edgeLine.split() for edgeLine in f)
+            # Ignore blank lines
+            self.AddEdgeList(fp.ForestName(sifFile, baseDir), ((parts[0], parts[2]) for parts in edgeParts if len(parts) > 0))
+
+    def AddEdgeList(self, name, edges):
+        """Add a forest given as an iterable of (node, node) name pairs, such
+        as a forest held in memory.  Self edges and repeated edges are
+        ignored, and the edges are treated as undirected.
+        """
+        # Keep the edges in the order they appear so that the edge ids do
+        # not depend on the node ids
+        forestEdges = []
+        seenEdges = set()
+        for node1, node2 in edges:
+            if node1 == node2:
+                continue
+            # Sort the nodes in each edge tuple because we treat them as
+            # undirected edges
+            node1, node2 = SortEdge((node1, node2))
+            nodePair = (self.NodeId(node1), self.NodeId(node2))
+            if not nodePair in seenEdges:
+                seenEdges.add(nodePair)
+                forestEdges.append(nodePair)
+        self.AddForest(name, forestEdges)
+
+    def AddForest(self, name, forestEdges):
+        """Add a forest to the counts, where forestEdges is a list of distinct
+        pairs of node ids sorted by node name
+        """
+        forestNodes = set()
+        for nodePair in forestEdges:
+            forestNodes.update(nodePair)
+        edgeIds = [self.EdgeId(nodePair) for nodePair in forestEdges]
+
+        if self.trackChanges:
+            forestCount = self.ForestCount() + 1
+            self.nodeChanges.append(MaxFrequencyChange(self.nodeHistogram, \
+                [self.nodeCounts[nodeId] for nodeId in forestNodes], forestCount))
+            self.edgeChanges.append(MaxFrequencyChange(self.edgeHistogram, \
+                [self.edgeCounts[edgeId] for edgeId in edgeIds], forestCount))
+
+        for edgeId in edgeIds:
+            self.edgeCounts[edgeId] += 1
+        for nodeId in forestNodes:
+            self.nodeCounts[nodeId] += 1
+
+        if self.keepIncidence:
+            self.nodeIndices.extend(sorted(forestNodes))
+            self.nodeIndptr.append(len(self.nodeIndices))
+            self.edgeIndices.extend(sorted(edgeIds))
+            self.edgeIndptr.append(len(self.edgeIndices))
+
+        self.names.append(name)
+        self.sizes.append(len(forestNodes))
+        # The Steiner nodes are the forest nodes that are not prizes
+        self.steinerCounts.append(sum(1 for nodeId in forestNodes if self.nodeNames[nodeId] not in self.prizes))
+        # The degree is 0 if the hub node is not in the forest
+        hubDegree = 0
+        hubId = self.nodeIds.get(self.hubnode)
+        if hubId is not None and hubId in forestNodes:
+            hubDegree = sum(1 for nodePair in forestEdges if hubId in nodePair)
+        self.hubDegrees.append(hubDegree)
+
+    def AddPackedForest(self, pack, forestInd):
+        """Add a forest from a ForestPack to the counts.  The forest is added
+        the same way as its original sif file.
+        """
+        forestEdges = []
+        for packNode1, packNode2 in pack.ForestNodeIds(forestInd):
+            forestEdges.append((self.NodeId(pack.nodeNames[packNode1]), self.NodeId(pack.nodeNames[packNode2])))
+        self.AddForest(pack.names[forestInd], forestEdges)
+
+    def AddForests(self, forests, workers=1, packFile=None, baseDir=None):
+        """Add forests to the counts in order.  The forests are sif filenames,
+        which are named by their path relative to baseDir if it is provided,
+        or, if packFile is provided, the names of forests in the pack file.
+        If workers is greater than 1, the list of forests is split into
+        consecutive shards that are summarized by a pool of worker processes,
+        and the partial summaries are merged in order.  The summary is the
+        same as reading the forests in a single process.  Frequency changes
+        can only be tracked in a single process, so workers is ignored when
+        tracking changes.
+        """
+        if workers == 1 or len(forests) == 0 or self.trackChanges:
+            self.AddShard(forests, packFile, baseDir)
+            return
+
+        # Use several shards per worker to balance the load
+        shardCount = min(len(forests), 4*workers)
+        bounds = [len(forests)*shard // shardCount for shard in range(shardCount + 1)]
+        shards = [(forests[bounds[i]:bounds[i+1]], packFile, baseDir, self.prizes, self.hubnode, self.keepIncidence) \
+            for i in range(shardCount)]
+
+        pool = multiprocessing.Pool(workers)
+        try:
+            # imap returns the partial summaries in shard order
+            for shardSummary in pool.imap(SummarizeShard, shards):
+                self.Merge(shardSummary)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+    def AddShard(self, forests, packFile=None, baseDir=None):
+        """Add sif files or the named forests in a pack file in this process"""
+        if packFile is None:
+            for sifFile in forests:
+                self.AddSifFile(sifFile, baseDir)
+        else:
+            pack = fp.ForestPack(packFile)
+            for name in forests:
+                self.AddPackedForest(pack, pack.ForestIndex(name))
+
+    def Merge(self, other):
+        """Add the counts and forests of another summary to this summary.
+        Merging the summaries of consecutive groups of forests in order gives
+        the same summary as adding the forests one at a time.
+        """
+        assert not self.trackChanges, "Cannot merge summaries that track frequency changes"
+        # Map the other summary's node ids to ids in this summary
+        nodeMap = [self.NodeId(node) for node in other.nodeNames]
+        for nodeId, count in itertools.izip(nodeMap, other.nodeCounts):
+            self.nodeCounts[nodeId] += count
+        edgeMap = [self.EdgeId((nodeMap[node1], nodeMap[node2])) for node1, node2 in other.edgeNodes]
+        for edgeId, count in itertools.izip(edgeMap, other.edgeCounts):
+            self.edgeCounts[edgeId] += count
+
+        if self.keepIncidence:
+            assert other.keepIncidence, "Cannot merge a summary without incidence matrices"
+            # Rows keep their order but the ids are no longer sorted
+            nodeOffset = len(self.nodeIndices)
+            self.nodeIndices.extend(nodeMap[nodeId] for nodeId in other.nodeIndices)
+            self.nodeIndptr.extend(nodeOffset + ptr for ptr in other.nodeIndptr[1:])
+            edgeOffset = len(self.edgeIndices)
+            self.edgeIndices.extend(edgeMap[edgeId] for edgeId in other.edgeIndices)
+            self.edgeIndptr.extend(edgeOffset + ptr for ptr in other.edgeIndptr[1:])
+
+        self.names.extend(other.names)
+        self.sizes.extend(other.sizes)
+        self.steinerCounts.extend(other.steinerCounts)
+        self.hubDegrees.extend(other.hubDegrees)
+
+    def WriteState(self, stateFile):
+        """Save the summary as a json file that can be loaded with
+        LoadSummaryState.  The file is written to a temporary file and renamed
+        so that an interrupted run does not corrupt the saved state.
+        """
+        state = dict(version=STATE_VERSION, prizes=sorted(self.prizes), hubnode=self.hubnode,
+            nodes=self.nodeNames, nodeCounts=self.nodeCounts, edges=self.edgeNodes,
+            edgeCounts=self.edgeCounts, names=self.names, sizes=self.sizes,
+            steinerCounts=self.steinerCounts, hubDegrees=self.hubDegrees,
+            trackChanges=self.trackChanges, nodeChanges=self.nodeChanges,
+            edgeChanges=self.edgeChanges, keepIncidence=self.keepIncidence,
+            nodeIndptr=self.nodeIndptr.tolist(), nodeIndices=self.nodeIndices.tolist(),
+            edgeIndptr=self.edgeIndptr.tolist(), edgeIndices=self.edgeIndices.tolist())
+        tmpFile = stateFile + ".tmp"
+        with open(tmpFile, "w") as f:
+            json.dump(state, f)
+        os.rename(tmpFile, stateFile)
+
+    def IncidenceMatrices(self):
+        """Build the incidence matrices, which require scipy.  Row i is the
+        forest names[i], column j of the node matrix is the node nodeNames[j],
+        and column j of the edge matrix is the edge edgeNodes[j].  An entry is
+        1 if the forest contains the node or edge.
+
+        Return: the forest by node and forest by edge scipy CSR matrices
+        """
+        assert self.keepIncidence, "The incidence matrices were not kept"
+        from scipy import sparse
+        matrices = []
+        for indptr, indices, columns in [(self.nodeIndptr, self.nodeIndices, len(self.nodeNames)), \
+                (self.edgeIndptr, self.edgeIndices, len(self.edgeNodes))]:
+            indices = np.frombuffer(indices, dtype=np.int_) if len(indices) > 0 else np.zeros(0, dtype=np.int_)
+            matrix = sparse.csr_matrix((np.ones(len(indices), dtype=np.int32), indices, np.frombuffer(indptr, dtype=np.int_)), \
+                shape=(self.ForestCount(), columns))
+            matrix.sort_indices()
+            matrices.append(matrix)
+        return tuple(matrices)
+
+    def NodeFrequencies(self):
+        """Return a list of (node, frequency) tuples, where the frequency is
+        the fraction of forests that contain the node
+        """
+        n = float(self.ForestCount()) # Want floating point division
+        return [(node, count / n) for node, count in itertools.izip(self.nodeNames, self.nodeCounts)]
+
+    def EdgeFrequencies(self):
+        """Return a list of ((node1, node2), frequency) tuples, where the nodes
+        are sorted alphabetically and the frequency is the fraction of forests
+        that contain the edge
+        """
+        n = float(self.ForestCount()) # Want floating point division
+        return [((self.nodeNames[node1], self.nodeNames[node2]), count / n) \
+            for (node1, node2), count in itertools.izip(self.edgeNodes, self.edgeCounts)]
+
+
+def LoadSummaryState(stateFile, prizes=frozenset(), hubnode=None):
+    """Load a summary saved with ForestSummary.WriteState.  The prizes and hub
+    node must be the same as the ones used to create the saved summary.
+
+    Return: the ForestSummary
+    """
+    with open(stateFile) as f:
+        state = json.load(f)
+
+    if state["version"] != STATE_VERSION:
+        raise RuntimeError("%s was written by an incompatible version of summarize_sif.py" % stateFile)
+    if set(state["prizes"]) != set(prizes) or state["hubnode"] != hubnode:
+        raise RuntimeError("%s was created with a different prize file or hub node" % stateFile)
+
+    # json stores strings as unicode
+    summary = ForestSummary(prizes, hubnode, state["trackChanges"], state["keepIncidence"])
+    summary.nodeNames = [str(node) for node in state["nodes"]]
+    summary.nodeIds = dict((node, nodeId) for nodeId, node in enumerate(summary.nodeNames))
+    summary.nodeCounts = state["nodeCounts"]
+    summary.edgeNodes = [tuple(nodePair) for nodePair in state["edges"]]
+    summary.edgeIds = dict((nodePair, edgeId) for edgeId, nodePair in enumerate(summary.edgeNodes))
+    summary.edgeCounts = state["edgeCounts"]
+    summary.names = [str(name) for name in state["names"]]
+    summary.sizes = state["sizes"]
+    summary.steinerCounts = state["steinerCounts"]
+    summary.hubDegrees = state["hubDegrees"]
+    summary.nodeChanges = state["nodeChanges"]
+    summary.edgeChanges = state["edgeChanges"]
+    summary.nodeIndptr = array("l", state["nodeIndptr"])
+    summary.nodeIndices = array("l", state["nodeIndices"])
+    summary.edgeIndptr = array("l", state["edgeIndptr"])
+    summary.edgeIndices = array("l", state["edgeIndices"])
+    if summary.trackChanges:
+        summary.nodeHistogram = CountHistogram(summary.nodeCounts, summary.ForestCount())
+        summary.edgeHistogram = CountHistogram(summary.edgeCounts, summary.ForestCount())
+    return summary
+
+
+def CountHistogram(counts, forestCount):
+    """Return a list where entry c is the number of nodes or edges that are
+    in c forests, for c from 0 to forestCount.  Entry 0 is not used.
+    """
+    histogram = [0]*(forestCount + 1)
+    for count in counts:
+        histogram[count] += 1
+    histogram[0] = 0
+    return histogram
+
+
+def MaxFrequencyChange(histogram, priorCounts, forestCount):
+    """Compute the largest absolute change in the frequency of any node or edge
+    when a forest is added, where forestCount includes the new forest.
+    priorCounts are the counts of the forest's nodes or edges before it is
+    added, and histogram is updated to include the new forest.  An element in
+    c of the previous n-1 forests changes by (n-1-c)/(n(n-1)) if it is in the
+    new forest and c/(n(n-1)) if it is not, so only the smallest count in the
+    forest and the largest count outside the forest are needed.
+
+    Return: the largest change or None for the first forest
+    """
+    change = None
+    if forestCount > 1:
+        # Find the largest count of an element that is not in the forest
+        forestHistogram = Counter(priorCounts)
+        maxAbsent = 0
+        for count in range(len(histogram) - 1, 0, -1):
+            if histogram[count] > forestHistogram[count]:
+                maxAbsent = count
+                break
+        maxPresent = 0
+        if len(priorCounts) > 0:
+            maxPresent = forestCount - 1 - min(priorCounts)
+        change = max(maxAbsent, maxPresent) / float(forestCount*(forestCount - 1))
+
+    # Update the number of elements with each count
+    histogram.append(0)
+    for count in priorCounts:
+        histogram[count] -= 1
+        histogram[count + 1] += 1
+    histogram[0] = 0
+    return change
+
+
+def ConvergedForestCount(summary, tolerance, window):
+    """Find the first number of forests at which the node and edge frequency
+    changes of the last window forests are all less than the tolerance
+
+    Return: the number of forests or None if the frequencies did not converge
+    """
+    below = 0
+    for forestInd, (nodeChange, edgeChange) in enumerate(itertools.izip(summary.nodeChanges, summary.edgeChanges)):
+        if nodeChange is not None and nodeChange < tolerance and edgeChange < tolerance:
+            below += 1
+            if below >= window:
+                return forestInd + 1
+        else:
+            below = 0
+    return None
+
+
+def WriteConvergence(convergenceFile, summary):
+    """Write the largest node and edge frequency change after adding each forest"""
+    with open(convergenceFile, "w") as f:
+        f.write("Forests\tForest name\tMax node frequency change\tMax edge frequency change\n")
+        for forestInd, name in enumerate(summary.names):
+            nodeChange = summary.nodeChanges[forestInd]
+            if nodeChange is None:
+                f.write("%d\t%s\tNA\tNA\n" % (forestInd + 1, name))
+            else:
+                f.write("%d\t%s\t%f\t%f\n" % (forestInd + 1, name, nodeChange, summary.edgeChanges[forestInd]))
+
+
+def WriteIncidence(outfilePrefix, summary):
+    """Write the forest by node and forest by edge incidence matrices as scipy
+    .npz files and the forest, node, and edge names that correspond to the
+    matrix rows and columns as text files with one name per line
+    """
+    from scipy import sparse
+    nodeMatrix, edgeMatrix = summary.IncidenceMatrices()
+    sparse.save_npz(outfilePrefix + "_nodeIncidence.npz", nodeMatrix)
+    sparse.save_npz(outfilePrefix + "_edgeIncidence.npz", edgeMatrix)
+
+    with open(outfilePrefix + "_forests.txt", "w") as f:
+        for name in summary.names:
+            f.write("%s\n" % name)
+    with open(outfilePrefix + "_nodes.txt", "w") as f:
+        for node in summary.nodeNames:
+            f.write("%s\n" % node)
+    with open(outfilePrefix + "_edges.txt", "w") as f:
+        for (node1, node2) in summary.edgeNodes:
+            f.write("%s\t%s\n" % (summary.nodeNames[node1], summary.nodeNames[node2]))
+    print "Wrote %d x %d node and %d x %d edge incidence matrices" % (nodeMatrix.shape + edgeMatrix.shape)
+
+
+def LoadIncidence(outfilePrefix):
+    """Load the incidence matrices and names written by WriteIncidence
+
+    Return: the list of forest names, list of node names, list of edge
+    tuples, forest by node matrix, and forest by edge matrix
+    """
+    from scipy import sparse
+    with open(outfilePrefix + "_forests.txt") as f:
+        forests = [line.rstrip("\n") for line in f]
+    with open(outfilePrefix + "_nodes.txt") as f:
+        nodes = [line.rstrip("\n") for line in f]
+    with open(outfilePrefix + "_edges.txt") as f:
+        edges = [tuple(line.rstrip("\n").split("\t")) for line in f]
+    nodeMatrix = sparse.load_npz(outfilePrefix + "_nodeIncidence.npz")
+    edgeMatrix = sparse.load_npz(outfilePrefix + "_edgeIncidence.npz")
+    return forests, nodes, edges, nodeMatrix, edgeMatrix
+
+
+def JaccardMatrix(incidence):
+    """Compute the Jaccard similarity of every pair of rows in a sparse
+    incidence matrix.  The intersection sizes of all pairs are the entries of
+    the sparse product of the matrix and its transpose.  Two empty rows have a
+    similarity of 1.
+
+    Return: a dense square float32 numpy array
+    """
+    intersections = incidence.dot(incidence.T).toarray().astype(np.float64)
+    sizes = np.diag(intersections)
+    unions = sizes[:, np.newaxis] + sizes[np.newaxis, :] - intersections
+    similarity = np.ones(intersections.shape)
+    nonEmpty = unions > 0
+    similarity[nonEmpty] = intersections[nonEmpty] / unions[nonEmpty]
+    return similarity.astype(np.float32)
+
+
+def DiversityStats(similarity):
+    """Summarize the similarity of all distinct pairs of forests
+
+    Return: a list of (statistic name, value) tuples, where the value is
+    None if there are fewer than two forests
+    """
+    pairs = similarity[np.triu_indices(similarity.shape[0], 1)].astype(np.float64)
+    names = ["Mean pairwise Jaccard", "Median pairwise Jaccard", "Min pairwise Jaccard", \
+        "Max pairwise Jaccard", "Fraction of identical pairs"]
+    if len(pairs) == 0:
+        return [(name, None) for name in names]
+    values = [np.mean(pairs), np.median(pairs), np.min(pairs), np.max(pairs), np.mean(pairs == 1)]
+    return zip(names, values)
+
+
+def WriteSimilarity(outfilePrefix, summary):
+    """Write the node and edge Jaccard similarity matrices of all pairs of
+    forests in a compressed .npz file and a table of the diversity statistics
+    """
+    nodeMatrix, edgeMatrix = summary.IncidenceMatrices()
+    nodeSimilarity = JaccardMatrix(nodeMatrix)
+    edgeSimilarity = JaccardMatrix(edgeMatrix)
+    np.savez_compressed(outfilePrefix + "_similarity.npz", forests=np.array(summary.names), \
+        nodeJaccard=nodeSimilarity, edgeJaccard=edgeSimilarity)
+
+    with open(outfilePrefix + "_diversity.txt", "w") as f:
+        f.write("Statistic\tNodes\tEdges\n")
+        for (name, nodeValue), (_, edgeValue) in zip(DiversityStats(nodeSimilarity), DiversityStats(edgeSimilarity)):
+            if nodeValue is None:
+                f.write("%s\tNA\tNA\n" % name)
+            else:
+                f.write("%s\t%f\t%f\n" % (name, nodeValue, edgeValue))
+    print "Wrote %d x %d node and edge similarity matrices" % nodeSimilarity.shape
+
+
+def PruneUnion(edgeFreqs, minFreq=0, topK=None, sources=None):
+    """Prune the union network by removing edges with a frequency below minFreq,
+    keeping only the topK most frequent remaining edges, and removing the
+    connected components that do not contain any of the sources.  Each step
+    is skipped if its argument is None, and the number of nodes and edges it
+    removes is reported.  Edges with the same frequency are ranked in the order
+    they were first seen.
+
+    Return: the list of ((node1, node2), frequency) tuples that remain, in the
+    same order as edgeFreqs
+    """
+    if minFreq > 0:
+        kept = [(edge, freq) for (edge, freq) in edgeFreqs if freq >= minFreq]
+        ReportPruning("Minimum edge frequency %g" % minFreq, edgeFreqs, kept)
+        edgeFreqs = kept
+
+    if topK is not None:
+        ranked = sorted(edgeFreqs, key=lambda edgeFreq: edgeFreq[1], reverse=True)
+        topEdges = set(edge for (edge, freq) in ranked[:topK])
+        kept = [(edge, freq) for (edge, freq) in edgeFreqs if edge in topEdges]
+        ReportPruning("Top %d edges" % topK, edgeFreqs, kept)
+        edgeFreqs = kept
+
+    if sources is not None:
+        graph = nx.Graph()
+        graph.add_edges_from(edge for (edge, freq) in edgeFreqs)
+        reachable = set()
+        for source in sources:
+            if source in graph:
+                reachable.update(nx.node_connected_component(graph, source))
+            else:
+                print "Source %s is not in the union network" % source
+        kept = [(edge, freq) for (edge, freq) in edgeFreqs if edge[0] in reachable]
+        ReportPruning("Components with sources", edgeFreqs, kept)
+        edgeFreqs = kept
+
+    return edgeFreqs
+
+
+def ReportPruning(step, before, after):
+    """Print the number of nodes and edges removed by a pruning step"""
+    nodesBefore = set(node for (edge, freq) in before for node in edge)
+    nodesAfter = set(node for (edge, freq) in after for node in edge)
+    print "%s: removed %d of %d nodes and %d of %d edges from the union network" % \
+        (step, len(nodesBefore) - len(nodesAfter), len(nodesBefore), len(before) - len(after), len(before))
+
+
+def LoadSources(sourceFile):
+    """Load the source nodes, which are listed one per line"""
+    with open(sourceFile) as f:
+        return [line.strip() for line in f if len(line.strip()) > 0]
+
+
+def ForestMetrics(summary, hubNodes=[]):
+    """Compute topology metrics of every forest in one pass over the interned
+    edges.  The forests are combined into a single graph with one vertex per
+    node in each forest, which is the block diagonal of the forest graphs.
+    Connected components are found with scipy.sparse.csgraph, and a component
+    is a tree if it has one fewer edge than nodes.
+
+    Return: a list of metric names and a list of numpy arrays with the value
+    of each metric in each forest
+    """
+    from scipy import sparse
+    from scipy.sparse import csgraph
+    nodeMatrix, edgeMatrix = summary.IncidenceMatrices()
+    forestCount, nodeCount = nodeMatrix.shape
+
+    # Each nonzero in the node matrix is a vertex, and vertices are sorted by
+    # forest and then node id
+    vertexForests = np.repeat(np.arange(forestCount), np.diff(nodeMatrix.indptr))
+    vertexKeys = vertexForests.astype(np.int64)*nodeCount + nodeMatrix.indices
+    edgeForests = np.repeat(np.arange(forestCount), np.diff(edgeMatrix.indptr))
+    edgeNodes = np.array(summary.edgeNodes, dtype=np.int64).reshape(-1, 2)[edgeMatrix.indices]
+    vertices1 = np.searchsorted(vertexKeys, edgeForests*nodeCount + edgeNodes[:, 0])
+    vertices2 = np.searchsorted(vertexKeys, edgeForests*nodeCount + edgeNodes[:, 1])
+
+    names = ["Nodes", "Edges", "Components", "Trees", "Largest component"]
+    nodes = np.diff(nodeMatrix.indptr)
+    components = np.zeros(forestCount, dtype=np.int64)
+    trees = np.zeros(forestCount, dtype=np.int64)
+    largest = np.zeros(forestCount, dtype=np.int64)
+    if len(vertexKeys) > 0:
+        vertexCount = len(vertexKeys)
+        graph = sparse.csr_matrix((np.ones(len(vertices1)), (vertices1, vertices2)), shape=(vertexCount, vertexCount))
+        componentCount, labels = csgraph.connected_components(graph, directed=False)
+        componentForests = np.zeros(componentCount, dtype=np.int64)
+        componentForests[labels] = vertexForests
+        componentNodes = np.bincount(labels, minlength=componentCount)
+        componentEdges = np.bincount(labels[vertices1], minlength=componentCount)
+        components = np.bincount(componentForests, minlength=forestCount)
+        trees = np.bincount(componentForests[componentEdges == componentNodes - 1], minlength=forestCount)
+        np.maximum.at(largest, componentForests, componentNodes)
+    values = [nodes, np.diff(edgeMatrix.indptr), components, trees, largest]
+
+    # The degree of each vertex, which is 0 for hubs not in a forest
+    degrees = np.bincount(vertices1, minlength=len(vertexKeys)) + np.bincount(vertices2, minlength=len(vertexKeys))
+    for hubNode in hubNodes:
+        hubDegrees = np.zeros(forestCount, dtype=np.int64)
+        hubId = summary.nodeIds.get(hubNode)
+        if hubId is not None:
+            hubVertices = nodeMatrix.indices == hubId
+            hubDegrees[vertexForests[hubVertices]] = degrees[hubVertices]
+        names.append("%s degree" % hubNode)
+        values.append(hubDegrees)
+
+    return names, values
+
+
+def WriteMetrics(outfilePrefix, summary, hubNodes=[]):
+    """Write a table of the topology metrics of each forest"""
+    names, values = ForestMetrics(summary, hubNodes)
+    with open(outfilePrefix + "_metrics.txt", "w") as f:
+        f.write("Forest name\t%s\n" % "\t".join(names))
+        for forestInd, forestName in enumerate(summary.names):
+            f.write("%s\t%s\n" % (forestName, "\t".join("%d" % metric[forestInd] for metric in values)))
+    print "Wrote %d metrics for %d forests" % (len(names), summary.ForestCount())
+
+
+def NaturalSortKey(filename):
+    """A sort key that orders the numbers in filenames numerically so that
+    forests are sorted by seed (e.g. seed2 before seed10)
+    """
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", os.path.basename(filename))]
+
+
+def SummarizeSifFiles(sifFiles, prizes=frozenset(), hubnode=None, workers=1):
+    """Read the sif forests into a new ForestSummary, using multiple worker
+    processes if workers is greater than 1
+
+    Return: the ForestSummary
+    """
+    summary = ForestSummary(prizes, hubnode)
+    summary.AddForests(sifFiles, workers)
+    return summary
+
+
+def SizeTable(summary):
+    """Build the table of forest sizes with one row per forest.  The Steiner
+    node and prize columns are only included if the summary has prizes, and
+    the hub node degree columns are only included if it has a hub node.
+
+    Return: a pandas DataFrame
+    """
+    sizes = np.array(summary.sizes, dtype=int)
+    table = pd.DataFrame({"Forest name": summary.names, "Forest size": sizes}, columns=["Forest name", "Forest size"])
+    if len(summary.prizes) > 0:
+        steinerCounts = np.array(summary.steinerCounts, dtype=int)
+        table["Steiner nodes"] = steinerCounts
+        table["Prizes in forest"] = sizes - steinerCounts
+        table["Total prizes"] = len(summary.prizes)
+    if summary.hubnode is not None:
+        hubDegrees = np.array(summary.hubDegrees, dtype=int)
+        table["%s degree" % summary.hubnode] = hubDegrees
+        # The ratio is 0 for empty forests
+        table["%s degree / forest size" % summary.hubnode] = hubDegrees / np.maximum(sizes, 1).astype(float)
+    return table
+
+
+def WriteSizeTable(outFile, sizeTable, hubnode=None):
+    """Write the table of forest sizes in the same format as earlier
+    summaries, which have Windows line endings and a hub degree ratio that is
+    0 for empty forests and has 6 decimal places otherwise
+    """
+    if hubnode is not None:
+        sizeTable = sizeTable.copy()
+        ratioColumn = "%s degree / forest size" % hubnode
+        sizeTable[ratioColumn] = ["0" if size == 0 else "%f" % ratio \
+            for size, ratio in zip(sizeTable["Forest size"], sizeTable[ratioColumn])]
+    sizeTable.to_csv(outFile, sep="\t", index=False, line_terminator="\r\n")
+
+
+def SummarizeShard(shard):
+    """Read a shard of forests, where shard is a tuple of the sif filenames
+    or forest names, pack filename or None, directory the sif files are named
+    relative to or None, prizes, hub node, and whether to keep the incidence
+    matrices
+
+    Return: the ForestSummary of the shard
+    """
+    forests, packFile, baseDir, prizes, hubnode, keepIncidence = shard
+    summary = ForestSummary(prizes, hubnode, keepIncidence=keepIncidence)
+    summary.AddShard(forests, packFile, baseDir)
+    return summary
+
 
 def LoadSifNetwork(networkFile):
     """Load an interaction network as an undirected graph from a sif format
@@ -236,13 +931,28 @@ def LoadPrizes(prizeFile):
 def CreateParser():
     """Setup the option parser"""
     parser = ArgumentParser(description="Summarize a collection of Steiner forests")
-    parser.add_argument("--indir", type=str, dest="indir", help="The path to the directory that contains sif files.", default=None, required=True)
+    parser.add_argument("--indir", type=str, dest="indir", help="The path to the directory that contains sif files.  Not needed if a packfile is provided instead.", default=None)
     parser.add_argument("--pattern", type=str, dest="pattern", help="The filename pattern of the sif files in indir.  Not needed if a siflist is provided instead", default=None)
     parser.add_argument("--siflist", type=str, dest="siflist", help="A list of sif files in indir delimited by '|'.  Not used if a pattern is provided.", default=None)
+    parser.add_argument("--packfile", type=str, dest="packfile", help="The path and filename of a pack file created by forest_pack.py that is read instead of sif files in indir (optional).  The pattern or siflist select forests in the pack by their original sif filenames.  All forests are used if neither is provided.", default=None)
     parser.add_argument("--prizefile", type=str, dest="prizefile", help="The path and filename prefix of the prize file (optional).  Assumes the same prize file was used for all forests.", default=None)
     parser.add_argument("--outfile", type=str, dest="outfile", help="The path and filename prefix of the output.  Does not include an extension.", default=None, required=True)
     parser.add_argument("--hubnode", type=str, dest="hubnode", help="The name of a hub node in the network (optional).  The degree of this node will be reported.", default=None)    
+    parser.add_argument("--workers", type=int, dest="workers", help="The number of processes used to read the sif files (default 1).  The output does not depend on the number of workers.", default=1)
+    parser.add_argument("--statefile", type=str, dest="statefile", help="The path and filename of a json file that saves the forest counts (optional).  If the file exists, only the forests that are not already in the saved counts are read, and the file is updated.  Allows the summary to be refreshed while new forests are generated.", default=None)
+    parser.add_argument("--settle", type=float, dest="settle", help="With a statefile, sif files modified within this many seconds are not read because forest.py may still be writing them.  They are read when the saved counts are refreshed later (default 60).", default=60, required=False)
+    parser.add_argument("--convergence", type=str, dest="convergence", help="The path and filename of a tab-delimited file for the largest change in any node or edge frequency as each forest is added (optional).  Forests are added in seed order, and the number of forests at which the frequencies converged is reported.  Forests are read by a single process.", default=None)
+    parser.add_argument("--tolerance", type=float, dest="tolerance", help="The frequencies converge when the largest change is less than this tolerance for a window of consecutive forests (default 0.01).", default=0.01)
+    parser.add_argument("--window", type=int, dest="window", help="The number of consecutive forests used to test convergence (default 10).", default=10)
+    parser.add_argument("--incidence", action="store_true", dest="incidence", help="This flag writes sparse forest by node and forest by edge incidence matrices (<outfile>_nodeIncidence.npz and <outfile>_edgeIncidence.npz) and the forest, node, and edge names of their rows and columns.  Requires scipy.", default=False)
+    parser.add_argument("--similarity", action="store_true", dest="similarity", help="This flag writes the node and edge Jaccard similarity of every pair of forests (<outfile>_similarity.npz) and statistics that summarize the diversity of the forests (<outfile>_diversity.txt).  Requires scipy.", default=False)
+    parser.add_argument("--metrics", action="store_true", dest="metrics", help="This flag writes a table of the number of nodes, edges, connected components, and trees, the size of the largest component, and the degrees of the hubnodes in each forest (<outfile>_metrics.txt).  Requires scipy.", default=False)
+    parser.add_argument("--hubnodes", type=str, dest="hubnodes", help="A list of hub nodes delimited by '|' whose degrees are included in the metrics table (optional).", default=None)
+    parser.add_argument("--minfreq", type=float, dest="minfreq", help="Remove edges that appear in less than this fraction of the forests from the union network (default 0).", default=0)
+    parser.add_argument("--topk", type=int, dest="topk", help="Only keep this number of the most frequent edges in the union network (optional).  Applied after minfreq.", default=None)
+    parser.add_argument("--sourcefile", type=str, dest="sourcefile", help="The path and filename of a file that lists the source nodes, one per line (optional).  Connected components of the union network that do not contain a source node are removed after applying minfreq and topk.", default=None)
     parser.add_argument("--cyto28", action="store_true", dest="cyto28", help="This flag will generate node and edge frequency annotation files in the Cytoscape 2.8 format instead of the default Cytoscape 3 style.", default=False)
+    ins.AddProfileArgument(parser)
     return parser
 
 
@@ -0,0 +1,88 @@
+import os, shutil, sys, tempfile
+import numpy as np
+from scipy import sparse
+
+# Create the path to forest relative to the test_aggregate_runs.py path
+# Workaround due to lack of a formal Python package for the pcsf scripts
+test_dir = os.path.dirname(__file__)
+path = os.path.abspath(os.path.join(test_dir, ".."))
+if not path in sys.path:
+    sys.path.insert(1, path)
+
+import aggregate_runs as ar
+import summarize_sif as ss
+
+def load_aggregate(aggregate_file):
+    '''
+    Load an aggregate table as a dict that maps names to the other columns
+    '''
+    with open(aggregate_file) as aggregate_f:
+        aggregate_f.readline()
+        return dict((line.split("\t")[0], map(float, line.strip().split("\t")[1:])) for line in aggregate_f)
+
+class TestAggregateRuns:
+
+    data_dir = os.path.join(test_dir, "reference_data")
+
+    def summarize_runs(self, out_dir):
+        '''
+        Summarize all toy graphs as the real run and each toy graph as
+        another run
+        '''
+        ss.Main(["--indir", self.data_dir, "--pattern", "toy_graph_*.sif", \
+            "--outfile", os.path.join(out_dir, "real_summary")])
+        for run in range(4):
+            run_dir = os.path.join(out_dir, "run{}".format(run))
+            os.mkdir(run_dir)
+            ss.Main(["--indir", self.data_dir, "--siflist", "toy_graph_{}.sif".format(run), \
+                "--outfile", os.path.join(run_dir, "toy_summary")])
+
+    def test_PValues(self):
+        '''
+        Test the empirical p-values of the real frequencies
+        '''
+        try:
+            out_dir = tempfile.mkdtemp()
+            self.summarize_runs(out_dir)
+            ar.Main(["--real", os.path.join(out_dir, "real_summary"), \
+                "--runs", os.path.join(out_dir, "run*", "*_summary"), \
+                "--outfile", os.path.join(out_dir, "aggregate"), "--matrix"])
+
+            edges = load_aggregate(os.path.join(out_dir, "aggregate_edgeAggregate.txt"))
+            # A-B has a real frequency of 1 and is in every run
+            assert edges["A (pp) B"] == [1.0, 1.0, 1.0]
+            # B-C has a real frequency of 0.5 and is in 2 runs
+            assert edges["B (pp) C"] == [0.5, 0.5, 0.6]
+            # B-E has a real frequency of 0.25 and is in 1 run
+            assert edges["B (pp) E"] == [0.25, 0.25, 0.4]
+
+            nodes = load_aggregate(os.path.join(out_dir, "aggregate_nodeAggregate.txt"))
+            assert nodes["E"] == [0.25, 0.25, 0.4]
+
+            matrix = np.load(os.path.join(out_dir, "aggregate_edgeRuns.npz"))
+            frequencies = sparse.csr_matrix((matrix["data"], matrix["indices"], matrix["indptr"]), \
+                shape=tuple(matrix["shape"]))
+            assert frequencies.shape == (4, 5), "Unexpected run by edge matrix shape"
+            column = list(matrix["names"]).index("B (pp) C")
+            # Missing edges are not stored
+            assert frequencies[:, column].nnz == 2, "Unexpected number of runs with B-C"
+            matrix.close()
+        finally:
+            shutil.rmtree(out_dir)
+
+    def test_Support(self):
+        '''
+        Test the bootstrap support of the real nodes and edges
+        '''
+        try:
+            out_dir = tempfile.mkdtemp()
+            self.summarize_runs(out_dir)
+            ar.Main(["--real", os.path.join(out_dir, "real_summary"), \
+                "--runs", os.path.join(out_dir, "run*", "*_summary"), \
+                "--outfile", os.path.join(out_dir, "aggregate"), "--mode", "support"])
+
+            edges = load_aggregate(os.path.join(out_dir, "aggregate_edgeAggregate.txt"))
+            assert edges["B (pp) C"][2] == 0.5
+            assert edges["C (pp) D"][2] == 0.75
+        finally:
+            shutil.rmtree(out_dir)
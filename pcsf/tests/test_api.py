@@ -0,0 +1,100 @@
+import filecmp, glob, os, shutil, sys, tempfile
+
+# Import the pcsf package from the directory that contains it
+test_dir = os.path.dirname(__file__)
+path = os.path.abspath(os.path.join(test_dir, "..", ".."))
+if not path in sys.path:
+    sys.path.insert(1, path)
+
+from pcsf import api
+from test_generate_randomized_networks import random_network
+
+data_dir = os.path.join(test_dir, "..", "..", "data")
+first_file = os.path.join(data_dir, "timeseries", "p-values-first.tsv")
+prev_file = os.path.join(data_dir, "timeseries", "p-values-prev.tsv")
+ts_file = os.path.join(data_dir, "timeseries", "median-time-series.tsv")
+map_file = os.path.join(data_dir, "timeseries", "peptide-mapping.tsv")
+
+class TestApi:
+
+    def test_Prizes(self):
+        '''
+        Test that the in-memory prizes match the prize files written by
+        generate_prizes.py, subsample_peptides.py, and permute_proteins.py
+        '''
+        try:
+            out_dir = tempfile.mkdtemp()
+            scores = api.LoadScores(first_file, prev_file)
+            peptide_map = api.LoadPeptideMap(map_file)
+
+            api.gp.Main(["--firstfile", first_file, "--prevfile", prev_file, "--mapfile", map_file, \
+                "--outfile", os.path.join(out_dir, "prizes.txt")])
+            api.WritePrizes(api.ProteinPrizes(scores, peptide_map), os.path.join(out_dir, "api-prizes.txt"))
+            assert filecmp.cmp(os.path.join(out_dir, "prizes.txt"), os.path.join(out_dir, "api-prizes.txt"), \
+                shallow=False), "Prizes do not match generate_prizes.py"
+
+            prize_prefix = os.path.join(out_dir, "prizes")
+            api.sp.Main(["--firstfile", first_file, "--prevfile", prev_file, "--tsfile", ts_file, \
+                "--mapfile", map_file, "--fraction", "0.5", "--copies", "2", "--seed", "25", \
+                "--streams", "independent", "--prizeprefix", prize_prefix])
+            api.pp.Main(["--firstfile", first_file, "--prevfile", prev_file, "--mapfile", map_file, \
+                "--copies", "2", "--seed", "25", "--streams", "independent", "--nomapfiles", \
+                "--prizeprefix", prize_prefix])
+            bootstrap_prizes = api.BootstrapPrizes(scores, peptide_map, 0.5, [1, 2], 25)
+            permuted_prizes = api.PermutedPrizes(scores, peptide_map, [1, 2], 25)
+            for index in [1, 2]:
+                for prizes, label in [(bootstrap_prizes, "-0.5-bootstrapped"), (permuted_prizes, "-shuffled")]:
+                    api_file = os.path.join(out_dir, "api{}{}.txt".format(label, index))
+                    api.WritePrizes(prizes[index - 1], api_file)
+                    assert filecmp.cmp("{}{}{}.txt".format(prize_prefix, label, index), api_file, shallow=False), \
+                        "Copy {} prizes do not match".format(index)
+            assert not bootstrap_prizes[0].equals(bootstrap_prizes[1]), "Copies share a random stream"
+        finally:
+            shutil.rmtree(out_dir)
+
+    def test_RandomizeNetwork(self):
+        '''
+        Test that an in-memory randomized network matches the copy written
+        by generate_randomized_networks.py
+        '''
+        try:
+            out_dir = tempfile.mkdtemp()
+            network_file = os.path.join(out_dir, "network.tsv")
+            network_df = random_network(2025)
+            network_df.to_csv(network_file, sep='\t', header=True, index=False)
+            api.grn.run(["--network", network_file, "--outdir", out_dir, "--copies", "2", "--backend", "python", \
+                "--seed", "25"])
+
+            network = api.LoadNetwork(network_file)
+            assert len(api.NetworkFrame(network)) == len(network_df)
+            randomized = api.RandomizeNetwork(network, 25, 2, "python")
+            api.WriteNetwork(randomized, os.path.join(out_dir, "api.tsv"), os.path.join(out_dir, "api.sif"))
+            assert filecmp.cmp(os.path.join(out_dir, "network-randomized2.tsv"), os.path.join(out_dir, "api.tsv"), \
+                shallow=False), "The randomized network does not match"
+            assert filecmp.cmp(os.path.join(out_dir, "network-partial-model-randomized2.sif"), \
+                os.path.join(out_dir, "api.sif"), shallow=False), "The partial model does not match"
+        finally:
+            shutil.rmtree(out_dir)
+
+    def test_SummarizeForests(self):
+        '''
+        Test that summarizing forests held in memory matches summarizing the
+        sif files
+        '''
+        sif_files = sorted(glob.glob(os.path.join(test_dir, "reference_data", "toy_graph_*.sif")))
+        forests = []
+        for sif_file in sif_files:
+            with open(sif_file) as sif_f:
+                edges = [(line.split()[0], line.split()[2]) for line in sif_f if line.strip() != ""]
+            forests.append((os.path.basename(sif_file), edges))
+
+        prizes = api.PrizeSeries(["A", "B"], [1.0, 2.0])
+        summary = api.SummarizeForests(forests, prizes, "B")
+        file_summary = api.SummarizeSifFiles(sif_files, prizes, "B")
+        assert api.ForestSizes(summary).equals(api.ForestSizes(file_summary))
+        assert api.NodeFrequencies(summary).equals(api.NodeFrequencies(file_summary))
+        assert api.EdgeFrequencies(summary).equals(api.EdgeFrequencies(file_summary))
+        sizes = api.ForestSizes(summary)
+        assert list(sizes["Forest name"]) == [os.path.basename(sif_file) for sif_file in sif_files]
+        assert list(sizes.columns) == ["Forest name", "Forest size", "Steiner nodes", "Prizes in forest", \
+            "Total prizes", "B degree", "B degree / forest size"]
@@ -0,0 +1,121 @@
+import filecmp, glob, os, shutil, sys, tempfile
+import pytest
+
+# Create the path to forest relative to the test_forest_pack.py path
+# Workaround due to lack of a formal Python package for the pcsf scripts
+test_dir = os.path.dirname(__file__)
+path = os.path.abspath(os.path.join(test_dir, ".."))
+if not path in sys.path:
+    sys.path.insert(1, path)
+
+import forest_pack as fp
+import summarize_sif as ss
+
+class TestForestPack:
+
+    data_dir = os.path.join(test_dir, "reference_data")
+    sif_list = "toy_graph_0.sif|toy_graph_1.sif|toy_graph_2.sif|toy_graph_3.sif"
+
+    def test_ForestPack(self):
+        '''
+        Test packing the toy graphs and reading each forest
+        '''
+        try:
+            out_dir = tempfile.mkdtemp()
+            pack_file = os.path.join(out_dir, "toy.pack")
+            fp.Main(["--indir", self.data_dir, "--siflist", self.sif_list, "--packfile", pack_file])
+
+            pack = fp.ForestPack(pack_file)
+            assert pack.names == self.sif_list.split("|"), "Unexpected forest names"
+            for name in pack.names:
+                graph = ss.LoadSifNetwork(os.path.join(self.data_dir, name))
+                forest_edges = pack.ForestEdges(pack.ForestIndex(name))
+                # The repeated edge in toy_graph_0.sif is removed
+                assert len(forest_edges) == graph.size(), "Unexpected number of edges"
+                assert set(forest_edges) == set(map(ss.SortEdge, graph.edges())), "Unexpected edges"
+        finally:
+            shutil.rmtree(out_dir)
+
+    def test_ForestSeeds(self):
+        '''
+        Test looking up forests by seed
+        '''
+        try:
+            out_dir = tempfile.mkdtemp()
+            for seed in [3, 10, 2]:
+                shutil.copy(os.path.join(self.data_dir, "toy_graph_{}.sif".format(seed % 4)), \
+                    os.path.join(out_dir, "prizes_beta1_mu0_omega1_seed{}optimalForest.sif".format(seed)))
+            pack_file = os.path.join(out_dir, "toy.pack")
+            fp.Main(["--indir", out_dir, "--pattern", "*optimalForest.sif", "--packfile", pack_file, "--remove"])
+
+            assert len(glob.glob(os.path.join(out_dir, "*.sif"))) == 0, "The sif files were not removed"
+            pack = fp.ForestPack(pack_file)
+            assert sorted(pack.seeds) == [2, 3, 10], "Unexpected seeds"
+            graph = ss.LoadSifNetwork(os.path.join(self.data_dir, "toy_graph_2.sif"))
+            assert set(pack.ForestEdges(pack.SeedForestIndex(10))) == set(map(ss.SortEdge, graph.edges())), \
+                "Unexpected edges for seed 10"
+        finally:
+            shutil.rmtree(out_dir)
+
+    def test_SummarizePack(self):
+        '''
+        Test that summarizing a pack file writes the same files as
+        summarizing the sif files
+        '''
+        try:
+            out_dir = tempfile.mkdtemp()
+            pack_file = os.path.join(out_dir, "toy.pack")
+            fp.Main(["--indir", self.data_dir, "--siflist", self.sif_list, "--packfile", pack_file])
+
+            ss.Main(["--indir", self.data_dir, "--siflist", self.sif_list, "--hubnode", "B", \
+                "--outfile", os.path.join(out_dir, "sif")])
+            for workers in [1, 2]:
+                ss.Main(["--packfile", pack_file, "--hubnode", "B", "--workers", str(workers), \
+                    "--outfile", os.path.join(out_dir, "pack{}".format(workers))])
+                for suffix in ["_size.txt", "_union.tsv", "_union.sif", "_nodeAnnotation.txt", "_edgeAnnotation.txt"]:
+                    assert filecmp.cmp(os.path.join(out_dir, "sif" + suffix), \
+                        os.path.join(out_dir, "pack{}".format(workers) + suffix), shallow=False), \
+                        "Packed {} file does not match".format(suffix)
+
+            # Select a subset of the packed forests
+            ss.Main(["--packfile", pack_file, "--siflist", "toy_graph_3.sif", "--outfile", os.path.join(out_dir, "subset")])
+            with open(os.path.join(out_dir, "subset_union.tsv")) as union_f:
+                assert len(union_f.readlines()) == 5, "Unexpected number of union edges"
+        finally:
+            shutil.rmtree(out_dir)
+
+    def test_Subdirectories(self):
+        '''
+        Test that forests with the same filename in different subdirectories
+        are packed and summarized as separate forests
+        '''
+        try:
+            out_dir = tempfile.mkdtemp()
+            sif_name = "x_seed1optimalForest.sif"
+            for sub_dir, lines in [("a", ["A pp B", "B pp C"]), ("b", ["A pp B", "D pp E"])]:
+                os.mkdir(os.path.join(out_dir, sub_dir))
+                with open(os.path.join(out_dir, sub_dir, sif_name), "w") as sif_f:
+                    sif_f.write("\n".join(lines) + "\n")
+            pack_file = os.path.join(out_dir, "x.pack")
+            fp.Main(["--indir", out_dir, "--pattern", os.path.join("*", sif_name), "--packfile", pack_file])
+
+            pack = fp.ForestPack(pack_file)
+            assert sorted(pack.names) == [os.path.join("a", sif_name), os.path.join("b", sif_name)], \
+                "Forests are not named by their relative paths"
+            with pytest.raises(RuntimeError):
+                pack.SeedForestIndex(1)
+
+            for prefix, args in [("sif", ["--indir", out_dir, "--pattern", os.path.join("*", sif_name)]), \
+                ("pack", ["--packfile", pack_file])]:
+                ss.Main(args + ["--outfile", os.path.join(out_dir, prefix)])
+            for suffix in ["_size.txt", "_edgeAnnotation.txt"]:
+                assert filecmp.cmp(os.path.join(out_dir, "sif" + suffix), os.path.join(out_dir, "pack" + suffix), \
+                    shallow=False), "Packed {} file does not match".format(suffix)
+            with open(os.path.join(out_dir, "pack_edgeAnnotation.txt")) as edge_f:
+                assert "D (pp) E\t0.500000\n" in edge_f.read(), "The forest in b was not summarized"
+
+            # The same sif file cannot be packed twice
+            with pytest.raises(RuntimeError):
+                fp.PackSifFiles([os.path.join(out_dir, "a", sif_name)] * 2, pack_file, out_dir)
+        finally:
+            shutil.rmtree(out_dir)
@@ -1,4 +1,4 @@
-import os, sys, tempfile
+import filecmp, os, sys, tempfile
 import numpy as np
 import pandas as pd
 
@@ -25,6 +25,15 @@ class TestGeneratePrizes:
         assert np.isclose(gp.CalcPrize([1.0, 0.5, 0.75, 0.001]), 3)
         assert np.isclose(gp.CalcPrize([0.003, 1.0, 0.5, 0.75, 0.01]), 2.522878)
 
+    def test_CalcPrizes(self):
+        '''
+        Test that the vectorized prize calculation matches CalcPrize
+        '''
+        scores = np.array([[1.0, 0.5, 0.75, 0.001], [0.003, 1.0, 0.5, 0.75]])
+        prizes = gp.CalcPrizes(scores)
+        assert prizes[0] == gp.CalcPrize(scores[0])
+        assert prizes[1] == gp.CalcPrize(scores[1])
+
     def test_LoadPeptideMap(self):
         '''
         Test that the peptide-protein map loads correctly
@@ -36,6 +45,54 @@ class TestGeneratePrizes:
             unique_proteins.update(proteins)           
         assert len(unique_proteins) == 1555, "Unexpected number of proteins"
 
+    def test_LoadPeptideMapArrays(self):
+        '''
+        Test that the integer-coded peptide-protein map matches the
+        dictionary version
+        '''
+        pep_prot_map = gp.LoadPeptideMap(self.map_file)
+        map_arrays = gp.LoadPeptideMapArrays(self.map_file)
+        assert len(map_arrays.peptides) == 2917, "Unexpected number of peptides"
+        assert len(map_arrays.proteins) == 1555, "Unexpected number of proteins"
+        assert map_arrays.proteins == sorted(map_arrays.proteins), "Proteins are not sorted"
+
+        array_map = dict()
+        for line, pep_code in enumerate(map_arrays.line_peptides):
+            group = map_arrays.group_proteins[map_arrays.group_ptr[line]:map_arrays.group_ptr[line+1]]
+            array_map.setdefault(map_arrays.peptides[pep_code], set()).update(map_arrays.proteins[prot] for prot in group)
+        assert array_map == dict(pep_prot_map), "Different peptide-protein mappings"
+
+    def test_VectorizedProteinPrizes(self):
+        '''
+        Test the vectorized engine on a toy map with a peptide that appears
+        in multiple rows, a peptide that maps to multiple proteins, an
+        unscored peptide, and a p-value of 1
+        '''
+        try:
+            map_file = tempfile.NamedTemporaryFile(delete=False)
+            map_file.write("peptide\tprotein(s)\n")
+            map_file.write("pepA\tP1|P2\n")
+            map_file.write("pepB\tP2\n")
+            map_file.write("pepA\tP3\n")
+            map_file.write("pepC\tP4\n")
+            map_file.write("pepD\tP5|P3\n")
+            map_file.close()
+
+            merged_df = pd.DataFrame({"prize": [2.0, 3.0, -0.0, 0.5]}, index=["pepA", "pepB", "pepD", "pepA"])
+            map_arrays = gp.LoadPeptideMapArrays(map_file.name)
+            proteins, prizes = gp.VectorizedProteinPrizes(merged_df, map_arrays)
+
+            # P4 only maps to the unscored pepC
+            assert proteins == ["P1", "P2", "P3", "P5"], "Unexpected proteins"
+            assert list(prizes) == [2.0, 3.0, 2.0, 0.0], "Unexpected prizes"
+            assert str(prizes[3]) == "0.0", "The prize of a p-value of 1 should not be -0.0"
+
+            expected = gp.IterativeProteinPrizes(merged_df, gp.LoadPeptideMap(map_file.name))
+            assert dict(zip(proteins, prizes)) == dict(expected), "Engines do not match"
+
+        finally:
+            os.remove(map_file.name)
+
     def test_LoadScores(self):
         '''
         Test that the peptide scores are loaded correctly and a few specific
@@ -77,3 +134,27 @@ class TestGeneratePrizes:
         finally:
             # Remove temporary file here because delete=False above
             os.remove(out_prize_file.name)
+
+    def test_EnginesMatch(self):
+        '''
+        Test that the vectorized and iterative engines write identical
+        prize files
+        '''
+        out_files = dict()
+        try:
+            for engine in ["iterative", "vectorized"]:
+                out_prize_file = tempfile.NamedTemporaryFile(delete=False)
+                out_prize_file.close()
+                out_files[engine] = out_prize_file.name
+
+                args = ["--firstfile", self.first_file, "--prevfile", self.prev_file, \
+                    "--mapfile", self.map_file, "--outfile", out_prize_file.name, \
+                    "--engine", engine]
+                gp.Main(args)
+
+            assert filecmp.cmp(out_files["iterative"], out_files["vectorized"], shallow=False), \
+                "The prize files differ"
+
+        finally:
+            for out_file in out_files.values():
+                os.remove(out_file)
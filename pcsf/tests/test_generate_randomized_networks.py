@@ -0,0 +1,223 @@
+import glob, os, shutil, sys, tempfile
+from collections import Counter
+import numpy as np
+import pandas as pd
+
+# Create the path to forest relative to the test_generate_randomized_networks.py path
+# Workaround due to lack of a formal Python package for the pcsf scripts
+test_dir = os.path.dirname(__file__)
+path = os.path.abspath(os.path.join(test_dir, ".."))
+if not path in sys.path:
+    sys.path.insert(1, path)
+
+import generate_randomized_networks as grn
+
+def random_network(seed, n_nodes=40, n_undirected=120, n_directed=80):
+    '''
+    Create a network with simple undirected and directed subgraphs
+    '''
+    rng = np.random.RandomState(seed)
+    rows = []
+    for orientation, n_edges in [('U', n_undirected), ('D', n_directed)]:
+        seen = set()
+        while len(seen) < n_edges:
+            u, v = rng.randint(n_nodes, size=2)
+            key = (u, v) if orientation == 'D' else tuple(sorted((u, v)))
+            if u != v and not key in seen:
+                seen.add(key)
+                rows.append(['P{}'.format(u), 'P{}'.format(v), rng.uniform(), orientation])
+    return pd.DataFrame(rows, columns=['id1', 'id2', 'weight', 'orientation'])
+
+def degrees(node_names, edges, directed):
+    '''
+    The degree of each node, or the out-degree and in-degree for directed
+    edges, where the edges are int32 node ids into node_names
+    '''
+    sources, targets = node_names[edges[:, 0]], node_names[edges[:, 1]]
+    if directed:
+        return Counter(sources), Counter(targets)
+    return Counter(list(sources) + list(targets))
+
+def edge_set(node_names, edges, directed):
+    pairs = zip(node_names[edges[:, 0]], node_names[edges[:, 1]])
+    if directed:
+        return set(pairs)
+    return set(tuple(sorted(edge)) for edge in pairs)
+
+class TestGenerateRandomizedNetworks:
+
+    def test_RewireEdges(self):
+        '''
+        Test that rewiring preserves the degrees and does not create self
+        edges or repeated edges
+        '''
+        try:
+            out_dir = tempfile.mkdtemp()
+            network_file = os.path.join(out_dir, "network.tsv")
+            random_network(2016).to_csv(network_file, sep='\t', header=True, index=False)
+            node_names, undirected_subgraph, directed_subgraph = grn.parse_network(network_file)
+            for subgraph, directed in [(undirected_subgraph, False), (directed_subgraph, True)]:
+                edges = subgraph.edges
+                rewired = grn.rewire_edges(edges, directed, np.random.RandomState(1))
+                assert rewired.dtype == np.int32
+                assert len(rewired) == len(edges), "Unexpected number of edges"
+                assert degrees(node_names, rewired, directed) == degrees(node_names, edges, directed), \
+                    "Degrees were not preserved"
+                assert not np.any(rewired[:, 0] == rewired[:, 1]), "Rewiring created self edges"
+                rewired_edges = edge_set(node_names, rewired, directed)
+                assert len(rewired_edges) == len(rewired), "Rewiring created repeated edges"
+                # Most edges should be switched
+                assert len(rewired_edges & edge_set(node_names, edges, directed)) < len(edges) / 2, \
+                    "Too few edges were switched"
+        finally:
+            shutil.rmtree(out_dir)
+
+    def test_SwitchCount(self):
+        '''
+        Test the number of switches for sparse, dense, and small graphs
+        '''
+        assert grn.analytic_switch_count(1, 2, False) == 0
+        assert grn.analytic_switch_count(3, 3, False) == 0
+        assert grn.analytic_switch_count(1000, 1000, False) > 1000 * np.log(1000) / 2
+
+    def test_PythonBackend(self):
+        '''
+        Test generating randomized network files without BiRewire
+        '''
+        try:
+            out_dir = tempfile.mkdtemp()
+            network_file = os.path.join(out_dir, "network.tsv")
+            random_network(2017).to_csv(network_file, sep='\t', header=True, index=False)
+            grn.run(["--network", network_file, "--outdir", out_dir, "--copies", "2", "--backend", "python"])
+
+            for copy in [1, 2]:
+                randomized = pd.read_csv(os.path.join(out_dir, "network-randomized{}.tsv".format(copy)), sep='\t')
+                assert list(randomized.columns) == ['id1', 'id2', 'weight', 'orientation']
+                assert (randomized.orientation == 'U').sum() == 120
+                assert (randomized.orientation == 'D').sum() == 80
+                partial_model = pd.read_csv(os.path.join(out_dir, "network-partial-model-randomized{}.sif".format(copy)), \
+                    sep='\t', header=None)
+                assert len(partial_model) == 80, "Unexpected number of partial model edges"
+        finally:
+            shutil.rmtree(out_dir)
+
+    def test_NonSimpleNetwork(self):
+        '''
+        Test that the python backend drops self edges and repeated edges
+        instead of failing
+        '''
+        try:
+            out_dir = tempfile.mkdtemp()
+            network_file = os.path.join(out_dir, "network.tsv")
+            network = random_network(2017)
+            extra = pd.DataFrame([['P1', 'P1', 0.5, 'U'], [network.id2[0], network.id1[0], 0.5, 'U']], \
+                columns=network.columns)
+            pd.concat([network, extra]).to_csv(network_file, sep='\t', header=True, index=False)
+            grn.run(["--network", network_file, "--outdir", out_dir, "--copies", "1", "--backend", "python"])
+
+            randomized = pd.read_csv(os.path.join(out_dir, "network-randomized1.tsv"), sep='\t')
+            assert (randomized.orientation == 'U').sum() == 120
+            assert not np.any(randomized.id1 == randomized.id2), "Rewiring kept a self edge"
+        finally:
+            shutil.rmtree(out_dir)
+
+    def test_ChainSampling(self):
+        '''
+        Test generating randomized network files from a single chain and
+        the overlap report
+        '''
+        try:
+            out_dir = tempfile.mkdtemp()
+            network_file = os.path.join(out_dir, "network.tsv")
+            network = random_network(2018)
+            network.to_csv(network_file, sep='\t', header=True, index=False)
+            report_file = os.path.join(out_dir, "overlap.txt")
+            grn.run(["--network", network_file, "--outdir", out_dir, "--copies", "3", "--chain", "--backend", "python", \
+                "--overlapreport", report_file])
+
+            node_names, undirected_subgraph, directed_subgraph = grn.parse_network(network_file)
+            copy_edges = []
+            for copy in [1, 2, 3]:
+                copy_names, randomized_ug, randomized_dg = \
+                    grn.parse_network(os.path.join(out_dir, "network-randomized{}.tsv".format(copy)))
+                assert degrees(copy_names, randomized_ug.edges, False) == \
+                    degrees(node_names, undirected_subgraph.edges, False)
+                assert degrees(copy_names, randomized_dg.edges, True) == \
+                    degrees(node_names, directed_subgraph.edges, True)
+                copy_edges.append(edge_set(copy_names, randomized_ug.edges, False))
+            assert copy_edges[0] != copy_edges[1] and copy_edges[1] != copy_edges[2], \
+                "Consecutive chain copies are identical"
+
+            report = pd.read_csv(report_file, sep='\t')
+            assert set(report.subgraph) == set(['undirected', 'directed'])
+            assert set(report.phase) == set(['burnin', 'thinning'])
+            # The overlap with the original network decays during burn in
+            burnin = report[(report.subgraph == 'undirected') & (report.phase == 'burnin')]
+            assert burnin.overlap.iloc[-1] < 0.5, "The overlap did not decay"
+        finally:
+            shutil.rmtree(out_dir)
+
+    def test_SwitchFailures(self, capsys):
+        '''
+        Test that failed switches are reported once per chain phase
+        '''
+        # No switch of two edges in a star can preserve the degrees
+        star = np.array([[0, leaf] for leaf in range(1, 6)], dtype=np.int32)
+        copies = list(grn.sample_chain(star, False, 3, thinning=2, rng=np.random.RandomState(1), label='star'))
+        assert all(np.array_equal(copy, star) for copy in copies), "A star was switched"
+        reports = [line for line in capsys.readouterr()[0].splitlines() if line.startswith("Only")]
+        assert len(reports) == 2, "Unexpected number of failure reports"
+        assert reports[0].endswith("during star burn in") and reports[1].endswith("during star thinning")
+
+    def test_SeededWorkers(self):
+        '''
+        Test that seeded copies do not depend on the number of workers
+        '''
+        try:
+            out_dir = tempfile.mkdtemp()
+            network_file = os.path.join(out_dir, "network.tsv")
+            random_network(2019).to_csv(network_file, sep='\t', header=True, index=False)
+            copies = {}
+            for workers in ["1", "2"]:
+                worker_dir = os.path.join(out_dir, "workers" + workers)
+                os.mkdir(worker_dir)
+                grn.run(["--network", network_file, "--outdir", worker_dir, "--copies", "3", "--backend", "python", \
+                    "--seed", "19", "--workers", workers])
+                copies[workers] = [pd.read_csv(os.path.join(worker_dir, "network-randomized{}.tsv".format(copy)), sep='\t') \
+                    for copy in [1, 2, 3]]
+
+            for serial, parallel in zip(copies["1"], copies["2"]):
+                assert serial.equals(parallel), "Copies differ across worker counts"
+            assert not copies["1"][0].equals(copies["1"][1]), "Copies share a random stream"
+        finally:
+            shutil.rmtree(out_dir)
+
+    def test_CompactNetwork(self):
+        '''
+        Test parsing a network in chunks into interned node ids and writing
+        it back
+        '''
+        try:
+            out_dir = tempfile.mkdtemp()
+            network_file = os.path.join(out_dir, "network.tsv")
+            network = random_network(2020)
+            network['weight'] = network['weight'].round(3)
+            network.to_csv(network_file, sep='\t', header=True, index=False)
+
+            node_names, undirected_subgraph, directed_subgraph = grn.parse_network(network_file, chunk_size=7)
+            assert len(node_names) == len(set(network.id1) | set(network.id2)), "Node names are not interned once"
+            for subgraph in [undirected_subgraph, directed_subgraph]:
+                assert subgraph.edges.dtype == np.int32
+                assert subgraph.weights.dtype == np.float32
+            assert len(undirected_subgraph.edges) == 120
+            assert len(directed_subgraph.edges) == 80
+
+            out_file = os.path.join(out_dir, "written.tsv")
+            grn.write_network(out_file, node_names, undirected_subgraph, directed_subgraph, chunk_size=7)
+            written = pd.read_csv(out_file, sep='\t')
+            expected = pd.concat([network[network.orientation == 'U'], network[network.orientation == 'D']]) \
+                .reset_index(drop=True)
+            assert (written[['id1', 'id2', 'orientation']] == expected[['id1', 'id2', 'orientation']]).all().all()
+            assert np.allclose(written.weight, expected.weight, atol=1e-6)
+        finally:
+            shutil.rmtree(out_dir)
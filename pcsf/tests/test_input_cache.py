@@ -0,0 +1,100 @@
+import filecmp, os, shutil, sys, tempfile
+import numpy as np
+
+# Create the path to forest relative to the test_input_cache.py path
+# Workaround due to lack of a formal Python package for the pcsf scripts
+test_dir = os.path.dirname(__file__)
+path = os.path.abspath(os.path.join(test_dir, ".."))
+if not path in sys.path:
+    sys.path.insert(1, path)
+
+import generate_prizes as gp
+import input_cache as ic
+import permute_proteins as pp
+
+class TestInputCache:
+
+    data_dir = os.path.join(test_dir, "..", "..", "data")
+    first_file = os.path.join(data_dir, "timeseries", "p-values-first.tsv")
+    prev_file = os.path.join(data_dir, "timeseries", "p-values-prev.tsv")
+    ts_file = os.path.join(data_dir, "timeseries", "median-time-series.tsv")
+    map_file = os.path.join(data_dir, "timeseries", "peptide-mapping.tsv")
+
+    def test_CachedPrizes(self):
+        '''
+        Test that prizes generated with a cold and warm cache match the prizes
+        generated without a cache
+        '''
+        try:
+            out_dir = tempfile.mkdtemp()
+            cache_dir = os.path.join(out_dir, "cache")
+            base_args = ["--firstfile", self.first_file, "--prevfile", self.prev_file, \
+                "--mapfile", self.map_file]
+
+            gp.Main(base_args + ["--outfile", os.path.join(out_dir, "uncached.txt")])
+            for engine in ["vectorized", "iterative"]:
+                for run in ["cold", "warm"]:
+                    out_file = os.path.join(out_dir, "{}-{}.txt".format(engine, run))
+                    gp.Main(base_args + ["--outfile", out_file, "--cachedir", cache_dir, \
+                        "--engine", engine])
+                    assert filecmp.cmp(out_file, os.path.join(out_dir, "uncached.txt"), shallow=False), \
+                        "Cached {} prizes do not match".format(engine)
+
+            # One entry for the map and each score file
+            assert len(os.listdir(cache_dir)) == 3, "Unexpected cache entries"
+        finally:
+            shutil.rmtree(out_dir)
+
+    def test_NumericPeptides(self):
+        '''
+        Test that peptide ids that look like numbers are loaded as strings
+        with and without the cache
+        '''
+        try:
+            out_dir = tempfile.mkdtemp()
+            score_file = os.path.join(out_dir, "scores.tsv")
+            with open(score_file, "w") as score_f:
+                score_f.write("#peptide\tp1\tp2\n007\t0.5\t0.1\n12\t0.01\t0.2\n")
+            cache_dir = os.path.join(out_dir, "cache")
+            for run in ["uncached", "cold", "warm"]:
+                score_df = gp.LoadScoreFile(score_file, None if run == "uncached" else cache_dir)
+                assert list(score_df.index) == ["007", "12"], "Peptide ids were not read as strings"
+                assert np.allclose(score_df.values, [[0.5, 0.1], [0.01, 0.2]])
+        finally:
+            shutil.rmtree(out_dir)
+
+    def test_CachedLoaders(self):
+        '''
+        Test that the permutation loader returns the same peptide map with and
+        without the cache
+        '''
+        try:
+            cache_dir = tempfile.mkdtemp()
+            for run in ["cold", "warm"]:
+                assert pp.LoadPeptideMap(self.map_file, cache_dir) == pp.LoadPeptideMap(self.map_file), \
+                    "Cached peptide map does not match"
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def test_StaleEntries(self):
+        '''
+        Test that a modified source file is parsed again and replaces its
+        stale cache entry
+        '''
+        try:
+            cache_dir = tempfile.mkdtemp()
+            source_file = os.path.join(cache_dir, "source.txt")
+            build = lambda filename: {"values": np.array([float(line) for line in open(filename)])}
+
+            with open(source_file, "w") as source_f:
+                source_f.write("1\n2\n")
+            assert list(ic.LoadCached(cache_dir, source_file, "test", build)["values"]) == [1, 2]
+            assert list(ic.LoadCached(cache_dir, source_file, "test", build)["values"]) == [1, 2]
+
+            with open(source_file, "w") as source_f:
+                source_f.write("3\n")
+            assert list(ic.LoadCached(cache_dir, source_file, "test", build)["values"]) == [3]
+            entries = [name for name in os.listdir(cache_dir) if name.startswith("test-")]
+            assert len(entries) == 1, "The stale cache entry was not removed"
+        finally:
+            shutil.rmtree(cache_dir)
@@ -0,0 +1,79 @@
+import json, os, shutil, sys, tempfile
+import pandas as pd
+
+# Create the path to forest relative to the test_instrumentation.py path
+# Workaround due to lack of a formal Python package for the pcsf scripts
+test_dir = os.path.dirname(__file__)
+path = os.path.abspath(os.path.join(test_dir, ".."))
+if not path in sys.path:
+    sys.path.insert(1, path)
+
+import generate_prizes as gp
+import generate_randomized_networks as grn
+import instrumentation as ins
+from test_generate_randomized_networks import random_network
+
+data_dir = os.path.join(test_dir, "..", "..", "data")
+
+class TestInstrumentation:
+
+    def test_ProfileRecords(self, capsys):
+        '''
+        Test the profile records of generate_prizes.py and
+        generate_randomized_networks.py, including the phases of copies
+        generated by multiple workers, and summarizing them
+        '''
+        try:
+            out_dir = tempfile.mkdtemp()
+            profile_file = os.path.join(out_dir, "profile.json")
+            prize_args = ["--firstfile", os.path.join(data_dir, "timeseries", "p-values-first.tsv"), \
+                "--prevfile", os.path.join(data_dir, "timeseries", "p-values-prev.tsv"), \
+                "--mapfile", os.path.join(data_dir, "timeseries", "peptide-mapping.tsv"), \
+                "--outfile", os.path.join(out_dir, "prizes.txt")]
+            network_file = os.path.join(out_dir, "network.tsv")
+            random_network(2024).to_csv(network_file, sep='\t', header=True, index=False)
+            network_args = ["--network", network_file, "--outdir", out_dir, "--copies", "3", \
+                "--backend", "python", "--seed", "24", "--workers", "2"]
+
+            gp.Main(prize_args + ["--profileout", profile_file])
+            grn.run(network_args + ["--profile-out", profile_file])
+            with open(profile_file) as profile_f:
+                records = [json.loads(line) for line in profile_f]
+            assert [record["script"] for record in records] == ["generate_prizes", "generate_randomized_networks"]
+
+            prize_record, network_record = records
+            assert set(prize_record["phases"].keys()) == set(["parse", "compute", "write"])
+            assert prize_record["counts"]["peptides"] > 0
+            assert prize_record["peak_rss_mb"] > 0
+            assert network_record["counts"]["edges"] == 200
+            # The write phase of each copy is returned by the workers
+            assert network_record["phases"]["write"]["calls"] == 3
+            assert network_record["throughput"]["edges"] > 0
+
+            # Write a record to standard output as it would appear in a job log
+            capsys.readouterr()
+            gp.Main(prize_args + ["--profileout", "-"])
+            log_file = os.path.join(out_dir, "job.out")
+            with open(log_file, "w") as log_f:
+                log_f.write(capsys.readouterr()[0])
+
+            ins.Main(["--logs", profile_file, log_file, "--outfile", os.path.join(out_dir, "summary")])
+            phases = pd.read_csv(os.path.join(out_dir, "summary_phases.txt"), sep="\t", index_col=[0, 1])
+            assert phases.loc[("generate_prizes", "total"), "Runs"] == 2
+            assert phases.loc[("generate_randomized_networks", "write"), "Runs"] == 1
+            counts = pd.read_csv(os.path.join(out_dir, "summary_counts.txt"), sep="\t", index_col=[0, 1])
+            assert counts.loc[("generate_randomized_networks", "edges"), "Total"] == 200
+        finally:
+            shutil.rmtree(out_dir)
+
+    def test_Disabled(self):
+        '''
+        Test that no phases are recorded without a profile output file
+        '''
+        profiler = ins.Start("test")
+        ins.BeginPhase("parse")
+        with ins.Phase("rscript"):
+            ins.Count("edges", 10)
+        assert len(profiler.phases) == 0 and len(profiler.counts) == 0
+        ins.Finish()
+        assert ins.active is None
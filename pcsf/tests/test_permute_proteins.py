@@ -1,4 +1,6 @@
-import filecmp, os, shutil, sys, tempfile
+import filecmp, glob, os, shutil, sys, tempfile
+import numpy as np
+import pytest
 
 # Create the path to forest relative to the test_permute_proteins.py path
 # Workaround due to lack of a formal Python package for the pcsf scripts
@@ -7,6 +9,7 @@ path = os.path.abspath(os.path.join(test_dir, ".."))
 if not path in sys.path:
     sys.path.insert(1, path)
 
+import generate_prizes as gp
 import permute_proteins as pp
 
 class TestPermuteProteins:
@@ -38,3 +41,78 @@ class TestPermuteProteins:
         finally:
             # Remove temporary directory
             shutil.rmtree(out_dir)
+
+    def test_EGFRPermutedPrizes(self):
+        '''
+        Test that the prizes computed in memory for each permutation match
+        the prizes generated from the reference permuted maps
+        '''
+        try:
+            # Temporary directory for permuted prize files
+            out_dir = tempfile.mkdtemp()
+
+            data_dir = os.path.join(test_dir, "..", "..", "data")
+            map_file = os.path.join(data_dir, "timeseries", "peptide-mapping.tsv")
+            first_file = os.path.join(data_dir, "timeseries", "p-values-first.tsv")
+            prev_file = os.path.join(data_dir, "timeseries", "p-values-prev.tsv")
+            prize_prefix = os.path.join(out_dir, "egfr-prizes")
+            matrix_file = os.path.join(out_dir, "egfr-prizes.npz")
+            args = ["--mapfile", map_file, "--outdir", out_dir, \
+                "--copies", "2", "--seed", "100", "--firstfile", first_file, \
+                "--prevfile", prev_file, "--prizeprefix", prize_prefix, \
+                "--prizematrix", matrix_file, "--nomapfiles"]
+            pp.Main(args)
+
+            assert not glob.glob(os.path.join(out_dir, "peptide-mapping-shuffled*")), \
+                "Shuffled map files should not be written"
+
+            prize_matrix = np.load(matrix_file)
+            assert prize_matrix["prizes"].shape == (2, len(prize_matrix["proteins"])), \
+                "Unexpected prize matrix shape"
+
+            # Generate prizes from the reference permuted maps
+            ref_dir = os.path.join(test_dir, "reference_data")
+            for i in range(1, 3):
+                ref_prize_file = os.path.join(out_dir, "reference-prizes{}.txt".format(i))
+                gp.Main(["--firstfile", first_file, "--prevfile", prev_file, \
+                    "--mapfile", os.path.join(ref_dir, "peptide-mapping-shuffled{}.tsv".format(i)), \
+                    "--outfile", ref_prize_file])
+                assert filecmp.cmp("{}-shuffled{}.txt".format(prize_prefix, i), \
+                    ref_prize_file, shallow=False), \
+                    "Permuted prizes {} do not match the reference".format(i)
+        finally:
+            # Remove temporary directory
+            shutil.rmtree(out_dir)
+
+    def test_IndependentStreams(self):
+        '''
+        Test that independent copies do not depend on the number of workers
+        and that a single copy can be regenerated alone
+        '''
+        try:
+            out_dirs = [tempfile.mkdtemp() for i in range(3)]
+
+            data_dir = os.path.join(test_dir, "..", "..", "data")
+            map_file = os.path.join(data_dir, "timeseries", "peptide-mapping.tsv")
+            base_args = ["--mapfile", map_file, "--copies", "4", "--seed", "100", \
+                "--streams", "independent"]
+            pp.Main(base_args + ["--outdir", out_dirs[0]])
+            pp.Main(base_args + ["--outdir", out_dirs[1], "--workers", "3"])
+            pp.Main(base_args + ["--outdir", out_dirs[2], "--copyindex", "3"])
+
+            for i in range(1, 5):
+                permuted_file = "peptide-mapping-shuffled{}.tsv".format(i)
+                assert filecmp.cmp(os.path.join(out_dirs[0], permuted_file), \
+                    os.path.join(out_dirs[1], permuted_file), shallow=False), \
+                    "{} depends on the number of workers".format(permuted_file)
+            assert os.listdir(out_dirs[2]) == ["peptide-mapping-shuffled3.tsv"], \
+                "Only the requested copy should be generated"
+            assert filecmp.cmp(os.path.join(out_dirs[0], "peptide-mapping-shuffled3.tsv"), \
+                os.path.join(out_dirs[2], "peptide-mapping-shuffled3.tsv"), shallow=False), \
+                "The regenerated copy does not match"
+            with pytest.raises(AssertionError):
+                pp.Main(base_args + ["--outdir", out_dirs[2], "--copyindex", "5"])
+        finally:
+            # Remove temporary directories
+            for out_dir in out_dirs:
+                shutil.rmtree(out_dir)
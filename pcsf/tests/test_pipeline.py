@@ -0,0 +1,181 @@
+import os, shutil, sys, tempfile
+import pandas as pd
+import pytest
+
+# Create the path to forest relative to the test_pipeline.py path
+# Workaround due to lack of a formal Python package for the pcsf scripts
+test_dir = os.path.dirname(__file__)
+path = os.path.abspath(os.path.join(test_dir, ".."))
+if not path in sys.path:
+    sys.path.insert(1, path)
+
+import pipeline as pl
+from test_generate_randomized_networks import random_network
+
+data_dir = os.path.abspath(os.path.join(test_dir, "..", "..", "data"))
+
+# A stand-in for forest.py that writes a forest of random edges from the
+# network to <outpath>/<outlabel>optimalForest.sif
+STAND_IN_FOREST = '''import os, random, sys
+edgefile, outpath, outlabel, seed = sys.argv[1:]
+with open(edgefile) as f:
+    edges = [line.split()[:2] for line in f if line.strip() != "" and not line.startswith("id1")]
+random.seed(int(seed))
+with open(os.path.join(outpath, outlabel + "optimalForest.sif"), "w") as f:
+    for node1, node2 in random.sample(edges, 5):
+        f.write("%s pp %s\\n" % (node1, node2))
+'''
+
+# A stand-in for TPS that copies the summary network to the output folder
+STAND_IN_TPS = '''import shutil, sys
+network, outfolder = sys.argv[1:]
+shutil.copy(network, outfolder + "/tps-network.tsv")
+'''
+
+def append_command(out_file, text):
+    '''
+    A command task that appends text to a file
+    '''
+    return [sys.executable, "-c", "open('{}', 'a').write('{}')".format(out_file, text)]
+
+class TestPipeline:
+
+    def write_stand_ins(self, out_dir):
+        '''
+        Write the stand-in scripts and return the forest and TPS command
+        templates that call them
+        '''
+        forest_script = os.path.join(out_dir, "forest_stand_in.py")
+        with open(forest_script, "w") as forest_f:
+            forest_f.write(STAND_IN_FOREST)
+        tps_script = os.path.join(out_dir, "tps_stand_in.py")
+        with open(tps_script, "w") as tps_f:
+            tps_f.write(STAND_IN_TPS)
+        forest_cmd = "{} {} {{edgefile}} {{outpath}} {{outlabel}} {{seed}}".format(sys.executable, forest_script)
+        tps_cmd = "{} {} {{network}} {{outfolder}}".format(sys.executable, tps_script)
+        return forest_cmd, tps_cmd
+
+    def randomized_args(self, out_dir):
+        '''
+        The arguments for the randomized network pipeline with stand-ins for
+        forest.py and TPS
+        '''
+        forest_cmd, tps_cmd = self.write_stand_ins(out_dir)
+        network_file = os.path.join(out_dir, "network.tsv")
+        random_network(2021).to_csv(network_file, sep="\t", header=True, index=False)
+        return ["--pipeline", "randomized", "--outpath", os.path.join(out_dir, "results"), "--copies", "2", \
+            "--forests", "3", "--seed", "21", "--edgefile", network_file, "--backend", "python", \
+            "--sources", os.path.join(data_dir, "pcsf", "egfr-sources.txt"), \
+            "--prizefile", os.path.join(data_dir, "pcsf", "egfr-prizes.txt"), \
+            "--firstfile", os.path.join(data_dir, "timeseries", "p-values-first.tsv"), \
+            "--prevfile", os.path.join(data_dir, "timeseries", "p-values-prev.tsv"), \
+            "--tsfile", os.path.join(data_dir, "timeseries", "median-time-series.tsv"), \
+            "--mapfile", os.path.join(data_dir, "timeseries", "peptide-mapping.tsv"), \
+            "--forestcmd", forest_cmd, "--tpscmd", tps_cmd]
+
+    def test_TopologicalOrder(self):
+        '''
+        Test ordering tasks and detecting invalid dependencies
+        '''
+        tasks = [pl.Task("c", [], deps=["a", "b"]), pl.Task("a", []), pl.Task("b", [], deps=["a"])]
+        assert [task.name for task in pl.TopologicalOrder(tasks)] == ["a", "b", "c"]
+
+        with pytest.raises(RuntimeError):
+            pl.TopologicalOrder([pl.Task("a", [], deps=["b"]), pl.Task("b", [], deps=["a"])])
+        with pytest.raises(RuntimeError):
+            pl.TopologicalOrder([pl.Task("a", [], deps=["missing"])])
+        with pytest.raises(RuntimeError):
+            pl.TopologicalOrder([pl.Task("a", []), pl.Task("a", [])])
+
+    def test_RunTasks(self):
+        '''
+        Test that tasks run after their dependencies with one and multiple
+        workers and that failures stop the dependent tasks
+        '''
+        try:
+            out_dir = tempfile.mkdtemp()
+            for workers in [1, 3]:
+                out_file = os.path.join(out_dir, "order{}.txt".format(workers))
+                tasks = [pl.Task("last", append_command(out_file, "z"), deps=["first1", "first2", "first3"])]
+                tasks += [pl.Task("first{}".format(i), append_command(out_file, "a")) for i in [1, 2, 3]]
+                pl.RunTasks(tasks, workers)
+                with open(out_file) as order_f:
+                    assert order_f.read() == "aaaz"
+
+                out_file = os.path.join(out_dir, "failed{}.txt".format(workers))
+                tasks = [pl.Task("fail", [sys.executable, "-c", "import sys; sys.exit(1)"]), \
+                    pl.Task("dependent", append_command(out_file, "z"), deps=["fail"])]
+                with pytest.raises(RuntimeError):
+                    pl.RunTasks(tasks, workers)
+                assert not os.path.exists(out_file), "A task ran after its dependency failed"
+        finally:
+            shutil.rmtree(out_dir)
+
+    def test_RandomizedPipeline(self):
+        '''
+        Test the randomized network pipeline with stand-ins for forest.py and
+        TPS
+        '''
+        try:
+            out_dir = tempfile.mkdtemp()
+            results_dir = os.path.join(out_dir, "results")
+
+            pl.Main(self.randomized_args(out_dir) + ["--workers", "2"])
+
+            for index in [1, 2]:
+                assert os.path.isfile(os.path.join(results_dir, "network-randomized{}.tsv".format(index)))
+                copy_dir = os.path.join(results_dir, "randomized{}".format(index))
+                summary = pd.read_csv(os.path.join(copy_dir, "prizes_beta0.55_mu0.008_omega0.1_summary_edgeAnnotation.txt"), sep="\t")
+                assert len(summary) > 0, "No edges were summarized"
+                assert os.path.isfile(os.path.join(copy_dir, "tps-network.tsv")), "TPS did not run"
+        finally:
+            shutil.rmtree(out_dir)
+
+    def test_BootstrapPipeline(self):
+        '''
+        Test the bootstrap pipeline with stand-ins for forest.py and TPS
+        '''
+        try:
+            out_dir = tempfile.mkdtemp()
+            forest_cmd, tps_cmd = self.write_stand_ins(out_dir)
+            results_dir = os.path.join(out_dir, "results")
+
+            pl.Main(["--pipeline", "bootstrap", "--outpath", results_dir, "--copies", "2", "--forests", "2", \
+                "--seed", "21", "--fraction", "0.5", "--edgefile", os.path.join(data_dir, "networks", "input-network.tsv"), \
+                "--sources", os.path.join(data_dir, "pcsf", "egfr-sources.txt"), \
+                "--partialmodel", os.path.join(data_dir, "resources", "kinase-substrate-interactions.sif"), \
+                "--firstfile", os.path.join(data_dir, "timeseries", "p-values-first.tsv"), \
+                "--prevfile", os.path.join(data_dir, "timeseries", "p-values-prev.tsv"), \
+                "--tsfile", os.path.join(data_dir, "timeseries", "median-time-series.tsv"), \
+                "--mapfile", os.path.join(data_dir, "timeseries", "peptide-mapping.tsv"), \
+                "--forestcmd", forest_cmd, "--tpscmd", tps_cmd])
+
+            for index in [1, 2]:
+                copy_dir = os.path.join(results_dir, "0.5-bootstrapped{}".format(index))
+                assert os.path.getsize(os.path.join(copy_dir, "0.5-bootstrapped{}.txt".format(index))) > 0, \
+                    "No prizes were generated"
+                assert os.path.isfile(os.path.join(copy_dir, "tps-network.tsv")), "TPS did not run"
+        finally:
+            shutil.rmtree(out_dir)
+
+    def test_StageCache(self, capsys):
+        '''
+        Test that a rerun of the randomized network pipeline restores the
+        randomized networks and summaries from the stage cache
+        '''
+        try:
+            out_dir = tempfile.mkdtemp()
+            args = self.randomized_args(out_dir) + ["--stagecache", os.path.join(out_dir, "cache")]
+            summary_file = os.path.join(out_dir, "results", "randomized1", "prizes_beta0.55_mu0.008_omega0.1_summary_union.tsv")
+
+            pl.Main(args)
+            assert "Stage cache: 0 hits, 3 misses" in capsys.readouterr()[0]
+            with open(summary_file) as summary_f:
+                summary = summary_f.read()
+
+            pl.Main(args)
+            assert "Stage cache: 3 hits, 0 misses" in capsys.readouterr()[0]
+            with open(summary_file) as summary_f:
+                assert summary_f.read() == summary, "The restored summary differs"
+        finally:
+            shutil.rmtree(out_dir)
@@ -0,0 +1,77 @@
+import os, shutil, stat, sys, tempfile
+
+# Create the path to forest relative to the test_stage_cache.py path
+# Workaround due to lack of a formal Python package for the pcsf scripts
+test_dir = os.path.dirname(__file__)
+path = os.path.abspath(os.path.join(test_dir, ".."))
+if not path in sys.path:
+    sys.path.insert(1, path)
+
+import stage_cache as sc
+
+def write_file(filename, text):
+    with open(filename, "w") as out_f:
+        out_f.write(text)
+
+def read_file(filename):
+    with open(filename) as in_f:
+        return in_f.read()
+
+class TestStageCache:
+
+    def test_StoreRestore(self):
+        '''
+        Test that outputs are restored only for the same stage, arguments,
+        and input contents
+        '''
+        try:
+            out_dir = tempfile.mkdtemp()
+            cache = sc.StageCache(os.path.join(out_dir, "cache"))
+            in_file = os.path.join(out_dir, "input.txt")
+            out_file = os.path.join(out_dir, "output.txt")
+            write_file(in_file, "input")
+            key = cache.Key("generate_prizes", "Main", ["--outfile", out_file], [in_file])
+            assert not cache.Restore(key), "Restored a missing entry"
+
+            write_file(out_file, "output")
+            cache.Store(key, [out_file])
+            # The stored and restored outputs can still be overwritten
+            assert os.stat(out_file).st_mode & stat.S_IWUSR, "Storing made the output read-only"
+            os.remove(out_file)
+            assert cache.Restore(key)
+            assert read_file(out_file) == "output"
+            write_file(out_file, "overwritten")
+            assert cache.Restore(key)
+            assert read_file(out_file) == "output", "Overwriting the output modified the cache entry"
+
+            assert cache.Key("generate_prizes", "Main", ["--outfile", out_file], [in_file]) == key
+            assert cache.Key("generate_prizes", "Main", ["--outfile", in_file], [in_file]) != key
+            assert cache.Key("permute_proteins", "Main", ["--outfile", out_file], [in_file]) != key
+            write_file(in_file, "changed input")
+            assert cache.Key("generate_prizes", "Main", ["--outfile", out_file], [in_file]) != key
+        finally:
+            shutil.rmtree(out_dir)
+
+    def test_Eviction(self):
+        '''
+        Test that the least recently used entries are evicted
+        '''
+        try:
+            out_dir = tempfile.mkdtemp()
+            cache = sc.StageCache(os.path.join(out_dir, "cache"), max_bytes=350)
+            keys = []
+            for index in range(3):
+                out_file = os.path.join(out_dir, "output{}.txt".format(index))
+                write_file(out_file, "x"*100)
+                keys.append("entry{}".format(index))
+                cache.Store(keys[-1], [out_file])
+                # Set the last use time instead of waiting
+                os.utime(os.path.join(cache.EntryDir(keys[-1]), sc.MANIFEST_FILE), (index, index))
+                if index == 1:
+                    # Use the first entry so that the second is the least recently used
+                    assert cache.Restore(keys[0])
+
+            remaining = set(key for last_used, size, key in cache.Entries())
+            assert remaining == set([keys[0], keys[2]])
+        finally:
+            shutil.rmtree(out_dir)
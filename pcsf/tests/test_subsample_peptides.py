@@ -1,4 +1,5 @@
-import filecmp, os, pytest, shutil, sys, tempfile
+import filecmp, glob, os, pytest, shutil, sys, tempfile
+import numpy as np
 
 # Create the path to forest relative to the test_subsample_peptides.py path
 # Workaround due to lack of a formal Python package for the pcsf scripts
@@ -7,6 +8,7 @@ path = os.path.abspath(os.path.join(test_dir, ".."))
 if not path in sys.path:
     sys.path.insert(1, path)
 
+import generate_prizes as gp
 import subsample_peptides as sp
 
 class TestSubsamplePeptides:
@@ -54,6 +56,65 @@ class TestSubsamplePeptides:
             # Remove temporary directory
             shutil.rmtree(out_dir)
 
+    def test_IndependentStreams(self):
+        '''
+        Test that independent copies do not depend on the number of workers
+        and that a single copy can be regenerated alone
+        '''
+        try:
+            out_dirs = [tempfile.mkdtemp() for i in range(3)]
+
+            data_dir = os.path.join(test_dir, "..", "..", "data")
+            first_file = os.path.join(data_dir, "timeseries", "p-values-first.tsv")
+            prev_file = os.path.join(data_dir, "timeseries", "p-values-prev.tsv")
+            ts_file = os.path.join(data_dir, "timeseries", "median-time-series.tsv")
+            base_args = ["--firstfile", first_file, "--prevfile", prev_file, \
+                "--tsfile", ts_file, "--fraction", "0.5", "--copies", "4", \
+                "--seed", "100", "--streams", "independent"]
+            sp.Main(base_args + ["--outdir", out_dirs[0]])
+            sp.Main(base_args + ["--outdir", out_dirs[1], "--workers", "3"])
+            sp.Main(base_args + ["--outdir", out_dirs[2], "--copyindex", "2"])
+
+            prefixes = ["p-values-first", "p-values-prev", "median-time-series"]
+            for prefix in prefixes:
+                for i in range(1, 5):
+                    subsampled_file = "{}-0.5-subsampled{}.tsv".format(prefix, i)
+                    assert filecmp.cmp(os.path.join(out_dirs[0], subsampled_file), \
+                        os.path.join(out_dirs[1], subsampled_file), shallow=False), \
+                        "{} depends on the number of workers".format(subsampled_file)
+                subsampled_file = "{}-0.5-subsampled2.tsv".format(prefix)
+                assert filecmp.cmp(os.path.join(out_dirs[0], subsampled_file), \
+                    os.path.join(out_dirs[2], subsampled_file), shallow=False), \
+                    "The regenerated copy of {} does not match".format(prefix)
+            assert len(os.listdir(out_dirs[2])) == 3, "Only the requested copy should be generated"
+        finally:
+            # Remove temporary directories
+            for out_dir in out_dirs:
+                shutil.rmtree(out_dir)
+
+    def test_IndexPeptideFile(self):
+        '''
+        Test that the memory-mapped line index matches the lines and peptides
+        of the file, including a line without a tab and a last line without a
+        newline
+        '''
+        try:
+            pep_file = tempfile.NamedTemporaryFile(delete=False)
+            pep_file.write("peptide\tt1\tt2\npepA\t0.1\t0.2\npepB\npepC\t0.5\t0.6")
+            pep_file.close()
+
+            file_index = sp.IndexPeptideFile(pep_file.name)
+            lines = [file_index.data[file_index.offsets[i]:file_index.offsets[i+1]] \
+                for i in range(len(file_index.offsets) - 1)]
+            assert lines == ["peptide\tt1\tt2\n", "pepA\t0.1\t0.2\n", "pepB\n", "pepC\t0.5\t0.6"], \
+                "Unexpected line offsets"
+            id_ends = file_index.id_ends
+            peptides = [file_index.data[file_index.offsets[i+1]:id_ends[i]] for i in range(len(id_ends))]
+            assert peptides == ["pepA", "pepB\n", "pepC"], "Unexpected peptide ids"
+            file_index.data.close()
+        finally:
+            os.remove(pep_file.name)
+
     def test_InvalidArguments(self):
         '''
         Test that invalid arguments generate the expected Exceptions.
@@ -96,3 +157,56 @@ class TestSubsamplePeptides:
             args.extend(["--copies", "0"])
             sp.Main(args)
         assert "The number of copies must be positive" in str(excinfo)
+
+    def test_EGFRBootstrapPrizes(self):
+        '''
+        Test that the bootstrap prizes computed in memory match the prizes
+        generated from the reference subsampled score files and that the
+        subsampled files are only written when requested.
+        '''
+        try:
+            # Temporary directory for the bootstrap outputs
+            out_dir = tempfile.mkdtemp()
+
+            data_dir = os.path.join(test_dir, "..", "..", "data")
+            first_file = os.path.join(data_dir, "timeseries", "p-values-first.tsv")
+            prev_file = os.path.join(data_dir, "timeseries", "p-values-prev.tsv")
+            ts_file = os.path.join(data_dir, "timeseries", "median-time-series.tsv")
+            map_file = os.path.join(data_dir, "timeseries", "peptide-mapping.tsv")
+            prize_prefix = os.path.join(out_dir, "egfr-prizes")
+            bootstrap_file = os.path.join(out_dir, "egfr-bootstrap.npz")
+            args = ["--firstfile", first_file, "--prevfile", prev_file, \
+                "--tsfile", ts_file, "--outdir", out_dir, "--fraction", "0.5", \
+                "--copies", "2", "--seed", "100", "--mapfile", map_file, \
+                "--prizeprefix", prize_prefix, "--bootstrapfile", bootstrap_file]
+            sp.Main(args)
+
+            assert not glob.glob(os.path.join(out_dir, "*subsampled*")), \
+                "Subsampled files should not be written"
+
+            bootstrap = np.load(bootstrap_file)
+            assert bootstrap["rows"].shape == (2, 534), "Unexpected subsampled rows"
+            assert bootstrap["prizes"].shape == (2, len(bootstrap["proteins"])), \
+                "Unexpected prize matrix shape"
+
+            # Generate prizes from the reference subsampled files
+            ref_dir = os.path.join(test_dir, "reference_data")
+            for i in range(1, 3):
+                ref_prize_file = os.path.join(out_dir, "reference-prizes{}.txt".format(i))
+                gp.Main(["--firstfile", os.path.join(ref_dir, "p-values-first-0.5-subsampled{}.tsv".format(i)), \
+                    "--prevfile", os.path.join(ref_dir, "p-values-prev-0.5-subsampled{}.tsv".format(i)), \
+                    "--mapfile", map_file, "--outfile", ref_prize_file])
+                assert filecmp.cmp("{}-0.5-bootstrapped{}.txt".format(prize_prefix, i), \
+                    ref_prize_file, shallow=False), \
+                    "Bootstrap prizes {} do not match the reference".format(i)
+
+            # The subsampled files can still be written in the bootstrap mode
+            sp.Main(args + ["--writetsv"])
+            for i in range(1, 3):
+                subsampled_file = "p-values-first-0.5-subsampled{}.tsv".format(i)
+                assert filecmp.cmp(os.path.join(out_dir, subsampled_file), \
+                    os.path.join(ref_dir, subsampled_file)), \
+                    "{} does not match the reference".format(subsampled_file)
+        finally:
+            # Remove temporary directory
+            shutil.rmtree(out_dir)
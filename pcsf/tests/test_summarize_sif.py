@@ -1,4 +1,5 @@
-import glob, os, string, sys, tempfile
+import filecmp, glob, json, os, pytest, shutil, string, sys, tempfile
+import numpy as np
 
 # Create the path to forest relative to the test_summarize_sif.py path
 # Workaround due to lack of a formal Python package for the pcsf scripts
@@ -43,6 +44,27 @@ class TestSummarizeSif:
         assert graph.has_edge('B','D')
         assert graph.has_edge('C','D')
 
+    def test_ForestSummary(self):
+        '''
+        Test that the streaming forest counts match the counts of the
+        loaded graphs
+        '''
+        toy_graph_files = sorted(glob.glob(os.path.join(self.data_dir, "toy_graph_*.sif")))
+        summary = ss.ForestSummary(prizes=set(["A", "E"]), hubnode="B")
+        for toy_graph_file in toy_graph_files:
+            summary.AddSifFile(toy_graph_file)
+
+        graphs = [ss.LoadSifNetwork(toy_graph_file) for toy_graph_file in toy_graph_files]
+        node_freqs = ss.SetFrequency([set(graph.nodes()) for graph in graphs])
+        edge_freqs = ss.SetFrequency([set(map(ss.SortEdge, graph.edges())) for graph in graphs])
+
+        assert summary.ForestCount() == 4, "Unexpected number of forests"
+        assert dict(summary.NodeFrequencies()) == node_freqs, "Unexpected node frequencies"
+        assert dict(summary.EdgeFrequencies()) == edge_freqs, "Unexpected edge frequencies"
+        assert summary.sizes == [4, 4, 3, 5], "Unexpected forest sizes"
+        assert summary.steinerCounts == [3, 3, 2, 3], "Unexpected Steiner node counts"
+        assert summary.hubDegrees == [3, 2, 2, 4], "Unexpected hub node degrees"
+
     def test_SummarizeSif(self):
         '''
         Test summarizing four toy graphs
@@ -86,3 +108,268 @@ class TestSummarizeSif:
             # Remove temporary files here because delete=False above
             for out_file in glob.glob(out_file_base.name + "*"):
                 os.remove(out_file)
+
+    def test_SizeFile(self):
+        '''
+        Test that the size file has the same bytes as earlier summaries,
+        including the hub degree ratio of an empty forest
+        '''
+        try:
+            out_dir = tempfile.mkdtemp()
+            open(os.path.join(out_dir, "empty.sif"), "w").close()
+            shutil.copy(os.path.join(self.data_dir, "toy_graph_0.sif"), out_dir)
+            ss.Main(["--indir", out_dir, "--siflist", "empty.sif|toy_graph_0.sif", "--hubnode", "B", \
+                "--outfile", os.path.join(out_dir, "summary")])
+            with open(os.path.join(out_dir, "summary_size.txt"), "rb") as size_f:
+                assert size_f.read() == "Forest name\tForest size\tB degree\tB degree / forest size\r\n" \
+                    "empty.sif\t0\t0\t0\r\ntoy_graph_0.sif\t4\t3\t0.750000\r\n", "Unexpected size file"
+        finally:
+            shutil.rmtree(out_dir)
+
+    def test_ParallelSummarizeSif(self):
+        '''
+        Test that summarizing the toy graphs with multiple workers writes
+        the same files as a single worker
+        '''
+        try:
+            out_dir = tempfile.mkdtemp()
+            for workers in [1, 2]:
+                args = ["--indir", self.data_dir, "--pattern", "toy_graph_*.sif", \
+                    "--outfile", os.path.join(out_dir, "workers{}".format(workers)), \
+                    "--hubnode", "B", "--workers", str(workers)]
+                ss.Main(args)
+
+            for suffix in ["_size.txt", "_union.tsv", "_union.sif", "_nodeAnnotation.txt", "_edgeAnnotation.txt"]:
+                assert filecmp.cmp(os.path.join(out_dir, "workers1" + suffix), \
+                    os.path.join(out_dir, "workers2" + suffix), shallow=False), \
+                    "Parallel {} file does not match".format(suffix)
+        finally:
+            shutil.rmtree(out_dir)
+
+    def test_IncrementalSummarizeSif(self):
+        '''
+        Test summarizing two toy graphs and then adding the other two
+        graphs from the saved state
+        '''
+        try:
+            out_dir = tempfile.mkdtemp()
+            out_file_base = os.path.join(out_dir, "toy")
+            state_file = os.path.join(out_dir, "toy_state.json")
+
+            for sif_list in ["toy_graph_0.sif|toy_graph_1.sif", "toy_graph_0.sif|toy_graph_1.sif|toy_graph_2.sif|toy_graph_3.sif"]:
+                args = ["--indir", self.data_dir, "--siflist", sif_list, \
+                    "--outfile", out_file_base, "--statefile", state_file, "--settle", "0"]
+                ss.Main(args)
+
+            state = ss.LoadSummaryState(state_file)
+            assert state.names == ["toy_graph_0.sif", "toy_graph_1.sif", "toy_graph_2.sif", "toy_graph_3.sif"], \
+                "Unexpected forests in the saved state"
+
+            for suffix in ["_size.txt", "_union.tsv", "_union.sif", "_nodeAnnotation.txt", "_edgeAnnotation.txt"]:
+                assert files_match(out_file_base + suffix, os.path.join(self.data_dir, "toy" + suffix)), \
+                    "Output {} file does not match the reference".format(suffix)
+
+            # An empty run does not write a state
+            empty_state_file = os.path.join(out_dir, "empty_state.json")
+            with pytest.raises(RuntimeError):
+                ss.Main(["--indir", self.data_dir, "--pattern", "missing*.sif", "--outfile", out_file_base, \
+                    "--statefile", empty_state_file])
+            assert not os.path.exists(empty_state_file), "The state of an empty run was written"
+
+            # The saved state cannot be used with a different hub node
+            with pytest.raises(RuntimeError):
+                ss.LoadSummaryState(state_file, hubnode="B")
+
+            # States from older versions without the convergence or
+            # incidence fields are rejected with a version error
+            with open(state_file) as state_f:
+                state = json.load(state_f)
+            for version, keys in [(2, ["keepIncidence", "nodeIndptr", "nodeIndices", "edgeIndptr", "edgeIndices"]), \
+                (1, ["trackChanges", "nodeChanges", "edgeChanges"])]:
+                for key in keys:
+                    del state[key]
+                state["version"] = version
+                with open(state_file, "w") as state_f:
+                    json.dump(state, state_f)
+                with pytest.raises(RuntimeError):
+                    ss.LoadSummaryState(state_file)
+        finally:
+            shutil.rmtree(out_dir)
+
+    def test_UnsettledForests(self):
+        '''
+        Test that recently modified forests are left for a later refresh of
+        the saved summary and that forests are named by their path relative
+        to indir
+        '''
+        try:
+            in_dir = tempfile.mkdtemp()
+            out_file_base = os.path.join(in_dir, "toy")
+            state_file = os.path.join(in_dir, "toy_state.json")
+            old_time = os.path.getmtime(os.path.join(self.data_dir, "toy_graph_0.sif")) - 3600
+            for index, sub_dir in enumerate(["a", "a", "b", "b"]):
+                if not os.path.isdir(os.path.join(in_dir, sub_dir)):
+                    os.mkdir(os.path.join(in_dir, sub_dir))
+                sif_file = os.path.join(in_dir, sub_dir, "toy_graph_{}.sif".format(index % 2))
+                shutil.copy(os.path.join(self.data_dir, "toy_graph_{}.sif".format(index)), sif_file)
+            os.utime(os.path.join(in_dir, "a", "toy_graph_0.sif"), (old_time, old_time))
+            os.utime(os.path.join(in_dir, "a", "toy_graph_1.sif"), (old_time, old_time))
+            os.utime(os.path.join(in_dir, "b", "toy_graph_0.sif"), (old_time, old_time))
+            args = ["--indir", in_dir, "--pattern", "*/*.sif", "--outfile", out_file_base, "--statefile", state_file]
+
+            # b/toy_graph_1.sif was just written
+            ss.Main(args)
+            assert sorted(ss.LoadSummaryState(state_file).names) == ["a/toy_graph_0.sif", "a/toy_graph_1.sif", \
+                "b/toy_graph_0.sif"]
+
+            os.utime(os.path.join(in_dir, "b", "toy_graph_1.sif"), (old_time, old_time))
+            ss.Main(args)
+            assert ss.LoadSummaryState(state_file).ForestCount() == 4
+            for suffix in ["_union.tsv", "_nodeAnnotation.txt", "_edgeAnnotation.txt"]:
+                assert files_match(out_file_base + suffix, os.path.join(self.data_dir, "toy" + suffix)), \
+                    "Output {} file does not match the reference".format(suffix)
+        finally:
+            shutil.rmtree(in_dir)
+
+    def test_FrequencyChanges(self):
+        '''
+        Test the largest node and edge frequency changes as the toy graphs
+        are added, with and without a saved state
+        '''
+        try:
+            out_dir = tempfile.mkdtemp()
+            out_file_base = os.path.join(out_dir, "toy")
+            state_file = os.path.join(out_dir, "toy_state.json")
+            convergence_file = os.path.join(out_dir, "toy_convergence.txt")
+
+            for sif_list in ["toy_graph_0.sif|toy_graph_1.sif", "toy_graph_3.sif|toy_graph_2.sif|toy_graph_1.sif|toy_graph_0.sif"]:
+                args = ["--indir", self.data_dir, "--siflist", sif_list, "--outfile", out_file_base, \
+                    "--statefile", state_file, "--convergence", convergence_file, "--tolerance", "0.2", "--window", "1"]
+                ss.Main(args)
+            summary = ss.LoadSummaryState(state_file)
+
+            # Compare to the changes in the frequencies of the loaded graphs
+            graphs = [ss.LoadSifNetwork(os.path.join(self.data_dir, name)) for name in summary.names]
+            node_sets = [set(graph.nodes()) for graph in graphs]
+            edge_sets = [set(map(ss.SortEdge, graph.edges())) for graph in graphs]
+            for count in range(2, len(graphs) + 1):
+                for sets, changes in [(node_sets, summary.nodeChanges), (edge_sets, summary.edgeChanges)]:
+                    new_freqs = ss.SetFrequency(sets[:count])
+                    old_freqs = ss.SetFrequency(sets[:count-1])
+                    expected = max(abs(freq - old_freqs.get(key, 0)) for key, freq in new_freqs.iteritems())
+                    assert abs(changes[count-1] - expected) < 1e-12, "Unexpected frequency change"
+
+            # B-E is new in the last forest
+            assert summary.edgeChanges[-1] == 0.25, "Unexpected last edge frequency change"
+            assert ss.ConvergedForestCount(summary, 0.3, 1) == 4, "Unexpected convergence"
+            assert ss.ConvergedForestCount(summary, 0.3, 2) is None, "Unexpected convergence"
+            with open(convergence_file) as convergence_f:
+                assert len(convergence_f.readlines()) == 5, "Unexpected convergence file length"
+        finally:
+            shutil.rmtree(out_dir)
+
+    def test_Incidence(self):
+        '''
+        Test the forest by node and forest by edge incidence matrices of the
+        toy graphs with one and two workers
+        '''
+        try:
+            out_dir = tempfile.mkdtemp()
+            for workers in [1, 2]:
+                out_file_base = os.path.join(out_dir, "workers{}".format(workers))
+                args = ["--indir", self.data_dir, "--siflist", \
+                    "toy_graph_0.sif|toy_graph_1.sif|toy_graph_2.sif|toy_graph_3.sif", \
+                    "--outfile", out_file_base, "--incidence", "--workers", str(workers)]
+                ss.Main(args)
+
+                forests, nodes, edges, node_matrix, edge_matrix = ss.LoadIncidence(out_file_base)
+                assert forests == ["toy_graph_0.sif", "toy_graph_1.sif", "toy_graph_2.sif", "toy_graph_3.sif"]
+                assert node_matrix.shape == (4, 5), "Unexpected node matrix shape"
+                assert edge_matrix.shape == (4, 5), "Unexpected edge matrix shape"
+
+                # The column means are the frequencies
+                graphs = [ss.LoadSifNetwork(os.path.join(self.data_dir, forest)) for forest in forests]
+                node_freqs = ss.SetFrequency([set(graph.nodes()) for graph in graphs])
+                edge_freqs = ss.SetFrequency([set(map(ss.SortEdge, graph.edges())) for graph in graphs])
+                assert dict(zip(nodes, node_matrix.getnnz(axis=0) / 4.0)) == node_freqs
+                assert dict(zip(edges, edge_matrix.getnnz(axis=0) / 4.0)) == edge_freqs
+
+                # The edge B-E is only in the last forest
+                assert list(edge_matrix[:, edges.index(("B", "E"))].toarray().ravel()) == [0, 0, 0, 1]
+        finally:
+            shutil.rmtree(out_dir)
+
+    def test_Similarity(self):
+        '''
+        Test the pairwise Jaccard similarity of the toy graphs
+        '''
+        try:
+            out_dir = tempfile.mkdtemp()
+            out_file_base = os.path.join(out_dir, "toy")
+            args = ["--indir", self.data_dir, "--siflist", \
+                "toy_graph_0.sif|toy_graph_1.sif|toy_graph_2.sif|toy_graph_3.sif", \
+                "--outfile", out_file_base, "--similarity"]
+            ss.Main(args)
+
+            similarity = np.load(out_file_base + "_similarity.npz")
+            graphs = [ss.LoadSifNetwork(os.path.join(self.data_dir, forest)) for forest in similarity["forests"]]
+            for key, sets in [("nodeJaccard", [set(graph.nodes()) for graph in graphs]), \
+                    ("edgeJaccard", [set(map(ss.SortEdge, graph.edges())) for graph in graphs])]:
+                expected = [[len(set1 & set2) / float(len(set1 | set2)) for set2 in sets] for set1 in sets]
+                assert np.allclose(similarity[key], expected), "Unexpected {} matrix".format(key)
+            similarity.close()
+
+            with open(out_file_base + "_diversity.txt") as diversity_f:
+                diversity = dict((line.split("\t")[0], line.strip().split("\t")[1:]) for line in diversity_f)
+            # Forests 0 and 1 have the same nodes and no forests have the same edges
+            assert diversity["Fraction of identical pairs"] == ["0.166667", "0.000000"], \
+                "Unexpected fraction of identical forests"
+        finally:
+            shutil.rmtree(out_dir)
+
+    def test_Metrics(self):
+        '''
+        Test the topology metrics of the toy graphs and forests with multiple
+        components
+        '''
+        try:
+            out_dir = tempfile.mkdtemp()
+            # A forest with two trees and a forest with a cycle and a tree
+            with open(os.path.join(out_dir, "forest_1.sif"), "w") as sif_f:
+                sif_f.write("A pp B\nB pp C\nD pp E\n")
+            with open(os.path.join(out_dir, "forest_2.sif"), "w") as sif_f:
+                sif_f.write("A pp B\nB pp C\nA pp C\nF pp G\nF pp H\n")
+            for sif_file in glob.glob(os.path.join(self.data_dir, "toy_graph_*.sif")):
+                shutil.copy(sif_file, out_dir)
+
+            out_file_base = os.path.join(out_dir, "summary")
+            args = ["--indir", out_dir, "--pattern", "*.sif", "--outfile", out_file_base, \
+                "--metrics", "--hubnodes", "B|F|Z"]
+            ss.Main(args)
+
+            with open(out_file_base + "_metrics.txt") as metrics_f:
+                header = metrics_f.readline().strip().split("\t")
+                metrics = dict((line.split("\t")[0], map(int, line.strip().split("\t")[1:])) for line in metrics_f)
+            assert header == ["Forest name", "Nodes", "Edges", "Components", "Trees", "Largest component", \
+                "B degree", "F degree", "Z degree"], "Unexpected metrics header"
+            assert metrics["forest_1.sif"] == [5, 3, 2, 2, 3, 2, 0, 0]
+            assert metrics["forest_2.sif"] == [6, 5, 2, 1, 3, 2, 2, 0]
+            assert metrics["toy_graph_0.sif"] == [4, 4, 1, 0, 4, 3, 0, 0]
+            assert metrics["toy_graph_2.sif"] == [3, 2, 1, 1, 3, 2, 0, 0]
+            assert metrics["toy_graph_3.sif"] == [5, 5, 1, 0, 5, 4, 0, 0]
+        finally:
+            shutil.rmtree(out_dir)
+
+    def test_PruneUnion(self):
+        '''
+        Test pruning the union network by frequency, rank, and source
+        '''
+        edge_freqs = [(("A", "B"), 1.0), (("B", "C"), 0.5), (("C", "D"), 0.75), \
+            (("E", "F"), 0.75), (("F", "G"), 0.25)]
+
+        assert ss.PruneUnion(edge_freqs, minFreq=0.5) == edge_freqs[:4], "Unexpected minimum frequency pruning"
+        # Ties are ranked in the order they were first seen
+        assert ss.PruneUnion(edge_freqs, topK=2) == [edge_freqs[0], edge_freqs[2]], "Unexpected top edges"
+        assert ss.PruneUnion(edge_freqs, sources=["A", "Z"]) == edge_freqs[:3], "Unexpected source pruning"
+        assert ss.PruneUnion(edge_freqs, minFreq=0.5, topK=3, sources=["F"]) == [edge_freqs[3]], \
+            "Unexpected combined pruning"